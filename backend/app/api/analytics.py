@@ -1,12 +1,14 @@
 """
 Analytics API endpoints for embeddings, clustering, similarity, and statistics.
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, BackgroundTasks, HTTPException
 from pydantic import BaseModel
 from typing import Optional, List
 from pathlib import Path
 
 from backend.app.services.analytics_service import AnalyticsService
+from backend.app.services import acoustic_service
+from backend.app.services.event_service import publish
 
 router = APIRouter(tags=["analytics"])
 # Use default DB path for now; refactor to use config later if needed
@@ -24,10 +26,18 @@ class ComputeEmbeddingsRequest(BaseModel):
     force_recompute: bool = False
 
 
+class ComputeAcousticRequest(BaseModel):
+    track_ids: Optional[List[int]] = None
+    force_recompute: bool = False
+    workers: Optional[int] = None
+    resume: bool = True
+
+
 class ComputeClustersRequest(BaseModel):
     algorithm: str = "kmeans"  # 'kmeans' or 'dbscan'
     n_clusters: int = 5
     force_recompute: bool = False
+    model_version: str = "v1"
 
 
 # ========================
@@ -40,14 +50,55 @@ def compute_embeddings(req: ComputeEmbeddingsRequest):
     Compute embeddings for tracks.
     If track_ids is None, computes for all tracks without embeddings.
     """
+    def progress(done: int, total: int):
+        publish({
+            "type": "import_progress", "progress": done / max(1, total), "track_id": None,
+            "message": f"Embeddings: {done}/{total}",
+        })
+
     result = analytics_service.compute_embeddings(
         track_ids=req.track_ids,
         model_version=req.model_version,
-        force_recompute=req.force_recompute
+        force_recompute=req.force_recompute,
+        on_progress=progress
     )
     return result
 
 
+@router.post("/acoustic/compute")
+def compute_acoustic_features(req: ComputeAcousticRequest, background_tasks: BackgroundTasks):
+    """
+    Extract acoustic features in a background process pool.
+    With resume (default), a whole-library request continues an interrupted library run
+    instead of starting a new one; if another process is executing it, it keeps running there.
+    """
+    run_id = acoustic_service.resumable_run(DEFAULT_DB_PATH) if req.resume and req.track_ids is None and not req.force_recompute else None
+    if run_id is None:
+        run_id = acoustic_service.create_run(DEFAULT_DB_PATH, req.track_ids, req.force_recompute, req.workers)
+    background_tasks.add_task(analytics_service.compute_acoustic_features, workers=req.workers, run_id=run_id)
+    return {"status": acoustic_service.get_run(DEFAULT_DB_PATH, run_id)["status"], "run_id": run_id}
+
+
+@router.get("/acoustic/runs/{run_id}")
+def get_acoustic_run(run_id: int):
+    run = acoustic_service.get_run(DEFAULT_DB_PATH, run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return run
+
+
+@router.post("/acoustic/runs/{run_id}/cancel")
+def cancel_acoustic_run(run_id: int):
+    if not acoustic_service.cancel_run(DEFAULT_DB_PATH, run_id):
+        raise HTTPException(status_code=404, detail="Run not found or already finished")
+    return {"status": "cancelled", "run_id": run_id}
+
+
+@router.get("/acoustic/errors")
+def list_acoustic_errors(run_id: Optional[int] = None, limit: int = 100):
+    return {"errors": acoustic_service.list_errors(DEFAULT_DB_PATH, run_id, limit)}
+
+
 @router.get("/embeddings")
 def get_embeddings(track_ids: Optional[str] = None):
     """
@@ -64,7 +115,7 @@ def get_embeddings(track_ids: Optional[str] = None):
 
 
 @router.get("/embeddings/reduce")
-def reduce_embeddings(n_components: int = 2):
+def reduce_embeddings(n_components: int = 2, model_version: str = "v1"):
     """
     Reduce embeddings to 2D or 3D for visualization.
     n_components: 2 or 3.
@@ -72,7 +123,7 @@ def reduce_embeddings(n_components: int = 2):
     if n_components not in [2, 3]:
         raise HTTPException(status_code=400, detail="n_components must be 2 or 3")
     
-    reduced = analytics_service.reduce_dimensions(n_components=n_components)
+    reduced = analytics_service.reduce_dimensions(n_components=n_components, model_version=model_version)
     return {"reduced_embeddings": reduced}
 
 
@@ -89,7 +140,8 @@ def compute_clusters(req: ComputeClustersRequest):
     result = analytics_service.cluster_tracks(
         algorithm=req.algorithm,
         n_clusters=req.n_clusters,
-        force_recompute=req.force_recompute
+        force_recompute=req.force_recompute,
+        model_version=req.model_version
     )
     if "error" in result:
         raise HTTPException(status_code=400, detail=result["error"])
@@ -111,16 +163,36 @@ def get_clusters(algorithm: Optional[str] = None):
 # ========================
 
 @router.get("/similarity/{track_id}")
-def get_similarity(track_id: int, top_n: int = 10):
+def get_similarity(
+    track_id: int,
+    top_n: int = 10,
+    bpm_min: Optional[float] = None,
+    bpm_max: Optional[float] = None,
+    key: Optional[str] = None,
+    genre: Optional[str] = None,
+    exact: bool = False
+):
     """
     Get top N most similar tracks to the given track.
+    Optional filters: bpm_min/bpm_max, key, genre. exact=true skips the ANN index.
     """
-    similar = analytics_service.compute_similarity(track_id=track_id, top_n=top_n)
+    similar = analytics_service.compute_similarity(
+        track_id=track_id, top_n=top_n, bpm_min=bpm_min, bpm_max=bpm_max, key=key, genre=genre, exact=exact
+    )
     if not similar:
         raise HTTPException(status_code=404, detail="Track not found or no embeddings available")
     return {"track_id": track_id, "similar_tracks": similar}
 
 
+@router.post("/similarity/index")
+def build_similarity_index(background_tasks: BackgroundTasks, model_version: str = "v1"):
+    """
+    (Re)build the ANN similarity index for a model version in the background.
+    """
+    background_tasks.add_task(analytics_service.build_similarity_index, model_version)
+    return {"status": "queued", "model_version": model_version}
+
+
 # ========================
 # STATISTICS
 # ========================
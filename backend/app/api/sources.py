@@ -6,16 +6,19 @@ from typing import Optional, List
 from pathlib import Path
 from ..utils.db_utils import get_db, init_db
 from ..services.spotify_service import fetch_spotify_playlist_tracks
-from ..services.itunes_service import import_itunes_library
+from ..services.itunes_service import run_itunes_import_job
 from ..services.bandcamp_service import parse_bandcamp_links
-from ..services.download_service import enqueue_downloads
+from ..services.download_service import enqueue_downloads, list_downloads, start_download_pool
 from ..services.musicbrainz_service import search_musicbrainz_release
 from ..services.discogs_service import search_discogs_release
 from ..services.soundcloud_service import resolve_soundcloud_tracks
 from ..services.local_scan_service import scan_local_folder
-from ..services.metadata_quality_service import aggregate_metadata, persist_candidates, derive_temp_ref, choose_best, apply_candidate, fetch_candidates_by_temp_ref
+from ..services.watch_service import start_watching, stop_watching, watch_status
+from ..services.metadata_quality_service import gather_candidates, persist_candidates, derive_temp_ref, choose_best, apply_candidate, apply_candidates, fetch_candidates_by_temp_ref
 from ..services.metadata_provenance_service import get_attribution, revert_field
-from ..services.fuzzy_confidence_service import recalc_confidence
+from ..services.fuzzy_confidence_service import recalc_confidence, recalc_confidence_all
+from ..services.external_match_service import match_external_tracks, MIN_CONFIDENCE
+from ..services.autotag_service import create_run, get_run, resumable_run, cancel_run, run_autotag_job, run_params_differ, MIN_SCORE_DEFAULT
 from ..services.artwork_service import list_artworks, add_artwork, set_primary_artwork, delete_artwork
 from ..services.relation_service import list_relations, add_relation, delete_relation
 from ..services.samples_service import list_samples, add_sample, delete_sample
@@ -27,9 +30,8 @@ LIBRARY_METADATA = Path("library/metadata").resolve()
 router = APIRouter()
 init_db(LIBRARY_DB)
 
-# Simple in-memory event broadcaster for SSE
-import asyncio
-event_queue: asyncio.Queue = asyncio.Queue()
+# In-memory event broadcaster for SSE (shared with background jobs)
+from ..services.event_service import event_queue, publish, EVENT_TYPES
 
 class SpotifyImportRequest(BaseModel):
     playlist_url: str
@@ -49,8 +51,8 @@ class DownloadEnqueueRequest(BaseModel):
     subdir: Optional[str] = None
 
 @router.post("/spotify/playlists/import")
-async def import_spotify_playlist(body: SpotifyImportRequest):
-    tracks = fetch_spotify_playlist_tracks(body.playlist_url, body.client_id, body.client_secret)
+async def import_spotify_playlist(body: SpotifyImportRequest, background_tasks: BackgroundTasks):
+    tracks = await fetch_spotify_playlist_tracks(body.playlist_url, body.client_id, body.client_secret)
     if not tracks:
         raise HTTPException(status_code=404, detail="No tracks found or unauthorized")
     # Store external references in DB for future matching/downloads
@@ -66,15 +68,28 @@ async def import_spotify_playlist(body: SpotifyImportRequest):
         )
         created += 1
     db.commit()
+    background_tasks.add_task(match_external_tracks, LIBRARY_DB, MIN_CONFIDENCE, "spotify")
     return {"indexed": created}
 
+class ExternalMatchRequest(BaseModel):
+    min_confidence: float = MIN_CONFIDENCE
+    source: Optional[str] = None
+
+@router.post("/external/match")
+def external_match(body: ExternalMatchRequest):
+    return match_external_tracks(LIBRARY_DB, body.min_confidence, body.source)
+
 @router.post("/itunes/library/import")
-async def import_itunes_library_endpoint(body: ITunesImportRequest):
-    count = import_itunes_library(Path(body.library_xml_path), copy_files=body.copy_files, library_audio=LIBRARY_AUDIO)
-    return {"imported_files": count}
+def import_itunes_library_endpoint(body: ITunesImportRequest, background_tasks: BackgroundTasks):
+    library_xml = Path(body.library_xml_path)
+    if not library_xml.is_file():
+        raise HTTPException(status_code=404, detail="Library XML not found")
+    # Progress arrives as import_progress events; the summary as a final info event
+    background_tasks.add_task(run_itunes_import_job, library_xml, body.copy_files, LIBRARY_AUDIO, LIBRARY_DB)
+    return {"status": "queued"}
 
 @router.post("/bandcamp/collection/import")
-async def import_bandcamp_collection(body: BandcampImportRequest):
+async def import_bandcamp_collection(body: BandcampImportRequest, background_tasks: BackgroundTasks):
     links = parse_bandcamp_links(body.links_text or "")
     if not links:
         raise HTTPException(status_code=400, detail="No links provided")
@@ -85,6 +100,7 @@ async def import_bandcamp_collection(body: BandcampImportRequest):
             (url, None)
         )
     db.commit()
+    background_tasks.add_task(start_download_pool, LIBRARY_DB)
     return {"queued": len(links)}
 
 @router.post("/downloads/queue")
@@ -93,8 +109,14 @@ async def queue_downloads(body: DownloadEnqueueRequest, background_tasks: Backgr
     dest_base = (LIBRARY_AUDIO / subdir) if subdir else LIBRARY_AUDIO
     dest_base.mkdir(parents=True, exist_ok=True)
     enqueued = enqueue_downloads(body.urls, dest_base, LIBRARY_DB)
+    # Progress arrives as import_progress events (bytes/s), completions as download_finished
+    background_tasks.add_task(start_download_pool, LIBRARY_DB)
     return {"queued": enqueued}
 
+@router.get("/downloads")
+def downloads_list(status: Optional[str] = None, limit: int = 100):
+    return {"jobs": list_downloads(LIBRARY_DB, status, limit)}
+
 class MBQuery(BaseModel):
     artist: Optional[str] = None
     album: Optional[str] = None
@@ -102,7 +124,7 @@ class MBQuery(BaseModel):
 
 @router.post("/musicbrainz/search")
 async def musicbrainz_search(body: MBQuery):
-    return search_musicbrainz_release(artist=body.artist, album=body.album, title=body.title)
+    return await search_musicbrainz_release(artist=body.artist, album=body.album, title=body.title)
 
 class DiscogsQuery(BaseModel):
     query: str
@@ -110,7 +132,7 @@ class DiscogsQuery(BaseModel):
 
 @router.post("/discogs/search")
 async def discogs_search(body: DiscogsQuery):
-    return search_discogs_release(query=body.query, token=body.token)
+    return await search_discogs_release(query=body.query, token=body.token)
 
 class SoundCloudQuery(BaseModel):
     url: str
@@ -124,9 +146,29 @@ class LocalScanRequest(BaseModel):
     copy: bool = False
 
 @router.post("/local/scan")
-async def local_scan(body: LocalScanRequest):
-    count = scan_local_folder(Path(body.folder), LIBRARY_AUDIO, copy=body.copy)
-    return {"indexed": count}
+def local_scan(body: LocalScanRequest):
+    return scan_local_folder(Path(body.folder), LIBRARY_AUDIO, copy=body.copy)
+
+class WatchRequest(BaseModel):
+    folders: List[str]
+    copy: bool = False
+
+@router.post("/local/watch")
+def local_watch_start(body: WatchRequest):
+    folders = [Path(f) for f in body.folders if Path(f).is_dir()]
+    if not folders:
+        raise HTTPException(status_code=400, detail="No existing folders to watch")
+    return {"watch": start_watching(folders, LIBRARY_AUDIO, copy=body.copy)}
+
+@router.get("/local/watch")
+def local_watch_status():
+    return {"watch": watch_status()}
+
+@router.delete("/local/watch")
+def local_watch_stop():
+    if not stop_watching():
+        raise HTTPException(status_code=404, detail="Watcher not running")
+    return {"status": "stopped"}
 
 class MetadataQualityRequest(BaseModel):
     artist: Optional[str] = None
@@ -134,10 +176,13 @@ class MetadataQualityRequest(BaseModel):
     title: Optional[str] = None
     discogs_token: Optional[str] = None
     path_audio: Optional[str] = None  # local path to associate candidates
+    sources: Optional[List[str]] = None  # registered source names; default all
 
 @router.post("/metadata/quality")
 async def metadata_quality(body: MetadataQualityRequest):
-    candidates = aggregate_metadata(body.artist, body.album, body.title, discogs_token=body.discogs_token)
+    candidates, source_status = await gather_candidates(
+        body.artist, body.album, body.title, discogs_token=body.discogs_token, sources=body.sources
+    )
     temp_ref = None
     if body.path_audio:
         temp_ref = derive_temp_ref(body.path_audio)
@@ -145,14 +190,14 @@ async def metadata_quality(body: MetadataQualityRequest):
         # replace candidates with persisted (including IDs)
         candidates = fetch_candidates_by_temp_ref(temp_ref)
     best = choose_best(candidates)
-    return {"temp_ref": temp_ref, "best": best, "candidates": candidates}
+    return {"temp_ref": temp_ref, "best": best, "candidates": candidates, "sources": source_status}
 
 class MetadataApplyRequest(BaseModel):
     candidate_id: int
     track_id: int
 
 @router.post("/metadata/apply")
-async def metadata_apply(body: MetadataApplyRequest):
+def metadata_apply(body: MetadataApplyRequest):
     row = apply_candidate(body.candidate_id, body.track_id)
     if not row:
         raise HTTPException(status_code=404, detail="Candidate or Track not found")
@@ -183,6 +228,10 @@ async def metadata_revert(body: MetadataRevertRequest):
         raise HTTPException(status_code=404, detail="Nothing to revert")
     return {"status": "reverted", "attribution": get_attribution(body.track_id)}
 
+@router.post("/metadata/recalc-confidence")
+def metadata_recalc_confidence_all():
+    return recalc_confidence_all(LIBRARY_DB)
+
 @router.post("/metadata/recalc-confidence/{track_id}")
 async def metadata_recalc_confidence(track_id: int):
     ok = recalc_confidence(track_id)
@@ -198,13 +247,45 @@ class BulkApplyRequest(BaseModel):
     items: List[BulkApplyItem]
 
 @router.post("/metadata/apply/bulk")
-async def metadata_apply_bulk(body: BulkApplyRequest):
-    applied = []
-    for item in body.items:
-        row = apply_candidate(item.candidate_id, item.track_id)
-        if row:
-            applied.append({"track_id": item.track_id, "candidate_id": item.candidate_id})
-    return {"applied": applied}
+def metadata_apply_bulk(body: BulkApplyRequest):
+    applied = apply_candidates([(item.candidate_id, item.track_id) for item in body.items])
+    return {"applied": [{"track_id": t, "candidate_id": c} for c, t in applied]}
+
+class AutoTagRequest(BaseModel):
+    min_score: Optional[float] = None  # title/artist agreement (0-1) required to auto-apply; default MIN_SCORE_DEFAULT
+    sources: Optional[List[str]] = None
+    limit: Optional[int] = None
+    discogs_token: Optional[str] = None
+    resume: bool = True  # continue an interrupted run (with its own min_score/sources/limit) instead of starting over
+
+@router.post("/metadata/autotag")
+def metadata_autotag(body: AutoTagRequest, background_tasks: BackgroundTasks):
+    run_id = resumable_run(LIBRARY_DB) if body.resume else None
+    if run_id is not None:
+        differ = run_params_differ(get_run(LIBRARY_DB, run_id), body.min_score, body.sources, body.limit)
+        if differ:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Run {run_id} was started with different {', '.join(differ)}; omit them to resume it, or set resume=false",
+            )
+    else:
+        min_score = MIN_SCORE_DEFAULT if body.min_score is None else body.min_score
+        run_id = create_run(LIBRARY_DB, min_score, body.sources, body.limit)
+    background_tasks.add_task(run_autotag_job, LIBRARY_DB, run_id, body.discogs_token)
+    return {"run": get_run(LIBRARY_DB, run_id)}
+
+@router.get("/metadata/autotag/{run_id}")
+def metadata_autotag_status(run_id: int):
+    run = get_run(LIBRARY_DB, run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Auto-tag run not found")
+    return {"run": run}
+
+@router.delete("/metadata/autotag/{run_id}")
+def metadata_autotag_cancel(run_id: int):
+    if not cancel_run(LIBRARY_DB, run_id):
+        raise HTTPException(status_code=404, detail="No active auto-tag run with that id")
+    return {"run": get_run(LIBRARY_DB, run_id)}
 
 @router.get("/metadata/diff/{track_id}")
 async def metadata_diff(track_id: int, temp_ref: Optional[str] = None):
@@ -233,17 +314,16 @@ async def events_stream():
     return StreamingResponse(sse_event_stream(), media_type="text/event-stream")
 
 class EmitEvent(BaseModel):
-    type: str  # upload_complete | download_finished | info
+    type: str  # upload_complete | download_finished | import_progress | info
     message: Optional[str] = None
     track_id: Optional[int] = None
 
 @router.post("/events/emit")
 async def events_emit(body: EmitEvent):
     # Minimal validation
-    if body.type not in {"upload_complete", "download_finished", "info"}:
+    if body.type not in EVENT_TYPES:
         raise HTTPException(status_code=400, detail="Invalid event type")
-    payload = {"type": body.type, "message": body.message, "track_id": body.track_id}
-    await event_queue.put(__import__("json").dumps(payload))
+    publish({"type": body.type, "message": body.message, "track_id": body.track_id})
     return {"status": "queued"}
 
 class ArtworkCreate(BaseModel):
@@ -255,7 +335,7 @@ async def track_artworks(track_id: int):
     return {"artworks": list_artworks(track_id)}
 
 @router.post("/tracks/{track_id}/artworks")
-async def track_artworks_add(track_id: int, body: ArtworkCreate):
+def track_artworks_add(track_id: int, body: ArtworkCreate):
     try:
         art = add_artwork(track_id, body.cover_url, body.source)
     except Exception as e:
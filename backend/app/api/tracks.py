@@ -2,10 +2,14 @@ from fastapi import APIRouter, HTTPException
 from fastapi import Query
 from fastapi import UploadFile, File
 from fastapi import BackgroundTasks
-from typing import List
-from ..models.track_model import Track, TrackCreate
+from pydantic import BaseModel
+from typing import List, Optional
+from ..models.track_model import Track, TrackCreate, TrackSearchResult
 from ..utils.db_utils import get_db, init_db
-from ..services.metadata_service import extract_metadata
+from ..services.import_service import stream_to_disk, create_import_job, process_import_job, get_import_job, iter_audio_files, run_batch_import_job
+from ..services.search_service import search_tracks as fts_search_tracks
+from ..services.dedup_service import reserve_dest
+from ..services.track_query_service import list_tracks_page, count_tracks, parse_fields
 import os
 from pathlib import Path
 
@@ -24,32 +28,37 @@ init_db(LIBRARY_DB)
 @router.get("/")
 def list_tracks() -> List[Track]:
     db = get_db(LIBRARY_DB)
-    rows = db.execute("SELECT id, title, artist, album, duration_ms, path_audio FROM tracks ORDER BY import_date DESC").fetchall()
+    rows = db.execute("SELECT id, title, artist, album, duration_ms, path_audio FROM tracks ORDER BY COALESCE(import_date, '') DESC, id DESC").fetchall()
     return [Track(
         id=row[0], title=row[1], artist=row[2], album=row[3], duration_ms=row[4], path_audio=row[5]
     ) for row in rows]
 
+@router.get("/page")
+def list_tracks_paged(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    sort: str = "import_date",
+    order: str = "desc",
+    fields: Optional[str] = None,
+):
+    """Keyset-paginated listing; pass back next_cursor to fetch the following page."""
+    try:
+        return list_tracks_page(LIBRARY_DB, limit=limit, cursor=cursor, sort=sort, order=order, fields=parse_fields(fields))
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+
+@router.get("/count")
+def tracks_count():
+    return {"total": count_tracks(LIBRARY_DB)}
+
 @router.get("/search")
-def search_tracks(q: str = Query("", min_length=1), limit: int = 20, offset: int = 0) -> List[Track]:
+def search_tracks(q: str = Query("", min_length=1), limit: int = 20, offset: int = 0) -> List[TrackSearchResult]:
     term = q.strip()
     if not term:
         return []
-    db = get_db(LIBRARY_DB)
-    # Escape LIKE wildcards
-    esc = term.replace("%", r"\%").replace("_", r"\_")
-    like = f"%{esc}%"
-    rows = db.execute(
-        (
-            "SELECT id, title, artist, album, duration_ms, path_audio "
-            "FROM tracks "
-            "WHERE title LIKE ? ESCAPE '\\' OR artist LIKE ? ESCAPE '\\' OR album LIKE ? ESCAPE '\\' "
-            "ORDER BY import_date DESC LIMIT ? OFFSET ?"
-        ),
-        (like, like, like, limit, offset),
-    ).fetchall()
-    return [Track(
-        id=row[0], title=row[1], artist=row[2], album=row[3], duration_ms=row[4], path_audio=row[5]
-    ) for row in rows]
+    # FTS5 prefix match ranked by bm25 (see scripts/migrations/003_tracks_fts.sql)
+    rows = fts_search_tracks(LIBRARY_DB, term, limit=limit, offset=offset)
+    return [TrackSearchResult(**row) for row in rows]
 
 @router.get("/{id}")
 def get_track(id: int) -> Track:
@@ -61,34 +70,39 @@ def get_track(id: int) -> Track:
 
 @router.post("/import")
 def import_track(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
-    # Save uploaded file to library/audio
+    # Stream upload to library/audio; tags, sidecar JSON and DB row are handled by a background job
     filename = os.path.basename(file.filename)
-    dest_path = LIBRARY_AUDIO / filename
-    with open(dest_path, "wb") as f:
-        f.write(file.file.read())
+    # The name is claimed before streaming; concurrent uploads of the same name get distinct files
+    dest_path = reserve_dest(LIBRARY_AUDIO, filename)
+    try:
+        size, content_hash = stream_to_disk(file.file, dest_path)
+    except BaseException:
+        dest_path.unlink(missing_ok=True)
+        raise
+    job_id = create_import_job(LIBRARY_DB, dest_path, filename, size, content_hash)
+    background_tasks.add_task(process_import_job, LIBRARY_DB, job_id, LIBRARY_METADATA)
+    return {"job_id": job_id, "status": "queued", "message": "Import queued"}
 
-    # Extract metadata and store
-    meta = extract_metadata(dest_path)
+class BatchImportRequest(BaseModel):
+    paths: List[str] = []  # audio files and/or directories on the local machine
+    recursive: bool = True
+    copy: bool = False
+    workers: Optional[int] = None
 
-    # Store JSON metadata
-    json_path = LIBRARY_METADATA / f"{dest_path.stem}.json"
-    with open(json_path, "w", encoding="utf-8") as jf:
-        import json
-        json.dump(meta, jf, ensure_ascii=False, indent=2)
-
-    # Insert into DB
-    db = get_db(LIBRARY_DB)
-    cur = db.execute(
-        """
-        INSERT INTO tracks (title, artist, album, year, duration_ms, path_audio, path_metadata, genre, import_date)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
-        """,
-        (
-            meta.get("title"), meta.get("artist"), meta.get("album"), meta.get("year"),
-            meta.get("duration_ms"), str(dest_path), str(json_path), meta.get("genre")
-        )
+@router.post("/import/batch")
+def import_batch_endpoint(body: BatchImportRequest, background_tasks: BackgroundTasks):
+    files = list(iter_audio_files((Path(p) for p in body.paths), recursive=body.recursive))
+    if not files:
+        raise HTTPException(status_code=400, detail="No audio files found")
+    background_tasks.add_task(
+        run_batch_import_job, LIBRARY_DB, files, LIBRARY_METADATA,
+        LIBRARY_AUDIO if body.copy else None, body.workers
     )
-    db.commit()
-    track_id = cur.lastrowid
+    return {"queued": len(files)}
 
-    return {"track_id": track_id, "message": "Imported"}
+@router.get("/import/jobs/{job_id}")
+def import_job_status(job_id: int):
+    job = get_import_job(LIBRARY_DB, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return {"job": job}
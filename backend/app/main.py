@@ -1,9 +1,17 @@
+import asyncio
+import threading
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .api.tracks import router as tracks_router
+from .api.tracks import router as tracks_router, LIBRARY_DB, LIBRARY_METADATA
 from .api.sources import router as sources_router
 from .api.dj import router as dj_router
 from .api.analytics import router as analytics_router
+from .utils.db_utils import close_all_connections
+from .utils.http_utils import close_client
+from .services.event_service import bind_loop
+from .services.watch_service import stop_watching
+from .services.cache_service import start_sweeper, stop_sweeper
+from .services.import_service import resume_import_jobs
 
 app = FastAPI(title="UNCHAINED API", version="0.1.0")
 
@@ -15,6 +23,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def startup():
+    bind_loop(asyncio.get_running_loop())
+    start_sweeper()
+    # Uploads queued before a restart lost their BackgroundTasks job
+    threading.Thread(target=resume_import_jobs, args=(LIBRARY_DB, LIBRARY_METADATA), name="import-resume", daemon=True).start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    stop_watching()
+    stop_sweeper()
+    await close_client()
+    close_all_connections()
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
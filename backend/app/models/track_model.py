@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, Dict
 
 class Track(BaseModel):
     id: int
@@ -9,5 +9,8 @@ class Track(BaseModel):
     duration_ms: Optional[int] = None
     path_audio: Optional[str] = None
 
+class TrackSearchResult(Track):
+    highlight: Optional[Dict[str, Optional[str]]] = None
+
 class TrackCreate(BaseModel):
     path_audio: str
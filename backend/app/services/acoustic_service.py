@@ -0,0 +1,411 @@
+"""
+Multi-process acoustic feature extraction (MFCC, chroma, spectral centroid) into track_embeddings.
+"""
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+import numpy as np
+
+from ..utils.audio_stream import AudioStream, N_FFT, stft_blocks
+from ..utils.db_utils import get_db, init_db
+from .embedding_store import encode_vector
+from .event_service import publish
+
+DB_PATH = Path('library/db/library.sqlite').resolve()
+MODEL_VERSION = "acoustic_v2"  # v1: first 60 s only; v2: whole file, streamed
+ANALYSIS_WORKERS = int(os.getenv("UNCHAINED_ANALYSIS_WORKERS", "0")) or (os.cpu_count() or 1)
+ANALYSIS_CHUNK = 64
+FILE_TIMEOUT_SECONDS = 600.0  # whole files: a two-hour mix takes a few minutes
+SAMPLE_RATE = 22050
+ANALYSIS_MAX_SECONDS: Optional[float] = None  # None = whole track
+TIMEOUT_EXIT_CODE = 3
+RUN_LEASE_SECONDS = 120.0
+RUN_HEARTBEAT_SECONDS = 30.0
+
+# A run walks tracks in id order, chunk by chunk. Each chunk's files are analysed
+# in a process pool; the chunk's embeddings, analysis_errors rows and the run's
+# last_track_id checkpoint commit together, so a crash resumes after the last
+# finished chunk. The process executing a run holds a lease on it (owner token,
+# renewed by a heartbeat thread) and every checkpoint is conditional on it, so an
+# API worker and a CLI never advance the same run. A file that overruns
+# FILE_TIMEOUT_SECONDS makes its worker report the track and exit (the pool starts
+# a replacement); the decoder cannot be interrupted. Workers report the pid that
+# took each file, so a file whose worker crashed is recorded as soon as it is gone.
+
+RUN_COLUMNS = ["id", "status", "model_version", "track_ids", "force_recompute", "workers", "last_track_id",
+               "processed", "succeeded", "failed", "error", "created_at", "updated_at", "finished_at"]
+
+
+# ---- worker side -----------------------------------------------------------
+
+_events = None
+
+
+def _init_worker(events):
+    """Import librosa and JIT-compile its kernels before the first file, so the per-file
+    timeout only covers decoding and feature extraction."""
+    global _events
+    _events = events
+    features_from_blocks([np.random.default_rng(0).uniform(-0.5, 0.5, SAMPLE_RATE).astype(np.float32)])
+
+
+def _on_timeout(track_id: int):
+    _events.put(("timeout", track_id, os.getpid()))
+    os._exit(TIMEOUT_EXIT_CODE)
+
+
+@functools.lru_cache(maxsize=1)
+def _filter_banks() -> Tuple[np.ndarray, np.ndarray]:
+    """Mel and chroma filter banks, built once per process."""
+    import librosa
+    return (librosa.filters.mel(sr=SAMPLE_RATE, n_fft=N_FFT),
+            librosa.filters.chroma(sr=SAMPLE_RATE, n_fft=N_FFT, tuning=0.0))
+
+
+def features_from_blocks(blocks) -> List[float]:
+    """13 MFCC means, 12 chroma means and the mean spectral centroid (26 values) of a
+    stream of mono SAMPLE_RATE blocks. Every feature is derived from the same spectrogram,
+    computed block by block; per-frame values are summed, so memory does not grow with
+    track length. Each frame's features depend on that frame alone (absolute dB scale,
+    fixed A440 tuning), so the result does not depend on the block size."""
+    import librosa
+    mel_basis, chroma_basis = _filter_banks()
+    sums = np.zeros(26, dtype=np.float64)
+    frames = 0
+    for magnitude in stft_blocks(blocks, n_fft=N_FFT):
+        power = magnitude ** 2
+        mfcc = librosa.feature.mfcc(S=librosa.power_to_db(mel_basis @ power, ref=1.0, top_db=None), n_mfcc=13)
+        sums[:13] += mfcc.sum(axis=1)
+        sums[13:25] += librosa.util.normalize(chroma_basis @ power, norm=np.inf, axis=0).sum(axis=1)
+        sums[25] += librosa.feature.spectral_centroid(S=magnitude, sr=SAMPLE_RATE, n_fft=N_FFT).sum()
+        frames += magnitude.shape[1]
+    return (sums / max(1, frames)).tolist()
+
+
+def extract_features(path: str, max_seconds: Optional[float] = ANALYSIS_MAX_SECONDS) -> List[float]:
+    """Decode path once (streamed) and return its 26 acoustic features."""
+    stream = AudioStream(path, SAMPLE_RATE, max_seconds=max_seconds)
+    features = features_from_blocks(stream)
+    if not stream.samples:
+        raise ValueError("No audio decoded")
+    return features
+
+
+def _analyse(track_id: int, path: str, timeout: float) -> Tuple[int, Optional[List[float]], Optional[str]]:
+    """Pool task: (track_id, features or None, error or None)."""
+    watchdog = None
+    if _events is not None:
+        _events.put(("start", track_id, os.getpid()))
+        watchdog = threading.Timer(timeout, _on_timeout, args=(track_id,))
+        watchdog.daemon = True
+        watchdog.start()
+    try:
+        return track_id, extract_features(path), None
+    except Exception as e:
+        return track_id, None, f"{type(e).__name__}: {e}"
+    finally:
+        if watchdog is not None:
+            watchdog.cancel()
+
+
+# ---- runs ------------------------------------------------------------------
+
+def _run_row(row) -> Dict[str, Any]:
+    run = dict(zip(RUN_COLUMNS, row))
+    run["track_ids"] = json.loads(run["track_ids"]) if run["track_ids"] else None
+    run["force_recompute"] = bool(run["force_recompute"])
+    return run
+
+
+def create_run(db_path: Path, track_ids: Optional[List[int]] = None, force_recompute: bool = False,
+               workers: Optional[int] = None) -> int:
+    db = get_db(db_path)
+    cur = db.execute(
+        """
+        INSERT INTO analysis_runs (status, model_version, track_ids, force_recompute, workers, created_at, updated_at)
+        VALUES ('queued', ?, ?, ?, ?, datetime('now'), datetime('now'))
+        """,
+        (MODEL_VERSION, json.dumps(track_ids) if track_ids is not None else None, int(force_recompute), workers)
+    )
+    db.commit()
+    return cur.lastrowid
+
+
+def get_run(db_path: Path, run_id: int) -> Optional[Dict[str, Any]]:
+    db = get_db(db_path)
+    row = db.execute(f"SELECT {', '.join(RUN_COLUMNS)} FROM analysis_runs WHERE id=?", (run_id,)).fetchone()
+    return _run_row(row) if row else None
+
+
+def resumable_run(db_path: Path) -> Optional[int]:
+    """Most recent whole-library run that was queued or interrupted mid-way (runs limited to
+    track_ids or forcing recomputation are only resumed by id)."""
+    db = get_db(db_path)
+    row = db.execute(
+        """
+        SELECT id FROM analysis_runs
+        WHERE status IN ('queued', 'running') AND track_ids IS NULL AND force_recompute=0 AND model_version=?
+        ORDER BY id DESC LIMIT 1
+        """,
+        (MODEL_VERSION,)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def claim_run(db_path: Path, run_id: int) -> Optional[str]:
+    """Atomically take a queued run (or one whose lease lapsed); returns the owner token."""
+    owner = uuid.uuid4().hex
+    now = time.time()
+    db = get_db(db_path)
+    cur = db.execute(
+        """
+        UPDATE analysis_runs SET status='running', lease_owner=?, lease_expires_at=?, updated_at=datetime('now')
+        WHERE id=? AND (status='queued' OR (status='running' AND (lease_expires_at IS NULL OR lease_expires_at < ?)))
+        """,
+        (owner, now + RUN_LEASE_SECONDS, run_id, now)
+    )
+    db.commit()
+    return owner if cur.rowcount else None
+
+
+def _renew_lease(db_path: Path, run_id: int, owner: str) -> bool:
+    db = get_db(db_path)
+    cur = db.execute(
+        "UPDATE analysis_runs SET lease_expires_at=? WHERE id=? AND lease_owner=? AND status='running'",
+        (time.time() + RUN_LEASE_SECONDS, run_id, owner)
+    )
+    db.commit()
+    return cur.rowcount > 0
+
+
+def _heartbeat(db_path: Path, run_id: int, owner: str, stop: threading.Event):
+    while not stop.wait(RUN_HEARTBEAT_SECONDS):
+        if not _renew_lease(db_path, run_id, owner):
+            return
+
+
+def cancel_run(db_path: Path, run_id: int) -> bool:
+    db = get_db(db_path)
+    cur = db.execute(
+        "UPDATE analysis_runs SET status='cancelled', updated_at=datetime('now') WHERE id=? AND status IN ('queued', 'running')",
+        (run_id,)
+    )
+    db.commit()
+    return cur.rowcount > 0
+
+
+def list_errors(db_path: Path, run_id: Optional[int] = None, limit: int = 100) -> List[Dict[str, Any]]:
+    db = get_db(db_path)
+    where = "WHERE run_id=?" if run_id is not None else ""
+    rows = db.execute(
+        f"SELECT id, run_id, track_id, path_audio, error, created_at FROM analysis_errors {where} ORDER BY id DESC LIMIT ?",
+        ((run_id, limit) if run_id is not None else (limit,))
+    ).fetchall()
+    return [dict(zip(["id", "run_id", "track_id", "path_audio", "error", "created_at"], r)) for r in rows]
+
+
+def _pending_sql(run: Dict[str, Any]) -> Tuple[str, tuple]:
+    where = "id > ? AND path_audio IS NOT NULL"
+    args: tuple = ()
+    if run["track_ids"] is not None:
+        where += " AND id IN (SELECT value FROM json_each(?))"
+        args += (json.dumps(run["track_ids"]),)
+    if not run["force_recompute"]:
+        where += " AND NOT EXISTS (SELECT 1 FROM track_embeddings e WHERE e.track_id = tracks.id AND e.model_version = ?)"
+        args += (run["model_version"],)
+    return where, args
+
+
+def _analyse_chunk(pool, events, rows: List[Tuple[int, str]], timeout: float):
+    """Run one chunk through the pool; returns {track_id: (features, error)}."""
+    pending = {tid: pool.apply_async(_analyse, (tid, path, timeout)) for tid, path in rows}
+    results: Dict[int, Tuple[Optional[List[float]], Optional[str]]] = {}
+    running: Dict[int, int] = {}  # track_id -> pid of the worker analysing it
+
+    def drain():
+        while not events.empty():
+            kind, tid, pid = events.get()
+            if kind == "start":
+                running[tid] = pid
+            elif pending.pop(tid, None) is not None:
+                results[tid] = (None, f"Timed out after {timeout:g}s")
+
+    last_progress = time.monotonic()
+    while pending:
+        drain()
+        for tid in [t for t, res in pending.items() if res.ready()]:
+            _, features, error = pending.pop(tid).get()
+            results[tid] = (features, error)
+            last_progress = time.monotonic()
+        # Pool replaces workers that exit; a started file whose worker is no longer
+        # among the live ones died with it (OOM kill, decoder segfault)
+        live = {p.pid for p in pool._pool if p.exitcode is None}
+        if any(running.get(tid) not in live for tid in pending if tid in running):
+            drain()  # a timed-out worker reports before it exits
+            for tid in [t for t in pending if t in running and running[t] not in live]:
+                if not pending[tid].ready():
+                    pending.pop(tid)
+                    results[tid] = (None, "Worker process died")
+                    last_progress = time.monotonic()
+        if pending:
+            # Safety net for a worker lost before it reported the file it took
+            if time.monotonic() - last_progress > 2 * timeout + 5:
+                for tid in pending:
+                    results[tid] = (None, "Worker process died")
+                break
+            next(iter(pending.values())).wait(0.05)
+    return results
+
+
+def _write_chunk(db, run_id: int, owner: str, rows: List[Tuple[int, str]], results, last_track_id: int) -> bool:
+    """Commit a chunk's results with the checkpoint; False (nothing written) if the lease was lost."""
+    computed_at = datetime.utcnow().isoformat()
+    embeddings, errors = [], []
+    for tid, path in rows:
+        features, error = results.get(tid, (None, "No result"))
+        if features is not None:
+            embeddings.append((tid, encode_vector(features), MODEL_VERSION, len(features), computed_at))
+        else:
+            errors.append((run_id, tid, path, error))
+    cur = db.execute(
+        """
+        UPDATE analysis_runs SET last_track_id=?, processed=processed+?, succeeded=succeeded+?, failed=failed+?,
+            lease_expires_at=?, updated_at=datetime('now')
+        WHERE id=? AND lease_owner=?
+        """,
+        (last_track_id, len(rows), len(embeddings), len(errors), time.time() + RUN_LEASE_SECONDS, run_id, owner)
+    )
+    if not cur.rowcount:
+        db.rollback()
+        return False
+    db.executemany(
+        """
+        INSERT OR REPLACE INTO track_embeddings (track_id, embedding_blob, model_version, dimensionality, computed_at)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        embeddings
+    )
+    db.executemany(
+        "INSERT INTO analysis_errors (run_id, track_id, path_audio, error, created_at) VALUES (?, ?, ?, ?, datetime('now'))",
+        errors
+    )
+    db.commit()
+    return True
+
+
+def analyse_library(
+    db_path: Path,
+    run_id: int,
+    workers: Optional[int] = None,
+    chunk_size: int = ANALYSIS_CHUNK,
+    timeout: float = FILE_TIMEOUT_SECONDS,
+    on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Optional[Dict[str, Any]]:
+    """Execute a run if it can be claimed; otherwise (finished, or another process holds
+    it) return it untouched."""
+    owner = claim_run(db_path, run_id)
+    if owner is None:
+        return get_run(db_path, run_id)
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(db_path, run_id, owner, stop), daemon=True).start()
+    try:
+        _execute_run(db_path, run_id, owner, workers, chunk_size, timeout, on_progress)
+    except Exception as e:
+        db = get_db(db_path)
+        db.execute(
+            "UPDATE analysis_runs SET status='error', error=?, lease_owner=NULL, updated_at=datetime('now') "
+            "WHERE id=? AND lease_owner=?",
+            (str(e), run_id, owner)
+        )
+        db.commit()
+        raise
+    finally:
+        stop.set()
+    return get_run(db_path, run_id)
+
+
+def _execute_run(db_path: Path, run_id: int, owner: str, workers: Optional[int], chunk_size: int, timeout: float,
+                 on_progress: Optional[Callable[[Dict[str, Any]], None]]):
+    db = get_db(db_path)
+    run = get_run(db_path, run_id)
+    workers = max(1, workers or run["workers"] or ANALYSIS_WORKERS)
+    db.execute("UPDATE analysis_runs SET workers=? WHERE id=? AND lease_owner=?", (workers, run_id, owner))
+    db.commit()
+    where, args = _pending_sql(run)
+    total = run["processed"] + db.execute(f"SELECT COUNT(*) FROM tracks WHERE {where}", (run["last_track_id"],) + args).fetchone()[0]
+    last_id = run["last_track_id"]
+    # spawn on every platform: librosa/numba state does not survive fork reliably
+    ctx = multiprocessing.get_context("spawn")
+    events = ctx.SimpleQueue()
+    with ctx.Pool(workers, initializer=_init_worker, initargs=(events,)) as pool:
+        while True:
+            status, lease_owner = db.execute("SELECT status, lease_owner FROM analysis_runs WHERE id=?", (run_id,)).fetchone()
+            if status != "running" or lease_owner != owner:
+                return
+            rows = db.execute(
+                f"SELECT id, path_audio FROM tracks WHERE {where} ORDER BY id LIMIT ?", (last_id,) + args + (chunk_size,)
+            ).fetchall()
+            if not rows:
+                db.execute(
+                    "UPDATE analysis_runs SET status='done', lease_owner=NULL, lease_expires_at=NULL, "
+                    "updated_at=datetime('now'), finished_at=datetime('now') "
+                    "WHERE id=? AND status='running' AND lease_owner=?",
+                    (run_id, owner)
+                )
+                db.commit()
+                return
+            results = _analyse_chunk(pool, events, rows, timeout)
+            last_id = rows[-1][0]
+            if not _write_chunk(db, run_id, owner, rows, results, last_id):
+                return
+            if on_progress:
+                progress = get_run(db_path, run_id)
+                progress["total"] = total
+                on_progress(progress)
+
+
+def run_analysis_job(db_path: Path, run_id: int, workers: Optional[int] = None, on_done: Optional[Callable[[], None]] = None):
+    """BackgroundTasks / CLI entry point; progress is published as SSE events."""
+    def progress(run: Dict[str, Any]):
+        publish({
+            "type": "import_progress", "progress": run["processed"] / max(1, run["total"]), "track_id": None,
+            "message": f"Acoustic analysis: {run['processed']}/{run['total']} files, {run['failed']} failed",
+        })
+    try:
+        result = analyse_library(db_path, run_id, workers, on_progress=progress)
+    except Exception as e:
+        publish({"type": "info", "track_id": None, "message": f"Acoustic analysis failed: {e}"})
+        return None
+    finally:
+        if on_done:
+            on_done()
+    if result and result["status"] == "done":
+        publish({
+            "type": "info", "track_id": None,
+            "message": f"Acoustic analysis finished: {result['succeeded']} analysed, {result['failed']} failed",
+        })
+    return result
+
+
+if __name__ == '__main__':
+    # python -m backend.app.services.acoustic_service [--workers 8] [--force] [--resume]
+    parser = argparse.ArgumentParser(description="Extract acoustic features for library tracks")
+    parser.add_argument("--workers", type=int, default=None, help=f"processes (default {ANALYSIS_WORKERS})")
+    parser.add_argument("--force", action="store_true", help="re-analyse tracks that already have features")
+    parser.add_argument("--resume", action="store_true", help="continue the last interrupted run")
+    parser.add_argument("--db", default=str(DB_PATH))
+    args = parser.parse_args()
+    target = Path(args.db).resolve()
+    init_db(target)
+    run_id = resumable_run(target) if args.resume else None
+    if run_id is None:
+        run_id = create_run(target, force_recompute=args.force, workers=args.workers)
+    print(json.dumps(run_analysis_job(target, run_id, args.workers), indent=2))
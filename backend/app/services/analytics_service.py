@@ -2,33 +2,68 @@
 Analytics service for computing embeddings, clustering, similarity, and library statistics.
 """
 from pathlib import Path
-from typing import List, Optional, Dict, Any, Tuple
+from typing import Callable, List, Optional, Dict, Any, Tuple
 import sqlite3
 import json
+import time
+import zlib
 from datetime import datetime
 import numpy as np
 
+from ..utils.db_utils import get_db
+from .embedding_store import EmbeddingMatrix, EMBEDDING_DTYPE, decode_vector
+from .ann_index_service import AnnIndex, ANN_MIN_ROWS, build_in_background
+from . import acoustic_service
+
+DB_PATH = Path('library/db/library.sqlite').resolve()
+FILTER_CACHE_SECONDS = 30
+EMBEDDING_BATCH = 20000
+
 # ML imports (will be installed)
 try:
     from sklearn.cluster import KMeans, DBSCAN
     from sklearn.decomposition import PCA
     from sklearn.preprocessing import StandardScaler
-    from sklearn.metrics.pairwise import cosine_similarity
 except ImportError:
     # Graceful fallback if ML deps not installed yet
     KMeans = None
     DBSCAN = None
     PCA = None
     StandardScaler = None
-    cosine_similarity = None
+
+
+def _stable_bucket(text: str, buckets: int = 100) -> float:
+    """hash(text) % buckets / buckets, but with CRC32 instead of Python's per-process salted hash."""
+    return (zlib.crc32(text.encode("utf-8")) % buckets) / buckets
 
 
 class AnalyticsService:
     def __init__(self, db_path: Path):
         self.db_path = db_path
+        self._matrices: Dict[str, EmbeddingMatrix] = {}
+        self._indexes: Dict[str, AnnIndex] = {}
+        self._filters: Dict[str, Dict[str, Any]] = {}
 
     def _get_conn(self) -> sqlite3.Connection:
-        return sqlite3.connect(self.db_path)
+        # Pooled, thread-bound connection; close() hands it back to the pool
+        return get_db(self.db_path)
+
+    def embedding_matrix(self, model_version: str = "v1") -> EmbeddingMatrix:
+        """Memory-mapped matrix for model_version, mapped once per service instance and kept in sync."""
+        matrix = self._matrices.get(model_version)
+        if matrix is None:
+            matrix = self._matrices.setdefault(model_version, EmbeddingMatrix(self.db_path, model_version))
+        return matrix
+
+    def similarity_index(self, model_version: str = "v1") -> AnnIndex:
+        index = self._indexes.get(model_version)
+        if index is None:
+            index = self._indexes.setdefault(model_version, AnnIndex(self.embedding_matrix(model_version)))
+        return index
+
+    def build_similarity_index(self, model_version: str = "v1") -> Dict[str, Any]:
+        """Full ANN index build for model_version (background job / CLI)."""
+        return self.similarity_index(model_version).build()
 
     # ========================
     # EMBEDDINGS
@@ -38,111 +73,137 @@ class AnalyticsService:
         self,
         track_ids: Optional[List[int]] = None,
         model_version: str = "v1",
-        force_recompute: bool = False
+        force_recompute: bool = False,
+        batch_size: int = EMBEDDING_BATCH,
+        on_progress: Optional[Callable[[int, int], None]] = None
     ) -> Dict[str, Any]:
         """
         Compute audio feature embeddings for tracks.
         For now, uses metadata-based features (placeholder).
         Future: integrate Essentia or librosa for acoustic features.
+
+        Tracks are read in id-ordered chunks, featurized as one matrix per chunk and
+        written with executemany; everything commits as a single transaction.
+        on_progress(done, total) is called after each chunk.
         """
+        started = time.perf_counter()
         conn = self._get_conn()
-        c = conn.cursor()
+        columns = "id, title, artist, album, genre, duration_ms, year"
+        missing = "" if force_recompute else (
+            " AND NOT EXISTS (SELECT 1 FROM track_embeddings e WHERE e.track_id = tracks.id AND e.model_version = ?)"
+        )
+        missing_args = () if force_recompute else (model_version,)
 
-        # If no track_ids provided, compute for all tracks without embeddings
         if track_ids is None:
-            if force_recompute:
-                c.execute("SELECT id FROM tracks")
-            else:
-                c.execute(
-                    "SELECT id FROM tracks WHERE id NOT IN (SELECT track_id FROM track_embeddings WHERE model_version = ?)",
-                    (model_version,)
-                )
-            track_ids = [row[0] for row in c.fetchall()]
-
-        computed_count = 0
-        for track_id in track_ids:
-            # Fetch track metadata
-            c.execute("SELECT title, artist, album, genre, duration_ms, year FROM tracks WHERE id = ?", (track_id,))
-            row = c.fetchone()
-            if not row:
-                continue
-
-            title, artist, album, genre, duration_ms, year = row
-
-            # Placeholder: simple feature vector from metadata
-            # Future: extract acoustic features (MFCCs, chroma, spectral)
-            embedding = self._extract_features(title, artist, album, genre, duration_ms, year)
-            embedding_json = json.dumps(embedding)
-
-            # Store or update embedding
-            c.execute(
-                """
-                INSERT OR REPLACE INTO track_embeddings (track_id, embedding_vector, model_version, dimensionality, computed_at)
-                VALUES (?, ?, ?, ?, ?)
-                """,
-                (track_id, embedding_json, model_version, len(embedding), datetime.utcnow().isoformat())
-            )
-            computed_count += 1
+            # If no track_ids provided, compute for all tracks (without embeddings unless forced)
+            total = conn.execute(f"SELECT COUNT(*) FROM tracks WHERE 1=1{missing}", missing_args).fetchone()[0]
+
+            def chunks():
+                last_id = 0
+                while True:
+                    rows = conn.execute(
+                        f"SELECT {columns} FROM tracks WHERE id > ?{missing} ORDER BY id LIMIT ?",
+                        (last_id,) + missing_args + (batch_size,)
+                    ).fetchall()
+                    if not rows:
+                        return
+                    last_id = rows[-1][0]
+                    yield rows
+        else:
+            total = len(track_ids)
 
-        conn.commit()
-        conn.close()
-        return {"computed": computed_count, "model_version": model_version}
+            def chunks():
+                # SQLite caps bound parameters; 900 ids per IN (...) stays under every build's limit
+                for start in range(0, len(track_ids), 900):
+                    part = track_ids[start:start + 900]
+                    yield conn.execute(
+                        f"SELECT {columns} FROM tracks WHERE id IN ({','.join('?' * len(part))})", part
+                    ).fetchall()
 
-    def compute_acoustic_features(self, track_ids: Optional[List[int]] = None) -> Dict[str, Any]:
-        """Stub for acoustic feature extraction using librosa (if installed)."""
+        computed_count = 0
         try:
-            import librosa  # type: ignore
-        except Exception:
-            return {"error": "librosa not installed"}
-        conn = self._get_conn()
-        c = conn.cursor()
-        if track_ids is None:
-            c.execute("SELECT id, path_audio FROM tracks WHERE path_audio IS NOT NULL")
-            rows = c.fetchall()
-        else:
-            placeholders = ",".join("?" * len(track_ids))
-            c.execute(f"SELECT id, path_audio FROM tracks WHERE id IN ({placeholders}) AND path_audio IS NOT NULL", track_ids)
-            rows = c.fetchall()
-        processed = 0
-        for tid, path_audio in rows:
-            try:
-                y, sr = librosa.load(path_audio, sr=22050, mono=True, duration=60)
-                mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13).mean(axis=1).tolist()
-                chroma = librosa.feature.chroma_stft(y=y, sr=sr).mean(axis=1).tolist()
-                spectral_centroid = [float(librosa.feature.spectral_centroid(y=y, sr=sr).mean())]
-                feat_vec = mfcc + chroma + spectral_centroid
-                c.execute(
+            for rows in chunks():
+                if not rows:
+                    continue
+                # Placeholder: simple feature vectors from metadata
+                # Future: extract acoustic features (MFCCs, chroma, spectral)
+                features = self._feature_matrix([r[1:] for r in rows])
+                computed_at = datetime.utcnow().isoformat()
+                # REPLACE assigns a new row id, which the matrix cache relies on
+                conn.executemany(
                     """
-                    INSERT OR REPLACE INTO track_embeddings (track_id, embedding_vector, model_version, dimensionality, computed_at)
+                    INSERT OR REPLACE INTO track_embeddings (track_id, embedding_blob, model_version, dimensionality, computed_at)
                     VALUES (?, ?, ?, ?, ?)
                     """,
-                    (tid, json.dumps(feat_vec), "acoustic_v1", len(feat_vec), datetime.utcnow().isoformat())
+                    [
+                        (row[0], vector.tobytes(), model_version, features.shape[1], computed_at)
+                        for row, vector in zip(rows, features)
+                    ]
                 )
-                processed += 1
-            except Exception:
-                continue
-        conn.commit()
-        conn.close()
-        return {"processed": processed, "model_version": "acoustic_v1"}
-
-    def _extract_features(self, title, artist, album, genre, duration_ms, year) -> List[float]:
+                computed_count += len(rows)
+                if on_progress:
+                    on_progress(computed_count, total)
+            conn.commit()
+        finally:
+            conn.close()  # rolls back a half-written run
+        self.embedding_matrix(model_version).mark_dirty()
+        elapsed = time.perf_counter() - started
+        return {
+            "computed": computed_count, "model_version": model_version, "elapsed_s": round(elapsed, 3),
+            "tracks_per_s": round(computed_count / elapsed, 1) if elapsed > 0 else None,
+        }
+
+    def compute_acoustic_features(
+        self,
+        track_ids: Optional[List[int]] = None,
+        force_recompute: bool = False,
+        workers: Optional[int] = None,
+        run_id: Optional[int] = None,
+    ) -> Dict[str, Any]:
         """
-        Placeholder feature extraction from metadata.
+        Acoustic features (MFCC, chroma, spectral centroid) via a process pool; see acoustic_service.
+        Pass run_id to resume an interrupted run from its checkpoint.
+        """
+        try:
+            import librosa  # type: ignore  # noqa: F401
+        except Exception:
+            return {"error": "librosa not installed"}
+        if run_id is None:
+            run_id = acoustic_service.create_run(self.db_path, track_ids, force_recompute, workers)
+        run = acoustic_service.run_analysis_job(
+            self.db_path, run_id, workers, on_done=self.embedding_matrix(acoustic_service.MODEL_VERSION).mark_dirty
+        )
+        return run or {"id": run_id, "status": "running"}
+
+    def _feature_matrix(self, rows: List[Tuple]) -> np.ndarray:
+        """
+        Placeholder metadata features for rows of (title, artist, album, genre, duration_ms, year),
+        built column-wise; returns an (n, 6) float32 matrix.
         Future: integrate audio analysis (Essentia, librosa).
         """
-        features = []
+        n = len(rows)
+        title, artist, album, genre, duration_ms, year = zip(*rows) if rows else ((),) * 6
+        features = np.empty((n, 6), dtype=EMBEDDING_DTYPE)
         # Duration (normalized to 0-1, assuming max 10 minutes)
-        features.append(min(1.0, (duration_ms or 0) / 600000))
+        duration = np.fromiter((d or 0 for d in duration_ms), dtype=np.float64, count=n)
+        features[:, 0] = np.minimum(1.0, duration / 600000)
         # Year (normalized to 0-1, assuming range 1950-2030)
-        features.append(min(1.0, max(0.0, ((year or 2000) - 1950) / 80)))
-        # Genre encoding (placeholder: hash to 0-1)
-        features.append((hash(genre or "") % 100) / 100.0)
+        years = np.fromiter((y or 2000 for y in year), dtype=np.float64, count=n)
+        features[:, 1] = np.clip((years - 1950) / 80, 0.0, 1.0)
+        # Genre encoding (placeholder: stable hash to 0-1, identical in every process)
+        genres = [g or "" for g in genre]
+        buckets = {g: _stable_bucket(g) for g in set(genres)}
+        features[:, 2] = np.fromiter((buckets[g] for g in genres), dtype=np.float64, count=n)
         # Title/artist/album embeddings (placeholder: length-based)
-        features.append(min(1.0, len(title or "") / 50))
-        features.append(min(1.0, len(artist or "") / 50))
-        features.append(min(1.0, len(album or "") / 50))
+        for column, values in ((3, title), (4, artist), (5, album)):
+            lengths = np.fromiter((len(v or "") for v in values), dtype=np.float64, count=n)
+            features[:, column] = np.minimum(1.0, lengths / 50)
         return features
 
+    def _extract_features(self, title, artist, album, genre, duration_ms, year) -> List[float]:
+        """Single-track form of _feature_matrix."""
+        return self._feature_matrix([(title, artist, album, genre, duration_ms, year)])[0].tolist()
+
     def get_embeddings(self, track_ids: Optional[List[int]] = None) -> List[Dict[str, Any]]:
         """Retrieve stored embeddings for tracks."""
         conn = self._get_conn()
@@ -151,20 +212,21 @@ class AnalyticsService:
         if track_ids:
             placeholders = ",".join("?" * len(track_ids))
             c.execute(
-                f"SELECT track_id, embedding_vector, model_version, dimensionality, computed_at FROM track_embeddings WHERE track_id IN ({placeholders})",
+                f"SELECT track_id, embedding_blob, embedding_vector, model_version, dimensionality, computed_at FROM track_embeddings WHERE track_id IN ({placeholders})",
                 track_ids
             )
         else:
-            c.execute("SELECT track_id, embedding_vector, model_version, dimensionality, computed_at FROM track_embeddings")
+            c.execute("SELECT track_id, embedding_blob, embedding_vector, model_version, dimensionality, computed_at FROM track_embeddings")
 
         results = []
         for row in c.fetchall():
+            vector = decode_vector(row[1], row[2])
             results.append({
                 "track_id": row[0],
-                "embedding": json.loads(row[1]),
-                "model_version": row[2],
-                "dimensionality": row[3],
-                "computed_at": row[4]
+                "embedding": vector.tolist() if vector is not None else None,
+                "model_version": row[3],
+                "dimensionality": row[4],
+                "computed_at": row[5]
             })
 
         conn.close()
@@ -178,7 +240,8 @@ class AnalyticsService:
         self,
         algorithm: str = "kmeans",
         n_clusters: int = 5,
-        force_recompute: bool = False
+        force_recompute: bool = False,
+        model_version: str = "v1"
     ) -> Dict[str, Any]:
         """
         Cluster tracks based on embeddings.
@@ -187,18 +250,13 @@ class AnalyticsService:
         if KMeans is None or DBSCAN is None:
             return {"error": "ML dependencies not installed. Install scikit-learn."}
 
-        conn = self._get_conn()
-        c = conn.cursor()
-
-        # Fetch all embeddings
-        c.execute("SELECT track_id, embedding_vector FROM track_embeddings")
-        rows = c.fetchall()
-        if not rows:
-            conn.close()
+        embeddings, ids, _ = self.embedding_matrix(model_version).view()
+        if not len(ids):
             return {"error": "No embeddings found. Compute embeddings first."}
+        track_ids = ids.tolist()
 
-        track_ids = [row[0] for row in rows]
-        embeddings = np.array([json.loads(row[1]) for row in rows])
+        conn = self._get_conn()
+        c = conn.cursor()
 
         # Normalize embeddings
         scaler = StandardScaler()
@@ -219,14 +277,16 @@ class AnalyticsService:
 
         # Store clusters
         timestamp = datetime.utcnow().isoformat()
-        for track_id, cluster_id, distance in zip(track_ids, labels, distances):
-            c.execute(
-                """
-                INSERT INTO track_clusters (track_id, cluster_id, algorithm, distance_to_centroid, computed_at)
-                VALUES (?, ?, ?, ?, ?)
-                """,
+        c.executemany(
+            """
+            INSERT INTO track_clusters (track_id, cluster_id, algorithm, distance_to_centroid, computed_at)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            [
                 (track_id, int(cluster_id), algorithm, float(distance), timestamp)
-            )
+                for track_id, cluster_id, distance in zip(track_ids, labels, distances)
+            ]
+        )
 
         conn.commit()
         conn.close()
@@ -262,50 +322,131 @@ class AnalyticsService:
     # SIMILARITY
     # ========================
 
-    def compute_similarity(self, track_id: int, top_n: int = 10) -> List[Dict[str, Any]]:
+    def _filter_columns(self, matrix: EmbeddingMatrix) -> Dict[str, Any]:
+        """BPM / key / genre per matrix row, cached for FILTER_CACHE_SECONDS (tags change rarely)."""
+        cached = self._filters.get(matrix.model_version)
+        now = time.monotonic()
+        if cached and cached["epoch"] == matrix.epoch and cached["count"] == matrix.count \
+                and now - cached["built_at"] < FILTER_CACHE_SECONDS:
+            return cached
+        conn = self._get_conn()
+        rows = conn.execute(
+            "SELECT t.id, COALESCE(a.bpm, t.bpm), a.key, LOWER(t.genre) FROM tracks t LEFT JOIN analysis_results a ON a.track_id = t.id"
+        ).fetchall()
+        conn.close()
+        codes: Dict[str, Dict[str, int]] = {"key": {}, "genre": {}}
+        track_ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        bpm = np.array([r[1] if r[1] is not None else np.nan for r in rows], dtype=np.float64)
+        keys = np.array([codes["key"].setdefault(r[2], len(codes["key"])) if r[2] else -1 for r in rows], dtype=np.int32)
+        genres = np.array([codes["genre"].setdefault(r[3], len(codes["genre"])) if r[3] else -1 for r in rows], dtype=np.int32)
+        # Align with matrix rows; rows without a tracks entry never pass a filter
+        ids = matrix.track_ids
+        cached = {
+            "epoch": matrix.epoch, "count": matrix.count, "built_at": now, "codes": codes,
+            "bpm": np.full(len(ids), np.nan), "key": np.full(len(ids), -1, dtype=np.int32),
+            "genre": np.full(len(ids), -1, dtype=np.int32),
+        }
+        if rows:
+            order = np.argsort(track_ids)
+            pos = np.minimum(np.searchsorted(track_ids[order], ids), len(order) - 1)
+            found = track_ids[order][pos] == ids
+            src = order[pos[found]]
+            cached["bpm"][found] = bpm[src]
+            cached["key"][found] = keys[src]
+            cached["genre"][found] = genres[src]
+        self._filters[matrix.model_version] = cached
+        return cached
+
+    def _filter_mask(
+        self,
+        matrix: EmbeddingMatrix,
+        bpm_min: Optional[float],
+        bpm_max: Optional[float],
+        key: Optional[str],
+        genre: Optional[str]
+    ) -> Optional[np.ndarray]:
+        """Boolean row mask for the optional BPM range / key / genre filter (None = no filter)."""
+        if bpm_min is None and bpm_max is None and not key and not genre:
+            return None
+        columns = self._filter_columns(matrix)
+        mask = np.ones(matrix.count, dtype=bool)
+        if bpm_min is not None:
+            mask &= columns["bpm"] >= bpm_min
+        if bpm_max is not None:
+            mask &= columns["bpm"] <= bpm_max
+        if key:
+            mask &= columns["key"] == columns["codes"]["key"].get(key, -2)
+        if genre:
+            mask &= columns["genre"] == columns["codes"]["genre"].get(genre.lower(), -2)
+        return mask
+
+    def compute_similarity(
+        self,
+        track_id: int,
+        top_n: int = 10,
+        bpm_min: Optional[float] = None,
+        bpm_max: Optional[float] = None,
+        key: Optional[str] = None,
+        genre: Optional[str] = None,
+        exact: bool = False
+    ) -> List[Dict[str, Any]]:
         """
-        Compute similarity between a track and all other tracks.
-        Returns top N most similar tracks.
+        Compute similarity between a track and the other tracks of its embedding model.
+        Returns top N most similar tracks, optionally restricted by BPM range, key and genre.
+        Large libraries are served from the ANN index (exact=True forces a full scan).
         """
-        if cosine_similarity is None:
-            return []
-
         conn = self._get_conn()
-        c = conn.cursor()
-
-        # Get target embedding
-        c.execute("SELECT embedding_vector FROM track_embeddings WHERE track_id = ?", (track_id,))
-        row = c.fetchone()
+        row = conn.execute("SELECT model_version FROM track_embeddings WHERE track_id = ?", (track_id,)).fetchone()
+        conn.close()
         if not row:
-            conn.close()
             return []
 
-        target_embedding = np.array(json.loads(row[0])).reshape(1, -1)
-
-        # Get all other embeddings
-        c.execute("SELECT track_id, embedding_vector FROM track_embeddings WHERE track_id != ?", (track_id,))
-        rows = c.fetchall()
-        if not rows:
-            conn.close()
+        matrix = self.embedding_matrix(row[0])
+        embeddings, ids, norms = matrix.view()
+        target = matrix.row_of(track_id)
+        if target is None or len(ids) < 2 or top_n <= 0:
+            return []
+        query = embeddings[target]
+        mask = self._filter_mask(matrix, bpm_min, bpm_max, key, genre)
+        allowed = len(ids) if mask is None else int(mask.sum())
+
+        candidates = None
+        if not exact and allowed >= ANN_MIN_ROWS:
+            index = self.similarity_index(row[0])
+            if index.refresh():
+                # Oversample by the filter's selectivity so enough candidates survive it
+                k = int((top_n + 1) * max(1.0, len(ids) / allowed) * 2)
+                rows = index.candidates(query, k)
+                rows = rows[rows < len(ids)]
+                if mask is not None:
+                    rows = rows[mask[rows]]
+                rows = rows[rows != target]
+                if len(rows) >= top_n:
+                    candidates = rows
+            else:
+                build_in_background(index)
+        if candidates is None:
+            # Exact scan: one matrix-vector product over the mapped matrix (or the filtered rows)
+            candidates = np.flatnonzero(mask) if mask is not None else None
+
+        if candidates is None:
+            similarities = (embeddings @ query) / np.maximum(norms * norms[target], 1e-12)
+            similarities[target] = -np.inf
+            candidates = np.arange(len(ids))
+        else:
+            candidates = candidates[candidates != target]
+            similarities = (embeddings[candidates] @ query) / np.maximum(norms[candidates] * norms[target], 1e-12)
+        if not len(candidates):
             return []
 
-        other_ids = [row[0] for row in rows]
-        other_embeddings = np.array([json.loads(row[1]) for row in rows])
-
-        # Compute cosine similarity
-        similarities = cosine_similarity(target_embedding, other_embeddings)[0]
-
-        # Sort and get top N
-        top_indices = np.argsort(similarities)[-top_n:][::-1]
-        results = []
-        for idx in top_indices:
-            results.append({
-                "track_id": other_ids[idx],
-                "similarity_score": float(similarities[idx])
-            })
-
-        conn.close()
-        return results
+        # Partial sort: only the top N are ordered
+        k = min(top_n, len(candidates) - (1 if len(candidates) == len(ids) else 0))
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+        return [
+            {"track_id": int(ids[candidates[i]]), "similarity_score": float(similarities[i])}
+            for i in top
+        ]
 
     # ========================
     # LIBRARY STATS
@@ -381,24 +522,17 @@ class AnalyticsService:
     # DIMENSIONALITY REDUCTION (for visualization)
     # ========================
 
-    def reduce_dimensions(self, n_components: int = 2) -> List[Dict[str, Any]]:
+    def reduce_dimensions(self, n_components: int = 2, model_version: str = "v1") -> List[Dict[str, Any]]:
         """
         Reduce embeddings to 2D or 3D for visualization using PCA.
         """
         if PCA is None:
             return []
 
-        conn = self._get_conn()
-        c = conn.cursor()
-
-        c.execute("SELECT track_id, embedding_vector FROM track_embeddings")
-        rows = c.fetchall()
-        if not rows:
-            conn.close()
+        embeddings, ids, _ = self.embedding_matrix(model_version).view()
+        if not len(ids):
             return []
-
-        track_ids = [row[0] for row in rows]
-        embeddings = np.array([json.loads(row[1]) for row in rows])
+        track_ids = ids.tolist()
 
         # PCA
         pca = PCA(n_components=n_components)
@@ -413,5 +547,4 @@ class AnalyticsService:
                 "z": float(coords[2]) if n_components == 3 else None
             })
 
-        conn.close()
         return results
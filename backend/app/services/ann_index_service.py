@@ -0,0 +1,354 @@
+"""
+Approximate nearest-neighbour index over an EmbeddingMatrix (cosine similarity).
+"""
+from pathlib import Path
+from typing import Any, Dict, Optional
+import argparse
+import json
+import math
+import os
+import threading
+import time
+import numpy as np
+
+from ..utils.db_utils import get_db, init_db
+from .embedding_store import EmbeddingMatrix
+
+# Optional HNSW libraries; the pure-NumPy IVF index is the fallback
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+DB_PATH = Path('library/db/library.sqlite').resolve()
+ANN_BACKEND = os.getenv("UNCHAINED_ANN_BACKEND")  # hnsw | faiss | ivf; default: best available
+ANN_MIN_ROWS = 20000  # below this a brute-force scan is already sub-millisecond
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+IVF_NPROBE = 32
+IVF_TRAIN_ITERATIONS = 10
+BUILD_CHUNK = 65536
+
+# Backends index L2-normalised rows of the matrix under their row number and only
+# propose candidates; AnnIndex re-scores candidates exactly against the matrix, so a
+# backend may return extra or stale entries (faiss HNSW cannot update in place).
+# An index belongs to one matrix epoch; a matrix rebuild renumbers rows and makes
+# the index stale until it is rebuilt. Changes within an epoch are added incrementally.
+
+
+def _normalized(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class _HnswBackend:
+    name = "hnsw"
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.index = hnswlib.Index(space="ip", dim=dim)
+
+    def build(self, chunks, count: int):
+        self.index.init_index(max_elements=max(1024, int(count * 1.25)), ef_construction=HNSW_EF_CONSTRUCTION, M=HNSW_M)
+        for vectors, rows in chunks:
+            self.index.add_items(vectors, rows)
+        self.index.set_ef(HNSW_EF_SEARCH)
+
+    def add(self, vectors: np.ndarray, rows: np.ndarray):
+        needed = self.index.get_current_count() + len(rows)
+        if needed > self.index.get_max_elements():
+            self.index.resize_index(int(needed * 1.5))
+        self.index.add_items(vectors, rows)  # existing labels are updated in place
+
+    def search(self, query: np.ndarray, k: int) -> np.ndarray:
+        k = min(k, self.index.get_current_count())
+        self.index.set_ef(max(HNSW_EF_SEARCH, k))
+        labels, _ = self.index.knn_query(query[None, :], k=k)
+        return labels[0].astype(np.int64)
+
+    def save(self, path: Path):
+        self.index.save_index(str(path))
+
+    def load(self, path: Path):
+        self.index.load_index(str(path))
+        self.index.set_ef(HNSW_EF_SEARCH)
+
+
+class _FaissBackend:
+    name = "faiss"
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.index = None
+
+    def _hnsw(self):
+        return faiss.downcast_index(self.index.index).hnsw
+
+    def build(self, chunks, count: int):
+        base = faiss.IndexHNSWFlat(self.dim, HNSW_M * 2, faiss.METRIC_INNER_PRODUCT)
+        base.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        self.index = faiss.IndexIDMap2(base)
+        for vectors, rows in chunks:
+            self.index.add_with_ids(vectors, rows.astype(np.int64))
+        self._hnsw().efSearch = HNSW_EF_SEARCH
+
+    def add(self, vectors: np.ndarray, rows: np.ndarray):
+        self.index.add_with_ids(vectors, rows.astype(np.int64))
+
+    def search(self, query: np.ndarray, k: int) -> np.ndarray:
+        self._hnsw().efSearch = max(HNSW_EF_SEARCH, k)
+        _, labels = self.index.search(query[None, :], min(k, self.index.ntotal))
+        return labels[0][labels[0] >= 0]
+
+    def save(self, path: Path):
+        faiss.write_index(self.index, str(path))
+
+    def load(self, path: Path):
+        self.index = faiss.read_index(str(path))
+        self._hnsw().efSearch = HNSW_EF_SEARCH
+
+
+class _IVFBackend:
+    """Inverted file index: k-means centroids, rows bucketed by nearest centroid,
+    and a query scans the rows of its IVF_NPROBE closest buckets."""
+    name = "ivf"
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.centroids = np.empty((0, dim), dtype=np.float32)
+        self.assign = np.empty(0, dtype=np.int32)  # row -> bucket (-1 = not indexed)
+        self.trained_count = 0
+        self._order = self._offsets = None
+
+    def _nearest(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+
+    def _train(self, sample: np.ndarray, nlist: int):
+        rng = np.random.default_rng(0)
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(IVF_TRAIN_ITERATIONS):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            counts = np.bincount(labels, minlength=nlist)
+            order = np.argsort(labels, kind="stable")
+            sums = np.zeros_like(centroids)
+            present = counts > 0
+            sums[present] = np.add.reduceat(sample[order], np.concatenate([[0], np.cumsum(counts)[:-1]])[present])
+            empty = counts == 0
+            if empty.any():  # re-seed empty buckets from random points
+                sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = _normalized(sums)
+        self.centroids = centroids
+
+    def build(self, chunks, count: int):
+        chunks = list(chunks)
+        vectors = np.concatenate([v for v, _ in chunks]) if chunks else np.empty((0, self.dim), np.float32)
+        rows = np.concatenate([r for _, r in chunks]) if chunks else np.empty(0, np.int64)
+        nlist = max(1, min(int(4 * math.sqrt(len(rows))), len(rows) // 32 or 1))
+        rng = np.random.default_rng(0)
+        sample = vectors[rng.choice(len(vectors), min(len(vectors), nlist * 64), replace=False)]
+        self._train(sample, nlist)
+        self.assign = np.full(int(rows.max()) + 1 if len(rows) else 0, -1, dtype=np.int32)
+        for start in range(0, len(rows), BUILD_CHUNK):
+            self.assign[rows[start:start + BUILD_CHUNK]] = self._nearest(vectors[start:start + BUILD_CHUNK])
+        self.trained_count = len(rows)
+        self._order = None
+
+    def add(self, vectors: np.ndarray, rows: np.ndarray):
+        top = int(rows.max()) + 1
+        if top > len(self.assign):
+            self.assign = np.concatenate([self.assign, np.full(top - len(self.assign), -1, dtype=np.int32)])
+        self.assign[rows] = self._nearest(vectors)
+        self._order = None
+
+    def _buckets(self):
+        if self._order is None:
+            indexed = np.flatnonzero(self.assign >= 0)
+            self._order = indexed[np.argsort(self.assign[indexed], kind="stable")]
+            counts = np.bincount(self.assign[indexed], minlength=len(self.centroids))
+            self._offsets = np.concatenate([[0], np.cumsum(counts)])
+        return self._order, self._offsets
+
+    def search(self, query: np.ndarray, k: int) -> np.ndarray:
+        order, offsets = self._buckets()
+        scores = self.centroids @ query
+        nprobe = min(len(scores), IVF_NPROBE)
+        probe = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        return np.concatenate([order[offsets[b]:offsets[b + 1]] for b in probe])
+
+    @property
+    def stale(self) -> bool:
+        # Buckets drift as the library grows past what the centroids were trained on
+        return int((self.assign >= 0).sum()) > 2 * max(1, self.trained_count)
+
+    def save(self, path: Path):
+        with open(path, "wb") as f:
+            np.savez(f, centroids=self.centroids, assign=self.assign, trained_count=self.trained_count)
+
+    def load(self, path: Path):
+        with np.load(path) as data:
+            self.centroids = data["centroids"]
+            self.assign = data["assign"]
+            self.trained_count = int(data["trained_count"])
+        self._order = None
+
+
+def available_backend(preferred: Optional[str] = None) -> str:
+    preferred = preferred or ANN_BACKEND
+    if preferred == "hnsw" and hnswlib is not None:
+        return "hnsw"
+    if preferred == "faiss" and faiss is not None:
+        return "faiss"
+    if preferred == "ivf":
+        return "ivf"
+    if hnswlib is not None:
+        return "hnsw"
+    if faiss is not None:
+        return "faiss"
+    return "ivf"
+
+
+_BACKENDS = {"hnsw": _HnswBackend, "faiss": _FaissBackend, "ivf": _IVFBackend}
+
+
+class AnnIndex:
+    """Persistent ANN index for one EmbeddingMatrix (one model_version)."""
+
+    def __init__(self, matrix: EmbeddingMatrix, backend: Optional[str] = None):
+        self.matrix = matrix
+        self.backend_name = available_backend(backend)
+        self._index_path = matrix.cache_dir / f"{matrix.stem}.ann.{self.backend_name}"
+        self._meta_path = matrix.cache_dir / f"{matrix.stem}.ann.json"
+        self._backend = None
+        self.epoch = None
+        self.last_id = 0
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._loaded = False
+
+    @property
+    def ready(self) -> bool:
+        return self._backend is not None and self.epoch == self.matrix.epoch
+
+    def _chunks(self, rows: Optional[np.ndarray] = None):
+        data = self.matrix.matrix
+        if rows is None:
+            rows = np.arange(self.matrix.count, dtype=np.int64)
+        for start in range(0, len(rows), BUILD_CHUNK):
+            part = rows[start:start + BUILD_CHUNK]
+            yield _normalized(data[part]), part
+
+    def build(self) -> Dict[str, Any]:
+        """Full (re)build; runs off the query path and swaps the new index in when done."""
+        with self._build_lock:
+            started = time.perf_counter()
+            with self.matrix.lock:
+                self.matrix.sync(force=True)
+                epoch, last_id, count, dim = self.matrix.epoch, self.matrix.last_id, self.matrix.count, self.matrix.dim
+            if count == 0:
+                return {"backend": self.backend_name, "indexed": 0}
+            backend = _BACKENDS[self.backend_name](dim)
+            backend.build(self._chunks(np.arange(count, dtype=np.int64)), count)
+            with self._lock:
+                self._backend, self.epoch, self.last_id = backend, epoch, last_id
+                self._loaded = True
+                self.save()
+                self._catch_up()
+            return {
+                "backend": self.backend_name, "model_version": self.matrix.model_version, "indexed": count,
+                "elapsed_s": round(time.perf_counter() - started, 3),
+            }
+
+    def save(self):
+        with self._lock:
+            if self._backend is None:
+                return
+            self.matrix.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp = self._index_path.with_suffix(self._index_path.suffix + ".tmp")
+            self._backend.save(tmp)
+            os.replace(tmp, self._index_path)
+            self._meta_path.write_text(json.dumps({
+                "backend": self.backend_name, "epoch": self.epoch, "last_id": self.last_id, "dim": self._backend.dim,
+            }))
+
+    def _load(self):
+        self._loaded = True
+        try:
+            meta = json.loads(self._meta_path.read_text())
+            if meta.get("backend") != self.backend_name or meta.get("epoch") != self.matrix.epoch:
+                return
+            backend = _BACKENDS[self.backend_name](meta["dim"])
+            backend.load(self._index_path)
+        except (OSError, ValueError, KeyError, RuntimeError):
+            return
+        self._backend, self.epoch, self.last_id = backend, meta["epoch"], meta["last_id"]
+
+    def _catch_up(self):
+        """Index embeddings written since the index last saw the matrix (same epoch only)."""
+        if self.matrix.last_id <= self.last_id:
+            return
+        db = get_db(self.matrix.db_path)
+        changed = db.execute(
+            "SELECT track_id FROM track_embeddings WHERE model_version=? AND id > ? AND id <= ? AND embedding_blob IS NOT NULL",
+            (self.matrix.model_version, self.last_id, self.matrix.last_id)
+        ).fetchall()
+        rows = np.array([r for r in (self.matrix.row_of(t) for (t,) in changed) if r is not None], dtype=np.int64)
+        for vectors, part in self._chunks(rows):
+            self._backend.add(vectors, part)
+        self.last_id = self.matrix.last_id
+
+    def refresh(self) -> bool:
+        """Sync the matrix and fold new embeddings into the index. False if it needs a rebuild."""
+        with self._lock:
+            self.matrix.sync()
+            if not self._loaded:
+                self._load()
+            if not self.ready:
+                return False
+            self._catch_up()
+            return not getattr(self._backend, "stale", False)
+
+    def candidates(self, query: np.ndarray, k: int) -> np.ndarray:
+        """Candidate rows for a (raw) query vector; the caller scores them exactly."""
+        with self._lock:
+            return np.unique(self._backend.search(_normalized(query[None, :])[0], k))
+
+
+_building: set = set()
+_building_lock = threading.Lock()
+
+
+def build_in_background(index: AnnIndex) -> bool:
+    """Start a daemon build thread for index unless one is already running."""
+    key = id(index)
+    with _building_lock:
+        if key in _building:
+            return False
+        _building.add(key)
+
+    def run():
+        try:
+            index.build()
+        finally:
+            with _building_lock:
+                _building.discard(key)
+    threading.Thread(target=run, name=f"ann-build-{index.matrix.model_version}", daemon=True).start()
+    return True
+
+
+if __name__ == '__main__':
+    # python -m backend.app.services.ann_index_service [--model-version v1] [--backend hnsw|faiss|ivf]
+    parser = argparse.ArgumentParser(description="Build the ANN similarity index for a model version")
+    parser.add_argument("--model-version", default="v1")
+    parser.add_argument("--backend", default=None)
+    parser.add_argument("--db", default=str(DB_PATH))
+    args = parser.parse_args()
+    target = Path(args.db).resolve()
+    init_db(target)
+    print(AnnIndex(EmbeddingMatrix(target, args.model_version), args.backend).build())
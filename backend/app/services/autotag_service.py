@@ -0,0 +1,363 @@
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from rapidfuzz import fuzz, utils as fuzz_utils
+from ..utils.db_utils import get_db, init_db
+from ..utils.http_utils import run_sync
+from .metadata_quality_service import gather_candidates, merge_missing, derive_temp_ref
+from .cover_service import fetch_cover
+from .metadata_provenance_service import attribution_rows, insert_attributions
+from .event_service import publish
+
+DB_PATH = Path('library/db/library.sqlite').resolve()
+AUTOTAG_CONCURRENCY = 8
+AUTOTAG_CHUNK = 100
+MIN_SCORE_DEFAULT = 0.85
+RUN_LEASE_SECONDS = 120.0
+RUN_HEARTBEAT_SECONDS = 30.0
+
+# Library-wide auto-tagging: walk tracks with missing fields in id order, look up
+# candidates for a chunk of them concurrently, and write every fill-in, candidate
+# and attribution row of the chunk in one transaction together with the run's
+# last_track_id checkpoint. A crashed or stopped run resumes after the last
+# committed chunk; re-running a chunk is harmless because only empty fields are filled.
+# The process executing a run holds a lease on it (owner token, renewed by a
+# heartbeat) and every checkpoint is conditional on it, so the API and a CLI
+# --resume never advance the same run. A resumed run keeps the min_score, sources
+# and limit it was created with.
+
+MISSING_PREDICATE = (
+    "(title IS NULL OR title='' OR artist IS NULL OR artist='' OR album IS NULL OR album='' OR year IS NULL)"
+)
+TRACK_COLUMNS = ["id", "title", "artist", "album", "year", "duration_ms", "path_cover", "path_audio"]
+
+def _run_row(row) -> Dict[str, Any]:
+    keys = ["id", "status", "min_score", "sources", "track_limit", "last_track_id", "processed", "applied",
+            "skipped", "failed", "error", "created_at", "updated_at", "finished_at"]
+    run = dict(zip(keys, row))
+    run["sources"] = json.loads(run["sources"]) if run["sources"] else None
+    return run
+
+
+def create_run(db_path: Path, min_score: float = MIN_SCORE_DEFAULT, sources: Optional[List[str]] = None, limit: Optional[int] = None) -> int:
+    db = get_db(db_path)
+    cur = db.execute(
+        """
+        INSERT INTO autotag_runs (status, min_score, sources, track_limit, created_at, updated_at)
+        VALUES ('queued', ?, ?, ?, datetime('now'), datetime('now'))
+        """,
+        (min_score, json.dumps(sources) if sources else None, limit)
+    )
+    db.commit()
+    return cur.lastrowid
+
+
+def get_run(db_path: Path, run_id: int) -> Optional[Dict[str, Any]]:
+    db = get_db(db_path)
+    row = db.execute(
+        "SELECT id, status, min_score, sources, track_limit, last_track_id, processed, applied, skipped, failed, "
+        "error, created_at, updated_at, finished_at FROM autotag_runs WHERE id=?",
+        (run_id,)
+    ).fetchone()
+    return _run_row(row) if row else None
+
+
+def resumable_run(db_path: Path) -> Optional[int]:
+    """Most recent run that was queued or interrupted mid-way."""
+    db = get_db(db_path)
+    row = db.execute("SELECT id FROM autotag_runs WHERE status IN ('queued', 'running') ORDER BY id DESC LIMIT 1").fetchone()
+    return row[0] if row else None
+
+
+def claim_run(db_path: Path, run_id: int) -> Optional[str]:
+    """Atomically take a queued run (or one whose lease lapsed); returns the owner token."""
+    owner = uuid.uuid4().hex
+    now = time.time()
+    db = get_db(db_path)
+    cur = db.execute(
+        """
+        UPDATE autotag_runs SET status='running', lease_owner=?, lease_expires_at=?, updated_at=datetime('now')
+        WHERE id=? AND (status='queued' OR (status='running' AND (lease_expires_at IS NULL OR lease_expires_at < ?)))
+        """,
+        (owner, now + RUN_LEASE_SECONDS, run_id, now)
+    )
+    db.commit()
+    return owner if cur.rowcount else None
+
+
+def _renew_lease(db_path: Path, run_id: int, owner: str) -> bool:
+    db = get_db(db_path)
+    cur = db.execute(
+        "UPDATE autotag_runs SET lease_expires_at=? WHERE id=? AND lease_owner=? AND status='running'",
+        (time.time() + RUN_LEASE_SECONDS, run_id, owner)
+    )
+    db.commit()
+    return cur.rowcount > 0
+
+
+async def _heartbeat(db_path: Path, run_id: int, owner: str):
+    while True:
+        await asyncio.sleep(RUN_HEARTBEAT_SECONDS)
+        if not await asyncio.to_thread(_renew_lease, db_path, run_id, owner):
+            return
+
+
+def run_params_differ(run: Dict[str, Any], min_score: Optional[float], sources: Optional[List[str]], limit: Optional[int]) -> List[str]:
+    """Names of the requested parameters that disagree with an existing run's (None = not requested)."""
+    differ = []
+    if min_score is not None and min_score != run["min_score"]:
+        differ.append("min_score")
+    if sources is not None and sorted(sources) != sorted(run["sources"] or []):
+        differ.append("sources")
+    if limit is not None and limit != run["track_limit"]:
+        differ.append("limit")
+    return differ
+
+
+def cancel_run(db_path: Path, run_id: int) -> bool:
+    db = get_db(db_path)
+    cur = db.execute(
+        "UPDATE autotag_runs SET status='cancelled', updated_at=datetime('now') WHERE id=? AND status IN ('queued', 'running')",
+        (run_id,)
+    )
+    db.commit()
+    return cur.rowcount > 0
+
+
+def match_score(track: Dict[str, Any], cand: Dict[str, Any]) -> float:
+    """0..1 agreement between what the track already has and the candidate (weakest of title/artist).
+    A field the track has but the candidate did not return scores 0, so a title-only
+    candidate never confirms a track whose artist is known."""
+    ratios = [
+        fuzz.token_set_ratio(track[f], cand[f], processor=fuzz_utils.default_process) if cand.get(f) else 0.0
+        for f in ("title", "artist") if track.get(f)
+    ]
+    return min(ratios) / 100.0 if ratios else 0.0
+
+
+async def _tag_track(
+    track: Dict[str, Any],
+    sources: Optional[List[str]],
+    discogs_token: Optional[str],
+    min_score: float,
+    sem: asyncio.Semaphore,
+) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]], float, Optional[str]]:
+    """(track, chosen candidate or None, match score, cover path)."""
+    async with sem:
+        candidates, _ = await gather_candidates(
+            track["artist"], track["album"], track["title"], discogs_token=discogs_token, sources=sources
+        )
+    best, best_key = None, (0.0, 0.0)
+    for cand in candidates:
+        if not merge_missing(track, cand) and not (cand.get("cover_url") and not track["path_cover"]):
+            continue
+        key = (match_score(track, cand), cand.get("score") or 0.0)
+        if key > best_key:
+            best, best_key = cand, key
+    if best is None or best_key[0] < min_score:
+        return track, None, best_key[0], None
+    cover = None
+    if best.get("cover_url") and not track["path_cover"]:
+        cover = await fetch_cover(track["id"], best["cover_url"]) or None
+    return track, best, best_key[0], cover
+
+
+def _write_chunk(db_path: Path, run_id: int, owner: str, results: List[Any], last_track_id: int) -> bool:
+    """Commit a chunk with the run's checkpoint; False (nothing written) if the lease was lost."""
+    db = get_db(db_path)
+    track_updates = []
+    attributions = []
+    applied = skipped = failed = 0
+    for result in results:
+        if isinstance(result, BaseException):
+            failed += 1
+            continue
+        track, cand, confidence, cover = result
+        if cand is None:
+            skipped += 1
+            continue
+        updates = merge_missing(track, cand)
+        if cover:
+            updates["path_cover"] = cover
+        cur = db.execute(
+            """
+            INSERT INTO metadata_candidates (temp_track_ref, source, title, artist, album, year, length_ms, cover_url, score, applied, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 1, datetime('now'))
+            """,
+            (
+                derive_temp_ref(track["path_audio"] or str(track["id"])), cand.get("source"), cand.get("title"), cand.get("artist"),
+                cand.get("album"), cand.get("year"), cand.get("length_ms"), cand.get("cover_url"), cand.get("score"),
+            )
+        )
+        track_updates.append((
+            updates.get("title"), updates.get("artist"), updates.get("album"), updates.get("year"),
+            updates.get("duration_ms"), updates.get("path_cover"), track["id"],
+        ))
+        attributions.extend(attribution_rows(track["id"], updates, cand.get("source"), cur.lastrowid, confidence))
+        applied += 1
+    # Checkpoint first: if another process took the run over, nothing of this chunk is written
+    cur = db.execute(
+        """
+        UPDATE autotag_runs SET last_track_id=?, processed=processed+?, applied=applied+?, skipped=skipped+?,
+            failed=failed+?, lease_expires_at=?, updated_at=datetime('now')
+        WHERE id=? AND lease_owner=? AND status='running'
+        """,
+        (last_track_id, len(results), applied, skipped, failed, time.time() + RUN_LEASE_SECONDS, run_id, owner)
+    )
+    if not cur.rowcount:
+        db.rollback()
+        return False
+    # Fill-only: a field someone set since the chunk was read is left alone
+    db.executemany(
+        """
+        UPDATE tracks SET title=COALESCE(NULLIF(title, ''), ?), artist=COALESCE(NULLIF(artist, ''), ?),
+            album=COALESCE(NULLIF(album, ''), ?), year=COALESCE(NULLIF(year, ''), ?), duration_ms=COALESCE(NULLIF(duration_ms, ''), ?),
+            path_cover=COALESCE(NULLIF(path_cover, ''), ?)
+        WHERE id=?
+        """,
+        track_updates
+    )
+    insert_attributions(db, attributions)
+    db.commit()
+    return True
+
+
+def _start_run(db_path: Path, run_id: int) -> Optional[Tuple[Dict[str, Any], int, str]]:
+    """Claim the run; (run, total tracks, owner token) or None if it is finished or held by another process."""
+    owner = claim_run(db_path, run_id)
+    if owner is None:
+        return None
+    db = get_db(db_path)
+    run = get_run(db_path, run_id)
+    remaining = db.execute(
+        f"SELECT COUNT(*) FROM tracks WHERE id > ? AND {MISSING_PREDICATE}", (run["last_track_id"],)
+    ).fetchone()[0]
+    total = run["processed"] + remaining
+    if run["track_limit"]:
+        total = min(total, run["track_limit"])
+    return run, total, owner
+
+
+def _next_chunk(db_path: Path, run_id: int, owner: str, last_id: int, size: int) -> Optional[List[Dict[str, Any]]]:
+    """The next tracks to tag; None once the run was cancelled or taken over, [] (and the run marked done) at the end."""
+    db = get_db(db_path)
+    status, lease_owner = db.execute("SELECT status, lease_owner FROM autotag_runs WHERE id=?", (run_id,)).fetchone()
+    if status != "running" or lease_owner != owner:
+        return None
+    rows = db.execute(
+        f"SELECT {', '.join(TRACK_COLUMNS)} FROM tracks WHERE id > ? AND {MISSING_PREDICATE} ORDER BY id LIMIT ?",
+        (last_id, size)
+    ).fetchall() if size > 0 else []
+    if not rows:
+        db.execute(
+            "UPDATE autotag_runs SET status='done', lease_owner=NULL, lease_expires_at=NULL, "
+            "updated_at=datetime('now'), finished_at=datetime('now') WHERE id=? AND status='running' AND lease_owner=?",
+            (run_id, owner)
+        )
+        db.commit()
+    return [dict(zip(TRACK_COLUMNS, r)) for r in rows]
+
+
+async def autotag_library(
+    db_path: Path,
+    run_id: int,
+    discogs_token: Optional[str] = None,
+    concurrency: int = AUTOTAG_CONCURRENCY,
+    chunk_size: int = AUTOTAG_CHUNK,
+    on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    # SQLite work runs in threads: this coroutine shares the HTTP bridge loop with every
+    # other run_sync caller, and a chunk write must not stall their lookups
+    started = await asyncio.to_thread(_start_run, db_path, run_id)
+    if started is None:
+        return await asyncio.to_thread(get_run, db_path, run_id)
+    run, total, owner = started
+    heartbeat = asyncio.create_task(_heartbeat(db_path, run_id, owner))
+    try:
+        sem = asyncio.Semaphore(concurrency)
+        last_id = run["last_track_id"]
+        processed = run["processed"]
+        while True:
+            size = chunk_size if not run["track_limit"] else min(chunk_size, run["track_limit"] - processed)
+            tracks = await asyncio.to_thread(_next_chunk, db_path, run_id, owner, last_id, size)
+            if not tracks:
+                break
+            results = await asyncio.gather(
+                *(_tag_track(t, run["sources"], discogs_token, run["min_score"], sem) for t in tracks),
+                return_exceptions=True
+            )
+            last_id = tracks[-1]["id"]
+            processed += len(tracks)
+            if not await asyncio.to_thread(_write_chunk, db_path, run_id, owner, results, last_id):
+                break
+            if on_progress:
+                progress = await asyncio.to_thread(get_run, db_path, run_id)
+                progress["total"] = total
+                on_progress(progress)
+    except Exception as e:
+        await asyncio.to_thread(_fail_run, db_path, run_id, owner, str(e))
+        raise
+    finally:
+        heartbeat.cancel()
+    return await asyncio.to_thread(get_run, db_path, run_id)
+
+
+def _fail_run(db_path: Path, run_id: int, owner: str, error: str):
+    db = get_db(db_path)
+    db.execute(
+        "UPDATE autotag_runs SET status='error', error=?, lease_owner=NULL, updated_at=datetime('now') "
+        "WHERE id=? AND lease_owner=?",
+        (error, run_id, owner)
+    )
+    db.commit()
+
+
+def run_autotag_job(db_path: Path, run_id: int, discogs_token: Optional[str] = None, concurrency: int = AUTOTAG_CONCURRENCY):
+    """BackgroundTasks / CLI entry point; progress is published as SSE events."""
+    def progress(run: Dict[str, Any]):
+        publish({
+            "type": "import_progress", "progress": run["processed"] / max(1, run["total"]), "track_id": None,
+            "message": f"Auto-tag: {run['processed']}/{run['total']} checked, {run['applied']} tagged",
+        })
+    try:
+        result = run_sync(autotag_library(db_path, run_id, discogs_token, concurrency=concurrency, on_progress=progress))
+    except Exception as e:
+        publish({"type": "info", "track_id": None, "message": f"Auto-tag failed: {e}"})
+        return None
+    if result and result["status"] == "done":
+        publish({
+            "type": "info", "track_id": None,
+            "message": f"Auto-tag finished: {result['applied']} tagged, {result['skipped']} without a confident match",
+        })
+    return result
+
+
+if __name__ == '__main__':
+    # python -m backend.app.services.autotag_service [--min-score 0.85] [--sources musicbrainz discogs] [--resume]
+    parser = argparse.ArgumentParser(description="Auto-tag library tracks with missing metadata")
+    parser.add_argument("--min-score", type=float, default=None,
+                        help=f"minimum title/artist match (0-1) to apply (default {MIN_SCORE_DEFAULT})")
+    parser.add_argument("--sources", nargs="*", default=None, help="metadata sources (default: all registered)")
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many tracks")
+    parser.add_argument("--concurrency", type=int, default=AUTOTAG_CONCURRENCY)
+    parser.add_argument("--discogs-token", default=None)
+    parser.add_argument("--resume", action="store_true",
+                        help="continue the last interrupted run (with its own min-score/sources/limit)")
+    parser.add_argument("--db", default=str(DB_PATH))
+    args = parser.parse_args()
+    target = Path(args.db).resolve()
+    init_db(target)
+    run_id = resumable_run(target) if args.resume else None
+    if run_id is not None:
+        differ = run_params_differ(get_run(target, run_id), args.min_score, args.sources, args.limit)
+        if differ:
+            parser.error(f"run {run_id} was started with different {', '.join(differ)}; resume without them or drop --resume")
+    else:
+        min_score = MIN_SCORE_DEFAULT if args.min_score is None else args.min_score
+        run_id = create_run(target, min_score, args.sources, args.limit)
+    summary = run_autotag_job(target, run_id, args.discogs_token, args.concurrency)
+    print(json.dumps(summary, indent=2))
@@ -1,35 +1,232 @@
 from pathlib import Path
-import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import argparse
 import json
-from typing import Optional
-from ..utils.db_utils import get_db
+import os
+import threading
+import time
+import zlib
+from ..utils.db_utils import get_db, init_db
+
+# Optional faster codecs; zlib/json are the fallbacks
+try:
+    import zstandard
+    _ZSTD_C = zstandard.ZstdCompressor(level=6)
+    _ZSTD_D = zstandard.ZstdDecompressor()
+except ImportError:
+    zstandard = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 DB_PATH = Path('library/db/library.sqlite').resolve()
 TTL_SECONDS_DEFAULT = 3600 * 24  # 24h
+# Per-source TTLs; release/recording data rarely changes upstream
+SOURCE_TTLS: Dict[str, int] = {
+    "musicbrainz": 3600 * 24 * 30,
+    "discogs": 3600 * 24 * 7,
+}
+MEMORY_MAX_ENTRIES = int(os.getenv("UNCHAINED_CACHE_MAX_ENTRIES", "4096"))
+MEMORY_MAX_BYTES = int(os.getenv("UNCHAINED_CACHE_MAX_BYTES", str(64 << 20)))
+SWEEP_INTERVAL_SECONDS = 3600
+SWEEP_BATCH = 5000
+
+# Two tiers: an in-process LRU of decoded payloads (bounded by entries and by
+# serialized bytes) in front of external_cache, where payloads are stored
+# compressed with an absolute expires_at that a background sweeper enforces.
 
 
 def _now() -> int:
     return int(time.time())
 
 
-def get_cached(cache_key: str, ttl_seconds: int = TTL_SECONDS_DEFAULT) -> Optional[dict]:
+def _dumps(payload: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(",", ":")).encode()
+
+
+def _loads(data) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _compress(raw: bytes) -> Tuple[bytes, str]:
+    if zstandard is not None:
+        return _ZSTD_C.compress(raw), "zstd"
+    return zlib.compress(raw, 6), "zlib"
+
+
+def _decompress(blob: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        if zstandard is None:
+            raise ValueError("zstandard is not installed")
+        return _ZSTD_D.decompress(blob)
+    return zlib.decompress(blob)
+
+
+class _LRU:
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items: "OrderedDict[str, Tuple[Any, int, int, int]]" = OrderedDict()  # key -> (payload, created, expires, size)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[Any, int, int]]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0], item[1], item[2]
+
+    def put(self, key: str, payload: Any, created_at: int, expires_at: int, size: int):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.bytes -= old[3]
+            self._items[key] = (payload, created_at, expires_at, size)
+            self.bytes += size
+            while self._items and (len(self._items) > self.max_entries or self.bytes > self.max_bytes):
+                _, evicted = self._items.popitem(last=False)
+                self.bytes -= evicted[3]
+
+    def discard(self, key: str):
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.bytes -= old[3]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._items), "bytes": self.bytes, "hits": self.hits, "misses": self.misses}
+
+
+_memory = _LRU(MEMORY_MAX_ENTRIES, MEMORY_MAX_BYTES)
+
+
+def get_cached(cache_key: str, ttl_seconds: Optional[int] = None) -> Optional[dict]:
+    """Cached payload for cache_key, or None if absent/expired. The returned object is shared; don't mutate it."""
+    now = _now()
+    hit = _memory.get(cache_key)
+    if hit is not None:
+        payload, created_at, expires_at = hit
+        if now < expires_at and (ttl_seconds is None or now - created_at <= ttl_seconds):
+            return payload
+        _memory.discard(cache_key)
+        return None
     db = get_db(DB_PATH)
-    row = db.execute("SELECT payload, created_at FROM external_cache WHERE cache_key=?", (cache_key,)).fetchone()
+    row = db.execute(
+        "SELECT payload_blob, encoding, payload, source, created_at, expires_at FROM external_cache WHERE cache_key=?",
+        (cache_key,)
+    ).fetchone()
     if not row:
         return None
-    payload, created_at = row
-    if _now() - int(created_at) > ttl_seconds:
+    blob, encoding, legacy, source, created_at, expires_at = row
+    created_at = int(created_at)
+    if expires_at is None:
+        expires_at = created_at + TTL_SECONDS_DEFAULT
+    if now >= expires_at or (ttl_seconds is not None and now - created_at > ttl_seconds):
         return None
     try:
-        return json.loads(payload)
+        raw = _decompress(blob, encoding) if blob is not None else legacy.encode()
+        payload = _loads(raw)
     except Exception:
         return None
+    _memory.put(cache_key, payload, created_at, expires_at, len(raw))
+    return payload
 
 
-def set_cached(cache_key: str, source: str, payload: dict):
+def set_cached(cache_key: str, source: str, payload: dict, ttl_seconds: Optional[int] = None):
+    now = _now()
+    expires_at = now + (ttl_seconds or SOURCE_TTLS.get(source, TTL_SECONDS_DEFAULT))
+    raw = _dumps(payload)
+    blob, encoding = _compress(raw)
     db = get_db(DB_PATH)
     db.execute(
-        "INSERT OR REPLACE INTO external_cache (cache_key, source, payload, created_at) VALUES (?, ?, ?, ?)",
-        (cache_key, source, json.dumps(payload), _now())
+        """
+        INSERT OR REPLACE INTO external_cache (cache_key, source, payload, payload_blob, encoding, created_at, expires_at)
+        VALUES (?, ?, NULL, ?, ?, ?, ?)
+        """,
+        (cache_key, source, blob, encoding, now, expires_at)
     )
     db.commit()
+    _memory.put(cache_key, payload, now, expires_at, len(raw))
+
+
+def sweep_expired(db_path: Path = DB_PATH, batch: int = SWEEP_BATCH) -> int:
+    """Delete expired external_cache rows in short batches (keeps write locks brief)."""
+    db = get_db(db_path)
+    now = _now()
+    deleted = 0
+    for sql, arg in (
+        ("SELECT id FROM external_cache WHERE expires_at IS NOT NULL AND expires_at <= ? LIMIT ?", now),
+        ("SELECT id FROM external_cache WHERE expires_at IS NULL AND created_at <= ? LIMIT ?", now - TTL_SECONDS_DEFAULT),
+    ):
+        while True:
+            cur = db.execute(f"DELETE FROM external_cache WHERE id IN ({sql})", (arg, batch))
+            db.commit()
+            deleted += cur.rowcount
+            if cur.rowcount < batch:
+                break
+    return deleted
+
+
+_sweeper: Optional[threading.Thread] = None
+_sweeper_stop = threading.Event()
+
+
+def start_sweeper(interval_seconds: int = SWEEP_INTERVAL_SECONDS):
+    global _sweeper
+    if _sweeper is not None and _sweeper.is_alive():
+        return
+
+    def loop():
+        while True:
+            try:
+                sweep_expired()
+            except Exception:
+                pass
+            if _sweeper_stop.wait(interval_seconds):
+                return
+
+    _sweeper_stop.clear()
+    _sweeper = threading.Thread(target=loop, name="cache-sweeper", daemon=True)
+    _sweeper.start()
+
+
+def stop_sweeper():
+    global _sweeper
+    _sweeper_stop.set()
+    if _sweeper is not None:
+        _sweeper.join(timeout=5)
+        _sweeper = None
+
+
+if __name__ == '__main__':
+    # python -m backend.app.services.cache_service [--vacuum] [--db path]
+    parser = argparse.ArgumentParser(description="Delete expired external_cache rows")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM afterwards to return freed pages to the OS")
+    parser.add_argument("--db", default=str(DB_PATH))
+    args = parser.parse_args()
+    target = Path(args.db).resolve()
+    init_db(target)
+    print(f"Deleted {sweep_expired(target)} expired cache rows")
+    if args.vacuum:
+        get_db(target).execute("VACUUM")
@@ -1,11 +1,14 @@
 from pathlib import Path
-import requests
+from typing import Callable, Optional
+import asyncio
+from ..utils.http_utils import request, run_sync, bridge_loop
 
 COVERS_DIR = Path('library/covers').resolve()
 COVERS_DIR.mkdir(parents=True, exist_ok=True)
+COVER_QUEUE_CONCURRENCY = 4
 
 
-def download_cover_if_needed(track_id: int, url: str) -> str:
+async def fetch_cover(track_id: int, url: str) -> str:
     if not url:
         return ''
     ext = 'jpg'
@@ -15,10 +18,40 @@ def download_cover_if_needed(track_id: int, url: str) -> str:
     if dest.exists():
         return str(dest)
     try:
-        r = requests.get(url, timeout=20)
+        r = await request("GET", url)
         r.raise_for_status()
         with open(dest, 'wb') as f:
             f.write(r.content)
         return str(dest)
     except Exception:
         return ''
+
+
+def download_cover_if_needed(track_id: int, url: str) -> str:
+    """Blocking wrapper for sync callers (runs on the shared HTTP loop)."""
+    if not url:
+        return ''
+    return run_sync(fetch_cover(track_id, url))
+
+
+# Background artwork queue: callers hand off (track_id, url) and return immediately.
+# Downloads run on the shared HTTP loop, COVER_QUEUE_CONCURRENCY at a time, and
+# on_done(path) runs in a worker thread once the file is on disk: it typically writes
+# to SQLite, which must not stall the loop every async HTTP source shares.
+_cover_slots: Optional[asyncio.Semaphore] = None
+
+
+async def _queued_cover(track_id: int, url: str, on_done: Optional[Callable[[str], None]]):
+    global _cover_slots
+    if _cover_slots is None:
+        _cover_slots = asyncio.Semaphore(COVER_QUEUE_CONCURRENCY)
+    async with _cover_slots:
+        path = await fetch_cover(track_id, url)
+    if path and on_done is not None:
+        await asyncio.to_thread(on_done, path)
+    return path
+
+
+def queue_cover_download(track_id: int, url: str, on_done: Optional[Callable[[str], None]] = None):
+    """Schedule a cover download without waiting for it; returns a concurrent.futures.Future."""
+    return asyncio.run_coroutine_threadsafe(_queued_cover(track_id, url, on_done), bridge_loop())
@@ -0,0 +1,138 @@
+from pathlib import Path
+from typing import Optional, Tuple
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+from ..utils.db_utils import get_db, init_db
+from ..utils.hash_utils import partial_hash, full_hash
+
+DB_PATH = Path('library/db/library.sqlite').resolve()
+
+# How copies into library/audio are made: reflink (CoW clone, falls back to copy), hardlink or copy
+LINK_MODE = os.getenv("UNCHAINED_LINK_MODE", "reflink")
+
+try:
+    import fcntl
+    FICLONE = 0x40049409  # Linux ioctl: clone file extents (btrfs, xfs, ...)
+except ImportError:
+    fcntl = None
+
+
+def _reflink(src: Path, dest: Path) -> bool:
+    if fcntl is None:
+        return False
+    try:
+        with open(src, "rb") as s, open(dest, "wb") as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        shutil.copystat(src, dest)
+        return True
+    except OSError:
+        dest.unlink(missing_ok=True)
+        return False
+
+
+def link_or_copy(src: Path, dest: Path, mode: str = LINK_MODE):
+    """Materialize src at dest without duplicating data where the filesystem allows it."""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    if mode == "hardlink":
+        try:
+            os.link(src, dest)
+            return
+        except OSError:
+            pass
+    elif mode == "reflink" and _reflink(src, dest):
+        return
+    shutil.copy2(src, dest)
+
+
+def reserve_dest(directory: Path, name: str) -> Path:
+    """directory/<name>, or '<stem> (n)<suffix>' if that name is taken, claimed atomically by
+    creating it empty (O_CREAT | O_EXCL) so concurrent writers never pick the same file.
+    The caller fills it (replace_with_copy / os.replace) or removes it."""
+    directory.mkdir(parents=True, exist_ok=True)
+    dest = directory / name
+    n = 1
+    while True:
+        try:
+            os.close(os.open(dest, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+            return dest
+        except FileExistsError:
+            dest = directory / f"{Path(name).stem} ({n}){Path(name).suffix}"
+            n += 1
+
+
+def replace_with_copy(src: Path, dest: Path, mode: str = LINK_MODE):
+    """link_or_copy src over dest (a name claimed with reserve_dest, or an existing library
+    copy): materialized next to it under a temporary name, then swapped in with os.replace."""
+    tmp = dest.with_name(f".{dest.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        link_or_copy(src, tmp, mode)
+        os.replace(tmp, dest)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def fingerprint(path: Path) -> Tuple[int, str]:
+    return os.path.getsize(path), partial_hash(path)
+
+
+def find_duplicate(db, path: Path, size: Optional[int] = None, partial: Optional[str] = None, full: Optional[str] = None) -> Optional[int]:
+    """Return the id of a track with identical audio bytes, if any.
+
+    The partial hash narrows candidates through an index; full hashes are only
+    computed (and cached on the track row) when partial hashes collide.
+    """
+    if size is None or partial is None:
+        size, partial = fingerprint(path)
+    if full is not None:
+        row = db.execute("SELECT id FROM tracks WHERE content_hash=?", (full,)).fetchone()
+        if row:
+            return row[0]
+    rows = db.execute(
+        "SELECT id, content_hash, path_audio FROM tracks WHERE partial_hash=? AND size_bytes=?",
+        (partial, size)
+    ).fetchall()
+    if not rows:
+        return None
+    full = full or full_hash(path)
+    for track_id, content_hash, path_audio in rows:
+        if content_hash is None:
+            if not path_audio or not os.path.exists(path_audio):
+                continue
+            content_hash = full_hash(Path(path_audio))
+            try:
+                db.execute("UPDATE tracks SET content_hash=? WHERE id=?", (content_hash, track_id))
+            except sqlite3.IntegrityError:
+                # Pre-existing duplicate row; it still matches below
+                pass
+        if content_hash == full:
+            return track_id
+    return None
+
+
+def backfill_content_index(db_path: Path) -> int:
+    """Fingerprint tracks imported before the dedup index existed."""
+    init_db(db_path)
+    db = get_db(db_path)
+    rows = db.execute("SELECT id, path_audio FROM tracks WHERE partial_hash IS NULL AND path_audio IS NOT NULL").fetchall()
+    done = 0
+    for track_id, path_audio in rows:
+        try:
+            size, partial = fingerprint(Path(path_audio))
+        except OSError:
+            continue
+        db.execute("UPDATE tracks SET size_bytes=?, partial_hash=? WHERE id=?", (size, partial, track_id))
+        done += 1
+        if done % 500 == 0:
+            db.commit()
+    db.commit()
+    return done
+
+
+if __name__ == '__main__':
+    # python -m backend.app.services.dedup_service [db_path]
+    target = Path(sys.argv[1]).resolve() if len(sys.argv) > 1 else DB_PATH
+    print(f"Fingerprinted {backfill_content_index(target)} tracks")
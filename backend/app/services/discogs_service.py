@@ -1,24 +1,27 @@
-import requests
+import os
 from typing import Optional
 from .cache_service import get_cached, set_cached
+from ..utils.http_utils import get_json, single_flight
 
-BASE = "https://api.discogs.com/database/search"
-UA = {"User-Agent": "UNCHAINED/0.1"}
+BASE = os.getenv("UNCHAINED_DISCOGS_URL", "https://api.discogs.com") + "/database/search"
 
-def search_discogs_release(query: str, token: Optional[str] = None):
+
+async def _fetch_search(query: str, token: Optional[str], cache_key: str) -> dict:
+    headers = {}
+    if token:
+        headers["Authorization"] = f"Discogs token={token}"
+    data = await get_json(BASE, params={"q": query}, headers=headers, source="discogs")
+    set_cached(cache_key, "discogs", data)
+    return data
+
+async def search_discogs_release(query: str, token: Optional[str] = None):
     cache_key = f"discogs:{query}:{token or 'no-token'}"
     cached = get_cached(cache_key)
     if cached:
         data = cached
     else:
-        params = {"q": query}
-        headers = dict(UA)
-        if token:
-            headers["Authorization"] = f"Discogs token={token}"
-        resp = requests.get(BASE, params=params, headers=headers, timeout=20)
-        resp.raise_for_status()
-        data = resp.json()
-        set_cached(cache_key, "discogs", data)
+        # Concurrent misses for the same query share one upstream call
+        data = await single_flight(cache_key, lambda: _fetch_search(query, token, cache_key))
     results = []
     for i in data.get("results", [])[:20]:
         results.append({
@@ -4,27 +4,21 @@ from ..utils.db_utils import get_db
 
 def upsert_analysis(db_path: Path, track_id: int, data: Dict[str, Any]) -> Dict[str, Any]:
     db = get_db(db_path)
-    row = db.execute("SELECT id FROM analysis_results WHERE track_id=?", (track_id,)).fetchone()
     fields = (
         data.get("bpm"), data.get("key"), data.get("waveform_path"),
         data.get("beatgrid_json"), data.get("energy"), data.get("analyzer")
     )
-    if row:
-        db.execute(
-            """
-            UPDATE analysis_results SET bpm=?, key=?, waveform_path=?, beatgrid_json=?, energy=?, analyzer=?, analyzed_at=datetime('now')
-            WHERE track_id=?
-            """,
-            (*fields, track_id)
-        )
-    else:
-        db.execute(
-            """
-            INSERT INTO analysis_results (track_id, bpm, key, waveform_path, beatgrid_json, energy, analyzer, analyzed_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'))
-            """,
-            (track_id, *fields)
-        )
+    db.execute(
+        """
+        INSERT INTO analysis_results (track_id, bpm, key, waveform_path, beatgrid_json, energy, analyzer, analyzed_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'))
+        ON CONFLICT(track_id) DO UPDATE SET
+            bpm=excluded.bpm, key=excluded.key, waveform_path=excluded.waveform_path,
+            beatgrid_json=excluded.beatgrid_json, energy=excluded.energy, analyzer=excluded.analyzer,
+            analyzed_at=excluded.analyzed_at
+        """,
+        (track_id, *fields)
+    )
     db.commit()
     out = db.execute("SELECT id, bpm, key, waveform_path, beatgrid_json, energy, analyzer, analyzed_at FROM analysis_results WHERE track_id=?", (track_id,)).fetchone()
     db.close()
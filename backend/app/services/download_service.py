@@ -1,45 +1,328 @@
-from typing import List
+from typing import Any, Dict, List, Optional, Tuple
 from pathlib import Path
+from urllib.parse import unquote, urlsplit
+import asyncio
 import os
-import requests
+import random
+import re
+import threading
+import time
+import uuid
+import httpx
 from ..utils.db_utils import get_db
+from ..utils.http_utils import get_client, bridge_loop, run_sync, RETRY_STATUSES
+from .dedup_service import reserve_dest
+from .event_service import publish
+
+DB_PATH = Path('library/db/library.sqlite').resolve()
+LIBRARY_AUDIO = Path('library/audio').resolve()
+DOWNLOAD_CONCURRENCY = int(os.getenv("UNCHAINED_DOWNLOAD_CONCURRENCY", "4"))
+CHUNK_SIZE = 1 << 20  # 1 MiB
+DOWNLOAD_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+MAX_ATTEMPTS = 5
+BACKOFF_SECONDS = 2.0
+BACKOFF_MAX_SECONDS = 300.0
+LEASE_SECONDS = 300.0  # well above the read timeout, so a stalled-but-alive transfer keeps its job
+HEARTBEAT_SECONDS = 30.0
+PROGRESS_INTERVAL = 1.0
+POLL_INTERVAL = 2.0
+
+# Worker pool over download_jobs. A job is claimed with a single UPDATE ... RETURNING,
+# so any number of pools (in the API process or `python -m backend.app.workers.background_tasks`)
+# can share the queue without double-downloading. A claim is a lease with an owner token:
+# a heartbeat renews it on a timer whether or not bytes are flowing, and every later
+# update of the job is conditional on the token, so a worker whose lease lapsed (the
+# process hung or died) stops before touching files another worker now owns.
+# Bytes go to <dest>.<job id>.part, and a retry resumes from its size with an HTTP Range request.
+# File and SQLite I/O run in threads so they never block the shared HTTP loop.
+
+JOB_COLUMNS = ["id", "url", "dest_path", "status", "error", "attempts", "bytes_done", "bytes_total",
+               "created_at", "started_at", "finished_at"]
+
+
+class _LeaseLost(Exception):
+    pass
+
+
+class _Retryable(Exception):
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
 
 
 def enqueue_downloads(urls: List[str], dest_base: Path, db_path: Path) -> int:
     db = get_db(db_path)
-    enqueued = 0
-    for url in urls:
-        filename = url.split('/')[-1]
-        dest = dest_base / filename
-        db.execute(
-            "INSERT INTO download_jobs (url, dest_path, status, created_at) VALUES (?, ?, 'queued', datetime('now'))",
-            (url, str(dest))
+    db.executemany(
+        "INSERT INTO download_jobs (url, dest_path, status, created_at) VALUES (?, ?, 'queued', datetime('now'))",
+        [(url, str(dest_base / _filename(url))) for url in urls]
+    )
+    db.commit()
+    return len(urls)
+
+
+def list_downloads(db_path: Path, status: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+    db = get_db(db_path)
+    where = "WHERE status=?" if status else ""
+    rows = db.execute(
+        f"SELECT {', '.join(JOB_COLUMNS)} FROM download_jobs {where} ORDER BY id DESC LIMIT ?",
+        ((status, limit) if status else (limit,))
+    ).fetchall()
+    return [dict(zip(JOB_COLUMNS, r)) for r in rows]
+
+
+def _filename(url: str) -> str:
+    name = unquote(urlsplit(url).path.rstrip('/').split('/')[-1])
+    return re.sub(r'[\\/:*?"<>|]', '_', name) or "download"
+
+
+def claim_job(db, lease_seconds: float = LEASE_SECONDS) -> Optional[Tuple[int, str, Optional[str], int, str]]:
+    """Atomically take the oldest due job (or one whose lease lapsed): (id, url, dest_path, attempts, owner)."""
+    now = time.time()
+    rows = db.execute(
+        """
+        UPDATE download_jobs SET status='running', started_at=COALESCE(started_at, datetime('now')),
+            attempts=attempts+1, lease_expires_at=?, lease_owner=?
+        WHERE id = (
+            SELECT id FROM download_jobs
+            WHERE (status='queued' AND (next_attempt_at IS NULL OR next_attempt_at <= ?))
+               OR (status='running' AND lease_expires_at < ?)
+            ORDER BY created_at, id LIMIT 1
         )
-        enqueued += 1
+        RETURNING id, url, dest_path, attempts, lease_owner
+        """,
+        (now + lease_seconds, uuid.uuid4().hex, now, now)
+    ).fetchall()
     db.commit()
-    return enqueued
+    return rows[0] if rows else None
+
 
+def _content_total(resp: httpx.Response, offset: int) -> Optional[int]:
+    content_range = resp.headers.get("Content-Range", "")
+    if "/" in content_range:
+        total = content_range.rsplit("/", 1)[1]
+        return int(total) if total.isdigit() else None
+    length = resp.headers.get("Content-Length")
+    return offset + int(length) if length and length.isdigit() else None
 
-def run_download_worker(db_path: Path):
+
+def _execute(db_path: Path, sql: str, args: tuple) -> int:
     db = get_db(db_path)
-    row = db.execute("SELECT id, url, dest_path FROM download_jobs WHERE status='queued' ORDER BY created_at LIMIT 1").fetchone()
-    if not row:
-        return False
-    job_id, url, dest = row
-    db.execute("UPDATE download_jobs SET status='running', started_at=datetime('now') WHERE id=?", (job_id,))
+    cur = db.execute(sql, args)
     db.commit()
+    return cur.rowcount
+
+
+class _Lease:
+    """A claimed job: updates go through update(), which fails once another worker owns it."""
+
+    def __init__(self, db_path: Path, job_id: int, owner: str):
+        self.db_path = db_path
+        self.job_id = job_id
+        self.owner = owner
+        self.lost = False
+
+    async def update(self, assignments: str, args: tuple = ()):
+        if self.lost:
+            raise _LeaseLost(f"job {self.job_id} was re-claimed")
+        updated = await asyncio.to_thread(
+            _execute, self.db_path,
+            f"UPDATE download_jobs SET {assignments} WHERE id=? AND lease_owner=?", args + (self.job_id, self.owner)
+        )
+        if not updated:
+            self.lost = True
+            raise _LeaseLost(f"job {self.job_id} was re-claimed")
+
+    async def renew(self):
+        await self.update("lease_expires_at=?", (time.time() + LEASE_SECONDS,))
+
+    async def keep_alive(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            try:
+                await self.renew()
+            except _LeaseLost:
+                return
+
+
+async def _transfer(lease: _Lease, url: str, part: Path, label: str) -> int:
+    """Stream url into part (resuming from its current size); returns the final size."""
+    offset = await asyncio.to_thread(lambda: part.stat().st_size if part.exists() else 0)
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    async with get_client().stream("GET", url, headers=headers, timeout=DOWNLOAD_TIMEOUT) as resp:
+        if resp.status_code == 416 and offset:
+            # Nothing left to send: either the .part is already complete or it is stale
+            if _content_total(resp, offset) == offset:
+                return offset
+            await asyncio.to_thread(part.unlink, missing_ok=True)
+            raise _Retryable("Range not satisfiable; restarting from scratch", 0.0)
+        if resp.status_code in RETRY_STATUSES:
+            value = resp.headers.get("Retry-After", "")
+            raise _Retryable(f"HTTP {resp.status_code}", float(value) if value.isdigit() else None)
+        resp.raise_for_status()
+        if offset and resp.status_code != 206:
+            offset = 0  # server ignored the Range header and sent the whole body
+        total = _content_total(resp, offset)
+        done = offset
+        window_start, window_bytes = time.monotonic(), 0
+        await lease.update("bytes_done=?, bytes_total=?", (done, total))
+        f = await asyncio.to_thread(open, part, "ab" if offset else "wb")
+        try:
+            async for chunk in resp.aiter_bytes(CHUNK_SIZE):
+                if lease.lost:
+                    raise _LeaseLost(f"job {lease.job_id} was re-claimed")
+                await asyncio.to_thread(f.write, chunk)
+                done += len(chunk)
+                window_bytes += len(chunk)
+                now = time.monotonic()
+                if now - window_start >= PROGRESS_INTERVAL:
+                    rate = window_bytes / (now - window_start)
+                    window_start, window_bytes = now, 0
+                    await lease.update("bytes_done=?", (done,))
+                    publish({
+                        "type": "import_progress", "track_id": None, "job_id": lease.job_id,
+                        "progress": done / total if total else None, "bytes_done": done,
+                        "bytes_total": total, "bytes_per_second": int(rate),
+                        "message": f"Downloading {label}: {done / 1e6:.1f}"
+                                   f"{f'/{total / 1e6:.1f}' if total else ''} MB at {rate / 1e6:.2f} MB/s",
+                    })
+        finally:
+            await asyncio.to_thread(f.close)
+    if total is not None and done < total:
+        raise _Retryable(f"Connection closed at {done}/{total} bytes", 0.0)
+    return done
+
+
+def _finish_file(part: Path, dest: Path) -> Path:
+    # Claim dest (or "<stem> (n)") atomically, then move the finished download onto it
+    dest = reserve_dest(dest.parent, dest.name)
+    os.replace(part, dest)
+    return dest
+
+
+async def download_job(db_path: Path, job: Tuple[int, str, Optional[str], int, str], audio_root: Path = LIBRARY_AUDIO) -> str:
+    """Run one claimed job; returns 'done', 'retry', 'error' or 'lost' (re-claimed by another worker)."""
+    job_id, url, dest_path, attempts, owner = job
+    lease = _Lease(db_path, job_id, owner)
+    heartbeat = asyncio.create_task(lease.keep_alive())
     try:
-        r = requests.get(url, stream=True, timeout=60)
-        r.raise_for_status()
-        os.makedirs(str(Path(dest).parent), exist_ok=True)
-        with open(dest, 'wb') as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-        db.execute("UPDATE download_jobs SET status='done', finished_at=datetime('now') WHERE id=?", (job_id,))
-        db.commit()
-        return True
+        return await _run_claimed(lease, url, dest_path, attempts, audio_root)
+    except _LeaseLost:
+        return "lost"
+    finally:
+        heartbeat.cancel()
+
+
+async def _run_claimed(lease: _Lease, url: str, dest_path: Optional[str], attempts: int, audio_root: Path) -> str:
+    job_id = lease.job_id
+    if not dest_path:
+        # Bandcamp link imports leave the destination to the worker; pin it so retries find the .part
+        dest_path = str(audio_root / _filename(url))
+        await lease.update("dest_path=?", (dest_path,))
+    dest = Path(dest_path)
+    part = dest.with_name(f"{dest.name}.{job_id}.part")  # per job, so same-named URLs never share one
+    started = time.monotonic()
+    try:
+        await asyncio.to_thread(dest.parent.mkdir, parents=True, exist_ok=True)
+        size = await _transfer(lease, url, part, dest.name)
+    except _LeaseLost:
+        raise
+    except (_Retryable, httpx.TransportError) as e:
+        if attempts >= MAX_ATTEMPTS:
+            return await _fail(lease, f"Gave up after {attempts} attempts: {e}")
+        delay = min(BACKOFF_MAX_SECONDS, BACKOFF_SECONDS * (2 ** (attempts - 1))) * (0.5 + random.random())
+        retry_after = getattr(e, "retry_after", None)
+        if retry_after == 0.0:
+            delay = 0.0  # partial progress was kept (or the stale .part dropped); resume right away
+        elif retry_after is not None:
+            delay = max(delay, retry_after)
+        await lease.update(
+            "status='queued', error=?, next_attempt_at=?, lease_expires_at=NULL, lease_owner=NULL",
+            (str(e) or type(e).__name__, time.time() + delay)
+        )
+        return "retry"
     except Exception as e:
-        db.execute("UPDATE download_jobs SET status='error', finished_at=datetime('now'), error=? WHERE id=?", (str(e), job_id))
-        db.commit()
-        return False
+        return await _fail(lease, str(e))
+    await lease.renew()  # still ours: safe to move the file into place
+    dest = await asyncio.to_thread(_finish_file, part, dest)
+    await lease.update(
+        """
+        status='done', dest_path=?, error=NULL, bytes_done=?, bytes_total=?,
+            lease_expires_at=NULL, lease_owner=NULL, finished_at=datetime('now')
+        """,
+        (str(dest), size, size)
+    )
+    elapsed = max(time.monotonic() - started, 1e-6)
+    publish({
+        "type": "download_finished", "track_id": None, "job_id": job_id,
+        "message": f"{dest.name} ({size / 1e6:.1f} MB, {size / elapsed / 1e6:.2f} MB/s)",
+    })
+    return "done"
+
+
+async def _fail(lease: _Lease, error: str) -> str:
+    await lease.update(
+        "status='error', error=?, lease_expires_at=NULL, lease_owner=NULL, finished_at=datetime('now')",
+        (error,)
+    )
+    publish({"type": "info", "track_id": None, "message": f"Download failed: {error}"})
+    return "error"
+
+
+def _claim(db_path: Path):
+    return claim_job(get_db(db_path))
+
+
+def _queue_empty(db_path: Path) -> bool:
+    return get_db(db_path).execute("SELECT 1 FROM download_jobs WHERE status='queued' LIMIT 1").fetchone() is None
+
+
+async def run_download_pool(
+    db_path: Path = DB_PATH,
+    concurrency: int = DOWNLOAD_CONCURRENCY,
+    poll_interval: float = POLL_INTERVAL,
+    until_idle: bool = False,
+    audio_root: Path = LIBRARY_AUDIO,
+) -> Dict[str, int]:
+    """Run `concurrency` download workers. With until_idle they exit once nothing is queued
+    (jobs waiting out a backoff count as queued); otherwise they poll forever."""
+    stats = {"done": 0, "retry": 0, "error": 0, "lost": 0}
+
+    async def worker():
+        while True:
+            job = await asyncio.to_thread(_claim, db_path)
+            if job is not None:
+                stats[await download_job(db_path, job, audio_root)] += 1
+                continue
+            if until_idle and await asyncio.to_thread(_queue_empty, db_path):
+                return
+            await asyncio.sleep(poll_interval * (0.5 + random.random()))
+
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return stats
+
+
+_pool_future = None
+_pool_lock = threading.Lock()
+
+
+def start_download_pool(db_path: Path = DB_PATH, concurrency: int = DOWNLOAD_CONCURRENCY) -> bool:
+    """Drain the queue in the background on the shared HTTP loop (in-process, so SSE progress
+    reaches the app). No-op if this process's pool is already running."""
+    global _pool_future
+    with _pool_lock:
+        if _pool_future is not None and not _pool_future.done():
+            return False
+        _pool_future = asyncio.run_coroutine_threadsafe(
+            run_download_pool(db_path, concurrency, until_idle=True), bridge_loop()
+        )
+        return True
+
+
+async def _run_one(db_path: Path) -> Optional[str]:
+    job = await asyncio.to_thread(_claim, db_path)
+    return await download_job(db_path, job) if job else None
+
+
+def run_download_worker(db_path: Path) -> bool:
+    """Claim and run a single job synchronously; False when nothing was due or it did not finish."""
+    return run_sync(_run_one(db_path)) == "done"
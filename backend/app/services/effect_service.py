@@ -4,11 +4,12 @@ Manages effect definitions, presets, and chains for DJ mixing.
 """
 
 import json
-import sqlite3
 from pathlib import Path
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 
+from ..utils.db_utils import get_db, dict_row, dict_rows
+
 # Effect library with default parameters
 EFFECT_LIBRARY = {
     "eq_three_band": {
@@ -301,8 +302,7 @@ FACTORY_PRESETS = [
 
 def initialize_effect_library(db_path: Path):
     """Populate effect library with built-in effects"""
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
+    conn = get_db(db_path)
     
     try:
         for effect_id, effect_data in EFFECT_LIBRARY.items():
@@ -341,26 +341,26 @@ def initialize_effect_library(db_path: Path):
 
 def list_effects(db_path: Path, category: Optional[str] = None) -> List[Dict[str, Any]]:
     """List all available effects, optionally filtered by category"""
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
+    conn = get_db(db_path)
     
     if category:
-        rows = conn.execute(
+        cursor = conn.execute(
             "SELECT id, name, category, description, default_params_json FROM effects WHERE category=? ORDER BY name",
             (category,)
-        ).fetchall()
+        )
     else:
-        rows = conn.execute(
+        cursor = conn.execute(
             "SELECT id, name, category, description, default_params_json FROM effects ORDER BY category, name"
-        ).fetchall()
+        )
+    rows = dict_rows(cursor)
     
     conn.close()
-    return [dict(r) for r in rows]
+    return rows
 
 
 def get_effect_categories(db_path: Path) -> List[str]:
     """Get list of effect categories"""
-    conn = sqlite3.connect(db_path)
+    conn = get_db(db_path)
     rows = conn.execute("SELECT DISTINCT category FROM effects ORDER BY category").fetchall()
     conn.close()
     return [r[0] for r in rows]
@@ -368,21 +368,21 @@ def get_effect_categories(db_path: Path) -> List[str]:
 
 def list_fx_presets_enhanced(db_path: Path, category: Optional[str] = None) -> List[Dict[str, Any]]:
     """List all FX presets with full details"""
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
+    conn = get_db(db_path)
     
     if category:
-        rows = conn.execute(
+        cursor = conn.execute(
             "SELECT id, name, description, category, effects_json, is_factory, created_at FROM fx_presets WHERE category=? ORDER BY is_factory DESC, created_at DESC",
             (category,)
-        ).fetchall()
+        )
     else:
-        rows = conn.execute(
+        cursor = conn.execute(
             "SELECT id, name, description, category, effects_json, is_factory, created_at FROM fx_presets ORDER BY is_factory DESC, created_at DESC"
-        ).fetchall()
+        )
+    rows = dict_rows(cursor)
     
     conn.close()
-    return [dict(r) for r in rows]
+    return rows
 
 
 def add_fx_preset_enhanced(
@@ -393,8 +393,7 @@ def add_fx_preset_enhanced(
     effects_json: str
 ) -> Dict[str, Any]:
     """Create a new custom FX preset"""
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
+    conn = get_db(db_path)
     
     cursor = conn.execute(
         """
@@ -406,13 +405,13 @@ def add_fx_preset_enhanced(
     preset_id = cursor.lastrowid
     conn.commit()
     
-    row = conn.execute(
+    row = dict_row(conn.execute(
         "SELECT id, name, description, category, effects_json, is_factory, created_at FROM fx_presets WHERE id=?",
         (preset_id,)
-    ).fetchone()
+    ))
     conn.close()
     
-    return dict(row)
+    return row
 
 
 def update_fx_preset(
@@ -424,7 +423,7 @@ def update_fx_preset(
     effects_json: Optional[str] = None
 ) -> bool:
     """Update an existing preset"""
-    conn = sqlite3.connect(db_path)
+    conn = get_db(db_path)
     
     # Don't allow updating factory presets
     row = conn.execute("SELECT is_factory FROM fx_presets WHERE id=?", (preset_id,)).fetchone()
@@ -462,10 +461,9 @@ def update_fx_preset(
 
 def get_deck_effect_chain(db_path: Path, deck_id: str) -> List[Dict[str, Any]]:
     """Get active effect chain for a deck"""
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
+    conn = get_db(db_path)
     
-    rows = conn.execute(
+    rows = dict_rows(conn.execute(
         """
         SELECT ec.id, ec.deck_id, ec.slot, ec.effect_id, ec.params_json, ec.enabled, ec.wet_dry,
                e.name as effect_name, e.category, e.default_params_json
@@ -475,10 +473,10 @@ def get_deck_effect_chain(db_path: Path, deck_id: str) -> List[Dict[str, Any]]:
         ORDER BY ec.slot
         """,
         (deck_id,)
-    ).fetchall()
+    ))
     
     conn.close()
-    return [dict(r) for r in rows]
+    return rows
 
 
 def add_effect_to_chain(
@@ -490,8 +488,7 @@ def add_effect_to_chain(
     wet_dry: float = 0.5
 ) -> Dict[str, Any]:
     """Add an effect to a deck's chain at specified slot"""
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
+    conn = get_db(db_path)
     
     # Get effect ID by name
     effect_row = conn.execute("SELECT id, default_params_json FROM effects WHERE name=?", (effect_name,)).fetchone()
@@ -519,7 +516,7 @@ def add_effect_to_chain(
     chain_id = cursor.lastrowid
     conn.commit()
     
-    row = conn.execute(
+    row = dict_row(conn.execute(
         """
         SELECT ec.id, ec.deck_id, ec.slot, ec.effect_id, ec.params_json, ec.enabled, ec.wet_dry,
                e.name as effect_name, e.category
@@ -528,10 +525,10 @@ def add_effect_to_chain(
         WHERE ec.id=?
         """,
         (chain_id,)
-    ).fetchone()
+    ))
     conn.close()
     
-    return dict(row)
+    return row
 
 
 def update_effect_params(
@@ -542,7 +539,7 @@ def update_effect_params(
     enabled: Optional[bool] = None
 ) -> bool:
     """Update parameters of an effect in a chain"""
-    conn = sqlite3.connect(db_path)
+    conn = get_db(db_path)
     
     updates = []
     params = []
@@ -571,7 +568,7 @@ def update_effect_params(
 
 def remove_effect_from_chain(db_path: Path, chain_id: int) -> bool:
     """Remove an effect from a deck's chain"""
-    conn = sqlite3.connect(db_path)
+    conn = get_db(db_path)
     cursor = conn.execute("DELETE FROM effect_chains WHERE id=?", (chain_id,))
     success = cursor.rowcount > 0
     conn.commit()
@@ -581,7 +578,7 @@ def remove_effect_from_chain(db_path: Path, chain_id: int) -> bool:
 
 def clear_deck_effects(db_path: Path, deck_id: str) -> bool:
     """Clear all effects from a deck"""
-    conn = sqlite3.connect(db_path)
+    conn = get_db(db_path)
     conn.execute("DELETE FROM effect_chains WHERE deck_id=?", (deck_id,))
     conn.commit()
     conn.close()
@@ -590,8 +587,7 @@ def clear_deck_effects(db_path: Path, deck_id: str) -> bool:
 
 def apply_preset_to_deck(db_path: Path, deck_id: str, preset_id: int) -> List[Dict[str, Any]]:
     """Apply a preset's effect chain to a deck"""
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
+    conn = get_db(db_path)
     
     # Get preset
     preset_row = conn.execute(
@@ -0,0 +1,308 @@
+"""
+Memory-mapped embedding matrices backed by track_embeddings float32 BLOBs.
+"""
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from contextlib import contextmanager
+import json
+import os
+import re
+import threading
+import time
+import numpy as np
+
+from ..utils.db_utils import get_db
+
+EMBEDDING_DTYPE = np.dtype("<f4")
+SYNC_INTERVAL_SECONDS = 2.0
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# One (count x dim) float32 .npy per model_version under library/db/embeddings/,
+# with the row -> track_id index beside it, shared by every process (API workers,
+# CLIs, the ANN builder). Published generations are immutable: a change is written
+# to a new {stem}.{generation}.* pair, and {stem}.json is then atomically replaced
+# to point at it, so a process that mapped an older generation keeps a consistent
+# matrix/ids pair. Writers and readers (re)mapping files hold {stem}.lock.
+# INSERT OR REPLACE gives a replaced row a new (AUTOINCREMENT) id, so "id > last
+# synced id" is exactly the changed set; rows keep their position within an epoch.
+# If the live row count disagrees with the table afterwards (deletes, a track moved
+# to another model_version), the matrix is rebuilt and gets a new epoch.
+# Triggers bump library_counters['track_embeddings'] on every write (migration 013),
+# so the periodic check is a single lookup while the table is unchanged.
+
+
+@contextmanager
+def _file_lock(path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def encode_vector(vector: Iterable[float]) -> bytes:
+    return np.asarray(vector, dtype=EMBEDDING_DTYPE).tobytes()
+
+
+def decode_vector(blob: Optional[bytes], legacy_json: Optional[str] = None) -> Optional[np.ndarray]:
+    if blob is not None:
+        return np.frombuffer(blob, dtype=EMBEDDING_DTYPE)
+    if legacy_json:
+        return np.asarray(json.loads(legacy_json), dtype=EMBEDDING_DTYPE)
+    return None
+
+
+def convert_legacy_rows(db, model_version: Optional[str] = None, batch: int = 5000) -> int:
+    """Rewrite JSON embedding_vector rows as BLOBs (keeps ids, so caches stay valid)."""
+    where = "embedding_blob IS NULL AND embedding_vector IS NOT NULL" + (" AND model_version=?" if model_version else "")
+    args = (model_version,) if model_version else ()
+    converted = 0
+    while True:
+        rows = db.execute(f"SELECT id, embedding_vector FROM track_embeddings WHERE {where} LIMIT ?", args + (batch,)).fetchall()
+        if not rows:
+            return converted
+        db.executemany(
+            "UPDATE track_embeddings SET embedding_blob=?, embedding_vector=NULL WHERE id=?",
+            [(encode_vector(json.loads(v)), i) for i, v in rows]
+        )
+        db.commit()
+        converted += len(rows)
+
+
+class EmbeddingMatrix:
+    """Zero-copy (count x dim) float32 view of one model_version's embeddings."""
+
+    def __init__(self, db_path: Path, model_version: str, cache_dir: Optional[Path] = None):
+        self.db_path = db_path
+        self.model_version = model_version
+        self.cache_dir = cache_dir or db_path.parent / "embeddings"
+        self.stem = re.sub(r"[^\w.-]", "_", model_version)
+        self._meta_path = self.cache_dir / f"{self.stem}.json"
+        self._generation = 0
+        self.lock = threading.RLock()
+        self._data: Optional[np.memmap] = None
+        self._ids: Optional[np.memmap] = None
+        self._norms = np.empty(0, dtype=np.float32)
+        self._rows: Dict[int, int] = {}
+        self.count = 0
+        self.dim = 0
+        self.last_id = 0
+        self.epoch = 0  # new value on every rebuild; row numbers are only stable within an epoch
+        self._checked_at = 0.0
+        self._dirty = True
+        self._changes: Optional[int] = None  # library_counters value the matrix was last checked at
+        self._converted = False
+
+    # ---- views -------------------------------------------------------------
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._data[:self.count] if self._data is not None else np.empty((0, 0), dtype=EMBEDDING_DTYPE)
+
+    @property
+    def track_ids(self) -> np.ndarray:
+        return self._ids[:self.count] if self._ids is not None else np.empty(0, dtype=np.int64)
+
+    @property
+    def norms(self) -> np.ndarray:
+        return self._norms[:self.count]
+
+    def view(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Synced (matrix, track_ids, norms), consistent with each other."""
+        with self.lock:
+            self.sync()
+            return self.matrix, self.track_ids, self.norms
+
+    def row_of(self, track_id: int) -> Optional[int]:
+        return self._rows.get(track_id)
+
+    def mark_dirty(self):
+        """Writers in this process call this so the next read syncs immediately."""
+        self._dirty = True
+
+    # ---- sync ----------------------------------------------------------------
+
+    def sync(self, force: bool = False) -> "EmbeddingMatrix":
+        """Bring the matrix up to date with track_embeddings. Cheap when nothing changed;
+        the table is checked at most every SYNC_INTERVAL_SECONDS unless marked dirty."""
+        with self.lock:
+            now = time.monotonic()
+            if not (force or self._dirty or now - self._checked_at >= SYNC_INTERVAL_SECONDS):
+                return self
+            self._checked_at = now
+            self._dirty = False
+            db = get_db(self.db_path)
+            if not self._converted:
+                # Only rows written before the BLOB column existed are JSON; once is enough
+                convert_legacy_rows(db, self.model_version)
+                self._converted = True
+            changes = self._change_counter(db)
+            if self._data is not None and changes is not None and changes == self._changes:
+                return self
+            self._changes = changes  # read before the check, so a later write is seen next time
+            if self._data is not None and self._current(db) == (self.count, self.last_id):
+                return self
+            with _file_lock(self._lock_path):
+                self._open()  # another process may already have published this change
+                total, max_id = self._current(db)
+                if self._data is not None and (total, max_id) == (self.count, self.last_id):
+                    return self
+                rows = []
+                if self._data is not None and max_id > self.last_id:
+                    rows = db.execute(
+                        "SELECT id, track_id, embedding_blob FROM track_embeddings "
+                        "WHERE model_version=? AND id > ? AND embedding_blob IS NOT NULL ORDER BY id",
+                        (self.model_version, self.last_id)
+                    ).fetchall()
+                if not self._publish(rows, rebuild=False) or self.count != total:
+                    self._rebuild(db)
+            return self
+
+    @staticmethod
+    def _change_counter(db) -> Optional[int]:
+        row = db.execute("SELECT value FROM library_counters WHERE name='track_embeddings'").fetchone()
+        return row[0] if row else None
+
+    def _current(self, db) -> Tuple[int, int]:
+        return db.execute(
+            "SELECT COUNT(*), COALESCE(MAX(id), 0) FROM track_embeddings WHERE model_version=? AND embedding_blob IS NOT NULL",
+            (self.model_version,)
+        ).fetchone()
+
+    @property
+    def _lock_path(self) -> Path:
+        return self.cache_dir / f"{self.stem}.lock"
+
+    def _paths(self, generation: int) -> Tuple[Path, Path]:
+        base = f"{self.stem}.{generation}"
+        return self.cache_dir / f"{base}.f32.npy", self.cache_dir / f"{base}.ids.npy"
+
+    def _read_meta(self) -> Dict:
+        try:
+            return json.loads(self._meta_path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def _open(self):
+        """Map the published generation if it is not the one already mapped (caller holds the file lock)."""
+        meta = self._read_meta()
+        generation = meta.get("generation")
+        if generation is None or (generation == self._generation and self._data is not None):
+            return
+        try:
+            matrix_path, ids_path = self._paths(generation)
+            data = np.load(matrix_path, mmap_mode="r")
+            ids = np.load(ids_path, mmap_mode="r")
+        except (OSError, ValueError):
+            return
+        count = meta.get("count", 0)
+        if data.ndim != 2 or data.shape != (count, meta.get("dim")) or ids.shape != (count,):
+            return
+        self._data, self._ids, self._generation = data, ids, generation
+        self.count, self.dim, self.last_id = count, meta["dim"], meta["last_id"]
+        self.epoch = meta.get("epoch", 0)
+        self._rows = {int(t): i for i, t in enumerate(ids.tolist())}
+        self._norms = np.linalg.norm(data, axis=1).astype(np.float32) if count else np.empty(0, dtype=np.float32)
+
+    def _publish(self, rows: List[Tuple[int, int, bytes]], rebuild: bool) -> bool:
+        """Write current rows plus `rows` (id order) as a new generation and point the meta
+        file at it. Rows already present keep their position, new tracks are appended.
+        Returns False if a row's dimensionality does not match (caller rebuilds)."""
+        if not rows and not rebuild:
+            return True
+        base_count = 0 if rebuild else self.count
+        dim = len(rows[-1][2]) // EMBEDDING_DTYPE.itemsize if rebuild else self.dim
+        width = dim * EMBEDDING_DTYPE.itemsize
+        if not rebuild and any(len(blob) != width for _, _, blob in rows):
+            return False
+        rows = [r for r in rows if len(r[2]) == width]
+        positions_map = {} if rebuild else dict(self._rows)
+        positions = np.empty(len(rows), dtype=np.int64)
+        new_ids = []
+        for n, (_, track_id, _) in enumerate(rows):
+            i = positions_map.get(track_id)
+            if i is None:
+                i = positions_map[track_id] = base_count + len(new_ids)
+                new_ids.append(track_id)
+            positions[n] = i
+        count = base_count + len(new_ids)
+        generation = max(self._generation, self._read_meta().get("generation", 0)) + 1
+        matrix_path, ids_path = self._paths(generation)
+        data = np.lib.format.open_memmap(matrix_path, mode="w+", dtype=EMBEDDING_DTYPE, shape=(count, dim))
+        ids = np.lib.format.open_memmap(ids_path, mode="w+", dtype=np.int64, shape=(count,))
+        norms = np.zeros(count, dtype=np.float32)
+        if base_count:
+            data[:base_count] = self._data[:base_count]
+            ids[:base_count] = self._ids[:base_count]
+            norms[:base_count] = self._norms[:base_count]
+        ids[base_count:] = new_ids
+        if rows:
+            vectors = np.frombuffer(b"".join(blob for _, _, blob in rows), dtype=EMBEDDING_DTYPE).reshape(len(rows), dim)
+            data[positions] = vectors
+            norms[positions] = np.linalg.norm(vectors, axis=1)
+        data.flush()
+        ids.flush()
+        del data, ids
+        self._data, self._ids = np.load(matrix_path, mmap_mode="r"), np.load(ids_path, mmap_mode="r")
+        self._norms, self._rows, self._generation = norms, positions_map, generation
+        self.count, self.dim = count, dim
+        if rows:
+            self.last_id = rows[-1][0]
+        if rebuild:
+            self.epoch = time.time_ns()
+        self._save_meta()
+        self._remove_stale()
+        return True
+
+    def _rebuild(self, db):
+        rows = db.execute(
+            "SELECT id, track_id, embedding_blob FROM track_embeddings WHERE model_version=? AND embedding_blob IS NOT NULL ORDER BY id",
+            (self.model_version,)
+        ).fetchall()
+        self._rows = {}
+        self.count = 0
+        self.last_id = 0
+        if not rows:
+            self._data = self._ids = None
+            self.dim = 0
+            self.epoch = time.time_ns()
+            self._norms = np.empty(0, dtype=np.float32)
+            self._meta_path.unlink(missing_ok=True)
+            self._remove_stale(below=self._generation + 1)
+            return
+        self._publish(rows, rebuild=True)
+
+    def _save_meta(self):
+        tmp = self._meta_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({
+            "generation": self._generation, "count": self.count, "dim": self.dim, "last_id": self.last_id,
+            "epoch": self.epoch,
+        }))
+        os.replace(tmp, self._meta_path)
+
+    def _remove_stale(self, below: Optional[int] = None):
+        """Best-effort delete of older generations. POSIX keeps unlinked files alive for
+        processes that still map them; on Windows the unlink fails and is retried next time."""
+        pattern = re.compile(rf"{re.escape(self.stem)}\.(\d+)\.(?:f32|ids)\.npy")
+        for path in self.cache_dir.glob(f"{self.stem}.*.npy"):
+            match = pattern.fullmatch(path.name)
+            if match and int(match.group(1)) < (self._generation if below is None else below):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
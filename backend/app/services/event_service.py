@@ -0,0 +1,37 @@
+from typing import Any, Dict, Optional
+import asyncio
+import json
+
+# In-memory event broadcaster backing the SSE stream (/sources/events/stream)
+EVENT_TYPES = {"upload_complete", "download_finished", "import_progress", "info"}
+
+event_queue: asyncio.Queue = asyncio.Queue()
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def bind_loop(loop: asyncio.AbstractEventLoop):
+    """Remember the server loop so worker threads can hand events to it."""
+    global _loop
+    _loop = loop
+
+
+def publish(event: Dict[str, Any]):
+    """Queue an event for SSE subscribers; safe to call from any thread.
+
+    Only the server loop touches event_queue directly. Other threads, including ones
+    running their own loop (the HTTP bridge loop, asyncio.run in a worker process),
+    hand the event over with call_soon_threadsafe so the SSE consumer is woken. With
+    no server loop bound (standalone worker, CLI) nobody reads the queue and the event
+    is dropped.
+    """
+    if _loop is None or _loop.is_closed():
+        return
+    payload = json.dumps(event)
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is _loop:
+        event_queue.put_nowait(payload)
+    else:
+        _loop.call_soon_threadsafe(event_queue.put_nowait, payload)
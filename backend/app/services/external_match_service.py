@@ -0,0 +1,211 @@
+from pathlib import Path
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import re
+import time
+import unicodedata
+from rapidfuzz import fuzz, process
+from ..utils.db_utils import get_db, init_db
+
+DB_PATH = Path('library/db/library.sqlite').resolve()
+MIN_CONFIDENCE = 0.85
+ARTIST_CUTOFF = 80  # token_sort_ratio an artist block must reach to be searched
+MAX_ARTIST_BLOCKS = 5
+NGRAM = 3
+
+# Map external_tracks (Spotify/Bandcamp/... references) onto local tracks:
+#   1. ISRC, through idx_tracks_isrc
+#   2. exact normalized (artist, title)
+#   3. blocked fuzzy match: an artist trigram index narrows 200k tracks down to a
+#      handful of artist blocks, and only titles inside those blocks are scored.
+
+_BRACKETS = re.compile(r"\s*[\(\[][^\)\]]*[\)\]]")
+_SUFFIX = re.compile(r"\s+-\s+.*(remaster|version|edit|mix|live|mono|stereo).*$")
+_FEAT = re.compile(r"\s+(feat\.?|ft\.?|featuring)\s+.*$")
+_ARTIST_SPLIT = re.compile(r"\s*(?:,|&|;|/|\bx\b|\band\b|\bwith\b)\s*")
+_NON_WORD = re.compile(r"[^\w\s]")
+
+
+def _fold(s: str) -> str:
+    s = s.casefold()
+    if s.isascii():
+        return s
+    s = unicodedata.normalize("NFKD", s)
+    return "".join(c for c in s if not unicodedata.combining(c))
+
+
+def norm_title(title: Optional[str]) -> str:
+    if not title:
+        return ""
+    s = _fold(title)
+    # Cheap substring checks first; most titles have nothing to strip
+    if "(" in s or "[" in s:
+        s = _BRACKETS.sub("", s)
+    if " - " in s:
+        s = _SUFFIX.sub("", s)
+    if "f" in s:
+        s = _FEAT.sub("", s)
+    return " ".join(_NON_WORD.sub(" ", s).split())
+
+
+def norm_artist(artist: Optional[str]) -> str:
+    """Primary artist only: 'A, B feat. C' -> 'a'."""
+    if not artist:
+        return ""
+    s = _FEAT.sub("", _fold(artist))
+    s = _ARTIST_SPLIT.split(s, maxsplit=1)[0]
+    s = " ".join(_NON_WORD.sub(" ", s).split())
+    return s[4:] if s.startswith("the ") else s
+
+
+def norm_isrc(isrc: Optional[str]) -> str:
+    return re.sub(r"[^0-9A-Z]", "", isrc.upper()) if isrc else ""
+
+
+def _ngrams(s: str) -> set:
+    padded = f" {s} "
+    return {padded[i:i + NGRAM] for i in range(max(1, len(padded) - NGRAM + 1))}
+
+
+class LibraryIndex:
+    """In-memory blocking structures over local tracks."""
+
+    def __init__(self, rows: List[Tuple[int, Optional[str], Optional[str]]]):
+        self.exact: Dict[Tuple[str, str], int] = {}
+        blocks: Dict[str, List[Tuple[int, str]]] = defaultdict(list)
+        artist_keys: Dict[Optional[str], str] = {}
+        for track_id, title, artist in rows:
+            a = artist_keys.get(artist)
+            if a is None:
+                a = artist_keys[artist] = norm_artist(artist)
+            t = norm_title(title)
+            if not t:
+                continue
+            self.exact.setdefault((a, t), track_id)
+            blocks[a].append((track_id, t))
+        self.artists = list(blocks)
+        self.block_ids = [[tid for tid, _ in blocks[a]] for a in self.artists]
+        self.block_titles = [[t for _, t in blocks[a]] for a in self.artists]
+        self.postings: Dict[str, List[int]] = defaultdict(list)
+        for i, a in enumerate(self.artists):
+            for g in _ngrams(a):
+                self.postings[g].append(i)
+        self._artist_cache: Dict[str, List[Tuple[int, float]]] = {}
+
+    def artist_blocks(self, artist: str) -> List[Tuple[int, float]]:
+        """[(block index, artist similarity 0-100)] for blocks sharing enough trigrams with artist."""
+        cached = self._artist_cache.get(artist)
+        if cached is not None:
+            return cached
+        grams = _ngrams(artist)
+        counts: Counter = Counter()
+        for g in grams:
+            counts.update(self.postings.get(g, ()))
+        # Candidate blocks must share at least half of the query's trigrams
+        shortlist = [i for i, n in counts.most_common(50) if n * 2 >= len(grams)]
+        scored = []
+        if shortlist:
+            names = [self.artists[i] for i in shortlist]
+            for _, score, pos in process.extract(
+                artist, names, scorer=fuzz.token_sort_ratio, limit=MAX_ARTIST_BLOCKS, score_cutoff=ARTIST_CUTOFF
+            ):
+                scored.append((shortlist[pos], score))
+        self._artist_cache[artist] = scored
+        return scored
+
+    def match(self, artist: Optional[str], title: Optional[str]) -> Tuple[Optional[int], float]:
+        a, t = norm_artist(artist), norm_title(title)
+        if not t:
+            return None, 0.0
+        exact = self.exact.get((a, t))
+        if exact is not None:
+            return exact, 1.0
+        best_id, best = None, 0.0
+        blocks = self.artist_blocks(a) if a else []
+        for block, artist_score in blocks:
+            hit = process.extractOne(t, self.block_titles[block], scorer=fuzz.token_sort_ratio)
+            if hit is None:
+                continue
+            _, title_score, pos = hit
+            confidence = (0.4 * artist_score + 0.6 * title_score) / 100.0
+            if confidence > best:
+                best_id, best = self.block_ids[block][pos], confidence
+        return best_id, best
+
+
+def _lookup_isrcs(db, isrcs: List[str], chunk: int = 500) -> Dict[str, int]:
+    """Normalized ISRC -> lowest track id, for the given external ISRCs only.
+
+    Queries both the raw and the normalized spelling with ``isrc IN (...)`` so the
+    lookup stays on idx_tracks_isrc instead of scanning every track.
+    """
+    keys = sorted({k for isrc in isrcs for k in (isrc, isrc.strip().upper(), norm_isrc(isrc)) if k})
+    found: Dict[str, int] = {}
+    for i in range(0, len(keys), chunk):
+        part = keys[i:i + chunk]
+        rows = db.execute(
+            f"SELECT id, isrc FROM tracks WHERE isrc IN ({','.join('?' * len(part))})", part
+        )
+        for track_id, isrc in rows:
+            key = norm_isrc(isrc)
+            found[key] = min(found.get(key, track_id), track_id)
+    return found
+
+
+def match_external_tracks(
+    db_path: Path = DB_PATH,
+    min_confidence: float = MIN_CONFIDENCE,
+    source: Optional[str] = None,
+    batch_size: int = 5000,
+) -> Dict[str, Any]:
+    """Match every unmapped external_tracks row; sets status matched/unmatched, mapped_track_id and confidence."""
+    started = time.perf_counter()
+    db = get_db(db_path)
+    where = "mapped_track_id IS NULL" + (" AND source=?" if source else "")
+    pending = db.execute(
+        f"SELECT id, isrc, title, artist FROM external_tracks WHERE {where}", (source,) if source else ()
+    ).fetchall()
+    stats = {"total": len(pending), "isrc": 0, "exact": 0, "fuzzy": 0, "unmatched": 0}
+    if not pending:
+        stats["elapsed_s"] = round(time.perf_counter() - started, 3)
+        return stats
+
+    isrc_index = _lookup_isrcs(db, [row[1] for row in pending if row[1]])
+    index = LibraryIndex(db.execute("SELECT id, title, artist FROM tracks").fetchall())
+    stats["index_s"] = round(time.perf_counter() - started, 3)
+
+    updates: List[Tuple[str, Optional[int], float, int]] = []
+    for ext_id, isrc, title, artist in pending:
+        track_id = isrc_index.get(norm_isrc(isrc)) if isrc else None
+        if track_id is not None:
+            stats["isrc"] += 1
+            updates.append(("matched", track_id, 1.0, ext_id))
+            continue
+        track_id, confidence = index.match(artist, title)
+        if track_id is not None and confidence >= min_confidence:
+            stats["exact" if confidence == 1.0 else "fuzzy"] += 1
+            updates.append(("matched", track_id, round(confidence, 4), ext_id))
+        else:
+            stats["unmatched"] += 1
+            updates.append(("unmatched", None, round(confidence, 4), ext_id))
+    for i in range(0, len(updates), batch_size):
+        db.executemany(
+            "UPDATE external_tracks SET status=?, mapped_track_id=?, confidence=? WHERE id=?",
+            updates[i:i + batch_size]
+        )
+        db.commit()
+    stats["elapsed_s"] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+if __name__ == '__main__':
+    # python -m backend.app.services.external_match_service [--min-confidence 0.85] [--source spotify]
+    parser = argparse.ArgumentParser(description="Match external_tracks rows to local library tracks")
+    parser.add_argument("--min-confidence", type=float, default=MIN_CONFIDENCE)
+    parser.add_argument("--source", default=None)
+    parser.add_argument("--db", default=str(DB_PATH))
+    args = parser.parse_args()
+    target = Path(args.db).resolve()
+    init_db(target)
+    print(match_external_tracks(target, args.min_confidence, args.source))
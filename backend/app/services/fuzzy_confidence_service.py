@@ -1,11 +1,37 @@
-from rapidfuzz import fuzz
+from rapidfuzz import fuzz, process
 from pathlib import Path
-from typing import Dict, Any
-from ..utils.db_utils import get_db
+from typing import Dict, Any, List, Optional, Tuple
+import argparse
+import time
+import numpy as np
+from ..utils.db_utils import get_db, init_db
 
 DB_PATH = Path('library/db/library.sqlite').resolve()
 
 FIELDS = ["title", "artist", "album"]
+RECALC_BATCH = 50000
+
+
+def _score_rows(rows: List[Tuple[int, str, Optional[str], Optional[str], Optional[str], Optional[str]]]) -> List[Tuple[float, int]]:
+    """rows of (attr_id, field_name, value, title, artist, album) -> (confidence, attr_id) update params.
+
+    Fuzzy fields are scored pairwise in one rapidfuzz call across all cores;
+    other fields are 1.0 when a value is present, else 0.0.
+    """
+    fuzzy_ids, track_vals, attr_vals = [], [], []
+    out: List[Tuple[float, int]] = []
+    for attr_id, field_name, value, title, artist, album in rows:
+        if field_name in FIELDS and value:
+            fuzzy_ids.append(attr_id)
+            track_vals.append({"title": title, "artist": artist, "album": album}[field_name] or "")
+            attr_vals.append(value)
+        else:
+            out.append((1.0 if value else 0.0, attr_id))
+    if fuzzy_ids:
+        # cpdist = element-wise pairs (track value i vs attribution value i), not the full cdist matrix
+        scores = process.cpdist(track_vals, attr_vals, scorer=fuzz.ratio, dtype=np.float64, workers=-1) / 100.0
+        out.extend(zip(scores.tolist(), fuzzy_ids))
+    return out
 
 
 def recalc_confidence(track_id: int):
@@ -14,15 +40,48 @@ def recalc_confidence(track_id: int):
     t = db.execute("SELECT id, title, artist, album FROM tracks WHERE id=?", (track_id,)).fetchone()
     if not t:
         return False
-    track_vals = {"title": t[1] or "", "artist": t[2] or "", "album": t[3] or ""}
-    # Update attribution confidences
-    rows = db.execute("SELECT id, field_name, value FROM metadata_attribution WHERE track_id=? AND reverted=0", (track_id,)).fetchall()
-    for r in rows:
-        attr_id, field_name, value = r
-        if field_name in FIELDS and value:
-            ratio = fuzz.ratio(track_vals.get(field_name, ""), value) / 100.0
-        else:
-            ratio = 1.0 if value else 0.0
-        db.execute("UPDATE metadata_attribution SET confidence=? WHERE id=?", (ratio, attr_id))
+    rows = db.execute(
+        "SELECT id, field_name, value FROM metadata_attribution WHERE track_id=? AND reverted=0", (track_id,)
+    ).fetchall()
+    updates = _score_rows([(r[0], r[1], r[2], t[1], t[2], t[3]) for r in rows])
+    db.executemany("UPDATE metadata_attribution SET confidence=? WHERE id=?", updates)
     db.commit()
     return True
+
+
+def recalc_confidence_all(db_path: Path = DB_PATH, batch_size: int = RECALC_BATCH) -> Dict[str, Any]:
+    """Re-score every non-reverted attribution row against its track, batch by batch (one transaction each)."""
+    db = get_db(db_path)
+    started = time.perf_counter()
+    last_id = 0
+    updated = 0
+    while True:
+        rows = db.execute(
+            """
+            SELECT a.id, a.field_name, a.value, t.title, t.artist, t.album
+            FROM metadata_attribution a JOIN tracks t ON t.id = a.track_id
+            WHERE a.id > ? AND a.reverted = 0
+            ORDER BY a.id LIMIT ?
+            """,
+            (last_id, batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        updates = _score_rows(rows)
+        db.executemany("UPDATE metadata_attribution SET confidence=? WHERE id=?", updates)
+        db.commit()
+        updated += len(updates)
+    return {"updated": updated, "elapsed_s": round(time.perf_counter() - started, 3)}
+
+
+if __name__ == '__main__':
+    # python -m backend.app.services.fuzzy_confidence_service [--db path]
+    parser = argparse.ArgumentParser(description="Recalculate metadata attribution confidence for the whole library")
+    parser.add_argument("--db", default=str(DB_PATH))
+    parser.add_argument("--batch-size", type=int, default=RECALC_BATCH)
+    args = parser.parse_args()
+    target = Path(args.db).resolve()
+    init_db(target)
+    result = recalc_confidence_all(target, args.batch_size)
+    print(f"Recalculated {result['updated']} attribution rows in {result['elapsed_s']}s")
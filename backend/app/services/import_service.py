@@ -0,0 +1,357 @@
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import hashlib
+import json
+import os
+import time
+from ..utils.db_utils import get_db, init_db
+from .metadata_service import extract_metadata
+from .event_service import publish
+from .dedup_service import find_duplicate, fingerprint, replace_with_copy, reserve_dest
+from ..utils.hash_utils import full_hash
+
+# Upload copy buffer; override with UNCHAINED_IMPORT_CHUNK_SIZE (bytes)
+IMPORT_CHUNK_SIZE = int(os.getenv("UNCHAINED_IMPORT_CHUNK_SIZE", str(1 << 20)))
+
+AUDIO_EXTENSIONS = {'.mp3', '.flac', '.wav', '.m4a', '.aac'}
+BATCH_INSERT_SIZE = 500
+# A job still 'running' this long after it started was cut off by a restart
+IMPORT_STALE_SECONDS = 600
+
+
+def stream_to_disk(src: BinaryIO, dest: Path, chunk_size: int = IMPORT_CHUNK_SIZE) -> Tuple[int, str]:
+    """Copy src to dest chunk by chunk, hashing on the fly. Returns (size, blake2b hex)."""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    part = dest.with_name(dest.name + ".part")
+    h = hashlib.blake2b(digest_size=32)
+    size = 0
+    try:
+        with open(part, "wb") as f:
+            while True:
+                chunk = src.read(chunk_size)
+                if not chunk:
+                    break
+                h.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        os.replace(part, dest)
+    except BaseException:
+        part.unlink(missing_ok=True)
+        raise
+    return size, h.hexdigest()
+
+
+def create_import_job(db_path: Path, path_audio: Path, original_name: str, size_bytes: int, content_hash: str) -> int:
+    db = get_db(db_path)
+    cur = db.execute(
+        """
+        INSERT INTO import_jobs (path_audio, original_name, content_hash, size_bytes, status, progress, created_at)
+        VALUES (?, ?, ?, ?, 'queued', 0, datetime('now'))
+        """,
+        (str(path_audio), original_name, content_hash, size_bytes)
+    )
+    db.commit()
+    return cur.lastrowid
+
+
+def get_import_job(db_path: Path, job_id: int) -> Optional[Dict[str, Any]]:
+    db = get_db(db_path)
+    r = db.execute(
+        "SELECT id, path_audio, original_name, content_hash, size_bytes, status, progress, track_id, error, created_at, finished_at FROM import_jobs WHERE id=?",
+        (job_id,)
+    ).fetchone()
+    if not r:
+        return None
+    return {
+        "id": r[0], "path_audio": r[1], "original_name": r[2], "content_hash": r[3], "size_bytes": r[4],
+        "status": r[5], "progress": r[6], "track_id": r[7], "error": r[8], "created_at": r[9], "finished_at": r[10]
+    }
+
+
+def _set_progress(db, job_id: int, status: str, progress: float, message: str):
+    db.execute("UPDATE import_jobs SET status=?, progress=? WHERE id=?", (status, progress, job_id))
+    db.commit()
+    publish({"type": "import_progress", "job_id": job_id, "progress": progress, "message": message, "track_id": None})
+
+
+def process_import_job(db_path: Path, job_id: int, library_metadata: Path) -> Optional[int]:
+    """Extract tags, write the JSON sidecar and insert the track for a queued import."""
+    db = get_db(db_path)
+    # Claim and record started_at in their own commit, so a failure later keeps them
+    cur = db.execute(
+        "UPDATE import_jobs SET status='running', started_at=datetime('now') WHERE id=? AND status='queued'", (job_id,)
+    )
+    db.commit()
+    if not cur.rowcount:
+        return None
+    row = db.execute("SELECT path_audio, original_name, content_hash FROM import_jobs WHERE id=?", (job_id,)).fetchone()
+    dest_path = Path(row[0])
+    content_hash = row[2]
+    json_path = None
+    try:
+        size, partial = fingerprint(dest_path)
+        duplicate_of = find_duplicate(db, dest_path, size, partial, full=content_hash)
+        if duplicate_of is not None:
+            dest_path.unlink(missing_ok=True)
+            db.execute(
+                "UPDATE import_jobs SET status='duplicate', progress=1, track_id=?, finished_at=datetime('now') WHERE id=?",
+                (duplicate_of, job_id)
+            )
+            db.commit()
+            publish({"type": "info", "job_id": job_id, "message": f"Already in library: {row[1]}", "track_id": duplicate_of})
+            return duplicate_of
+
+        _set_progress(db, job_id, "running", 0.1, f"Reading tags: {row[1]}")
+        meta = extract_metadata(dest_path)
+
+        # Keep the extension: "song.mp3" and "song.flac" must not share a sidecar
+        json_path = library_metadata / f"{dest_path.name}.json"
+        with open(json_path, "w", encoding="utf-8") as jf:
+            json.dump(meta, jf, ensure_ascii=False, indent=2)
+        _set_progress(db, job_id, "running", 0.6, f"Saving: {row[1]}")
+
+        cur = db.execute(
+            """
+            INSERT INTO tracks (title, artist, album, year, duration_ms, path_audio, path_metadata, genre,
+                                size_bytes, partial_hash, content_hash, import_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
+            """,
+            (
+                meta.get("title"), meta.get("artist"), meta.get("album"), meta.get("year"),
+                meta.get("duration_ms"), str(dest_path), str(json_path), meta.get("genre"),
+                size, partial, content_hash
+            )
+        )
+        track_id = cur.lastrowid
+        db.execute(
+            "UPDATE import_jobs SET status='done', progress=1, track_id=?, finished_at=datetime('now') WHERE id=?",
+            (track_id, job_id)
+        )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        # No track row points at them (e.g. the same bytes won a content_hash race)
+        dest_path.unlink(missing_ok=True)
+        if json_path is not None:
+            json_path.unlink(missing_ok=True)
+        db.execute(
+            "UPDATE import_jobs SET status='error', error=?, finished_at=datetime('now') WHERE id=?",
+            (str(e), job_id)
+        )
+        db.commit()
+        publish({"type": "info", "job_id": job_id, "message": f"Import failed: {row[1]} ({e})", "track_id": None})
+        return None
+    publish({"type": "upload_complete", "job_id": job_id, "message": meta.get("title") or row[1], "track_id": track_id})
+    return track_id
+
+
+def resume_import_jobs(db_path: Path, library_metadata: Path) -> int:
+    """Startup: finish uploads whose BackgroundTasks job was lost to a restart; returns how many ran."""
+    db = get_db(db_path)
+    db.execute(
+        "UPDATE import_jobs SET status='queued' WHERE status='running' AND started_at < datetime('now', ?)",
+        (f"-{IMPORT_STALE_SECONDS} seconds",)
+    )
+    db.commit()
+    job_ids = [r[0] for r in db.execute("SELECT id FROM import_jobs WHERE status='queued' ORDER BY id").fetchall()]
+    for job_id in job_ids:
+        process_import_job(db_path, job_id, library_metadata)
+    return len(job_ids)
+
+
+# --- Batch import (many files, parallel tag extraction) ---
+
+def iter_audio_files(paths: Iterable[Path], recursive: bool = True) -> Iterator[Path]:
+    """Yield audio files from a mix of file and directory paths."""
+    for p in paths:
+        if p.is_dir():
+            pattern = p.rglob('*') if recursive else p.glob('*')
+            for f in pattern:
+                if f.is_file() and f.suffix.lower() in AUDIO_EXTENSIONS:
+                    yield f
+        elif p.is_file() and p.suffix.lower() in AUDIO_EXTENSIONS:
+            yield p
+
+
+def _fingerprint_file(src: str) -> Tuple[str, Optional[int], Optional[str], Optional[str]]:
+    """Process-pool worker: size + partial hash, read before anything is copied."""
+    try:
+        size, partial = fingerprint(Path(src))
+        return src, size, partial, None
+    except OSError as e:
+        return src, None, None, str(e)
+
+
+def _prepare_file(args: Tuple[str, Optional[str], str]) -> Tuple[str, Optional[Dict[str, Any]], Optional[str], Optional[str]]:
+    """Process-pool worker: optional copy, tag extraction and JSON sidecar (at their reserved paths) for one file."""
+    src, dest, json_path = args
+    try:
+        path = Path(src)
+        if dest:
+            replace_with_copy(path, Path(dest))
+            path = Path(dest)
+        meta = extract_metadata(path)
+        with open(json_path, "w", encoding="utf-8") as jf:
+            json.dump(meta, jf, ensure_ascii=False, indent=2)
+        return str(path), meta, json_path, None
+    except Exception as e:
+        # Nothing of a failed file is left behind: no sidecar, no copy or reserved name
+        Path(json_path).unlink(missing_ok=True)
+        if dest:
+            Path(dest).unlink(missing_ok=True)
+        return src, None, None, str(e)
+
+
+def _insert_batch(db, batch: List[Tuple[str, Dict[str, Any], str, Tuple[int, str]]]):
+    db.executemany(
+        """
+        INSERT INTO tracks (title, artist, album, year, duration_ms, path_audio, path_metadata, genre,
+                            size_bytes, partial_hash, import_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
+        """,
+        [
+            (
+                meta.get("title") or Path(path).stem, meta.get("artist"), meta.get("album"), meta.get("year"),
+                meta.get("duration_ms"), path, json_path, meta.get("genre"), fp[0], fp[1]
+            ) for path, meta, json_path, fp in batch
+        ]
+    )
+    db.commit()
+
+
+def import_batch(
+    db_path: Path,
+    paths: Iterable[Path],
+    library_metadata: Path,
+    library_audio: Optional[Path] = None,
+    workers: Optional[int] = None,
+    batch_size: int = BATCH_INSERT_SIZE,
+    on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """Import many files: tags extracted across a process pool, rows inserted in batched transactions.
+
+    Files already in the library (same bytes) are skipped before anything is
+    copied. library_audio set means files are copied into the library first.
+    """
+    files = [str(p) for p in paths]
+    library_metadata.mkdir(parents=True, exist_ok=True)
+    if library_audio:
+        library_audio.mkdir(parents=True, exist_ok=True)
+    db = get_db(db_path)
+    started = time.perf_counter()
+    imported = 0
+    duplicates = 0
+    errors: List[Dict[str, str]] = []
+    pending: List[Tuple[str, Dict[str, Any], str, Tuple[int, str]]] = []
+
+    def stats() -> Dict[str, Any]:
+        elapsed = time.perf_counter() - started
+        done = imported + duplicates + len(errors)
+        return {
+            "total": len(files), "imported": imported, "duplicates": duplicates, "failed": len(errors),
+            "elapsed_s": round(elapsed, 3), "files_per_second": round(done / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+
+    chunksize = max(1, min(64, len(files) // ((workers or os.cpu_count() or 1) * 4) or 1))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Pass 1: fingerprint and drop duplicates (against the library and within this batch)
+        fingerprints: Dict[str, Tuple[int, str]] = {}
+        # (size, partial hash) -> files kept so far; a partial match is only a candidate,
+        # the full hash (computed lazily, once per file) decides
+        seen: Dict[Tuple[int, str], List[str]] = {}
+        full_hashes: Dict[str, str] = {}
+        jobs = []
+
+        def full_of(path: str) -> str:
+            if path not in full_hashes:
+                full_hashes[path] = full_hash(Path(path))
+            return full_hashes[path]
+
+        for src, size, partial, error in pool.map(_fingerprint_file, files, chunksize=chunksize):
+            if error is not None:
+                errors.append({"path": src, "error": error})
+                continue
+            try:
+                kept = seen.get((size, partial), [])
+                if any(full_of(other) == full_of(src) for other in kept):
+                    duplicates += 1
+                    continue
+                if find_duplicate(db, Path(src), size, partial, full=full_hashes.get(src)) is not None:
+                    duplicates += 1
+                    continue
+            except OSError as e:
+                errors.append({"path": src, "error": str(e)})
+                continue
+            seen.setdefault((size, partial), []).append(src)
+            fingerprints[src] = (size, partial)
+            # Names are claimed now (O_EXCL) and filled in pass 2, so concurrent imports,
+            # uploads and scans copying into the same folders never pick the same file
+            dest = reserve_dest(library_audio, Path(src).name) if library_audio else None
+            # Claimed now so files with the same name from different folders get distinct sidecars
+            json_path = reserve_dest(library_metadata, f"{(dest or Path(src)).name}.json")
+            jobs.append((src, str(dest) if dest else None, str(json_path)))
+        db.commit()
+
+        # Pass 2: copy/link, tags and sidecars in parallel; batched inserts
+        for (src, _, _), (path, meta, json_path, error) in zip(jobs, pool.map(_prepare_file, jobs, chunksize=chunksize)):
+            if error is not None:
+                errors.append({"path": path, "error": error})
+                continue
+            pending.append((path, meta, json_path, fingerprints[src]))
+            if len(pending) >= batch_size:
+                _insert_batch(db, pending)
+                imported += len(pending)
+                pending = []
+                if on_progress:
+                    on_progress(stats())
+    if pending:
+        _insert_batch(db, pending)
+        imported += len(pending)
+    result = stats()
+    result["errors"] = errors[:100]
+    return result
+
+
+def run_batch_import_job(db_path: Path, files: List[Path], library_metadata: Path, library_audio: Optional[Path] = None, workers: Optional[int] = None):
+    """BackgroundTasks entry point: batch import reporting over SSE."""
+    def progress(s: Dict[str, Any]):
+        publish({
+            "type": "import_progress", "progress": s["imported"] / max(1, s["total"]), "track_id": None,
+            "message": f"Imported {s['imported']}/{s['total']} ({s['files_per_second']} files/s)",
+        })
+    result = import_batch(db_path, files, library_metadata, library_audio, workers=workers, on_progress=progress)
+    publish({
+        "type": "info", "track_id": None,
+        "message": (
+            f"Batch import finished: {result['imported']} imported, {result['duplicates']} duplicates skipped, "
+            f"{result['failed']} failed ({result['files_per_second']} files/s)"
+        ),
+    })
+    return result
+
+
+if __name__ == '__main__':
+    # python -m backend.app.services.import_service <file-or-dir>... [--copy] [--workers N]
+    parser = argparse.ArgumentParser(description="Batch import audio files into the UNCHAINED library")
+    parser.add_argument("paths", nargs="+", help="audio files and/or directories")
+    parser.add_argument("--copy", action="store_true", help="copy files into library/audio")
+    parser.add_argument("--workers", type=int, default=None, help="tag extraction processes (default: CPU count)")
+    parser.add_argument("--no-recursive", action="store_true", help="do not descend into subdirectories")
+    parser.add_argument("--db", default="library/db/library.sqlite")
+    args = parser.parse_args()
+    db_file = Path(args.db).resolve()
+    db_file.parent.mkdir(parents=True, exist_ok=True)
+    init_db(db_file)
+    summary = import_batch(
+        db_file,
+        iter_audio_files((Path(p) for p in args.paths), recursive=not args.no_recursive),
+        Path("library/metadata").resolve(),
+        Path("library/audio").resolve() if args.copy else None,
+        workers=args.workers,
+        on_progress=lambda s: print(f"  {s['imported']}/{s['total']} imported, {s['files_per_second']} files/s"),
+    )
+    print(f"Imported {summary['imported']} of {summary['total']} files "
+          f"in {summary['elapsed_s']}s ({summary['files_per_second']} files/s), "
+          f"{summary['duplicates']} duplicates skipped, {summary['failed']} failed")
@@ -1,52 +1,350 @@
 from pathlib import Path
-from typing import Optional
-import plistlib
-import shutil
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+import os
+import time
+import xml.etree.ElementTree as ET
 
 from ..utils.db_utils import get_db
+from ..utils.hash_utils import full_hash
+from .dedup_service import find_duplicate, fingerprint, replace_with_copy, reserve_dest
+from .event_service import publish
+from .import_service import BATCH_INSERT_SIZE
 
+DB_PATH = Path('library/db/library.sqlite').resolve()
+COPY_THREADS = 8
 
-def import_itunes_library(library_xml: Path, copy_files: bool, library_audio: Path) -> int:
-    if not library_xml.exists():
-        return 0
-    with open(library_xml, 'rb') as f:
-        pl = plistlib.load(f)
-    tracks = pl.get('Tracks', {})
-    imported = 0
-    db = get_db(Path('library/db/library.sqlite').resolve())
-    for tid, t in tracks.items():
-        location = t.get('Location')
-        name = t.get('Name')
-        artist = t.get('Artist')
-        album = t.get('Album')
-        year = t.get('Year')
-        duration_ms = int((t.get('Total Time') or 0))
-        if not location:
-            continue
-        # iTunes URL like file://; decode path
-        from urllib.parse import unquote, urlparse
-        p = urlparse(location)
-        if p.scheme != 'file':
+# Library.xml is a plist of {Tracks: {id: {...}}, Playlists: [{...}]}, often 100+ MB.
+# It is read with iterparse so only one track/playlist dict is materialized at a time.
+
+
+def _plist_value(elem: ET.Element) -> Any:
+    tag = elem.tag
+    if tag == "dict":
+        out: Dict[str, Any] = {}
+        key = None
+        for child in elem:
+            if child.tag == "key":
+                key = child.text
+            else:
+                out[key] = _plist_value(child)
+        return out
+    if tag == "array":
+        return [_plist_value(child) for child in elem]
+    if tag == "integer":
+        return int(elem.text)
+    if tag == "real":
+        return float(elem.text)
+    if tag == "true":
+        return True
+    if tag == "false":
+        return False
+    return elem.text or ""
+
+
+def iter_library(source) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Yield ("track", dict) and ("playlist", dict) items from an iTunes Library.xml, in file order."""
+    level = 0
+    last_key = None
+    section = None
+    container = None
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            level += 1
+            # plist(1) > dict(2) > Tracks dict / Playlists array(3) > item dict(4)
+            if level == 3 and elem.tag in ("dict", "array") and last_key in ("Tracks", "Playlists"):
+                section, container = last_key, elem
             continue
-        src_path = Path(unquote(p.path))
-        if copy_files:
-            dest = library_audio / src_path.name
-            try:
-                dest.parent.mkdir(parents=True, exist_ok=True)
-                if not dest.exists():
-                    shutil.copy2(src_path, dest)
-                path_audio = str(dest)
-            except Exception:
-                continue
-        else:
-            path_audio = str(src_path)
+        if level == 4 and section is not None and elem.tag == "dict":
+            yield ("track" if section == "Tracks" else "playlist"), _plist_value(elem)
+            # Drop everything parsed so far in this section
+            container.clear()
+        elif level == 3:
+            if elem.tag == "key":
+                last_key = elem.text
+            else:
+                section = container = None
+                last_key = None
+            elem.clear()
+        level -= 1
+
+
+def _file_path(location: Optional[str]) -> Optional[Path]:
+    if not location:
+        return None
+    p = urlparse(location)
+    if p.scheme != 'file':
+        return None
+    return Path(url2pathname(p.path))
+
+
+def _fingerprint(src: Path) -> Tuple[Optional[Tuple[int, str]], Optional[str]]:
+    """Copy-pool worker: (size, partial hash) of a referenced file, or the error."""
+    try:
+        return fingerprint(src), None
+    except OSError as e:
+        return None, str(e)
+
+
+def _copy(src: Path, dest: Path) -> Optional[str]:
+    try:
+        replace_with_copy(src, dest)
+        return None
+    except OSError as e:
+        dest.unlink(missing_ok=True)  # give the reserved name back
+        return str(e)
+
+
+def _track_row(t: Dict[str, Any], path_audio: str, fp: Tuple[int, str]) -> Tuple:
+    bpm = t.get('BPM')
+    return (
+        t.get('Name') or Path(path_audio).stem, t.get('Artist'), t.get('Album'), t.get('Year'),
+        int(t.get('Total Time') or 0), t.get('Genre'), t.get('Track Number'), t.get('Disc Number'),
+        path_audio, fp[0], fp[1], t.get('Play Count') or 0, t.get('Rating'), float(bpm) if bpm else None,
+        t.get('Persistent ID'),
+    )
+
+
+def _insert_tracks(db, rows: List[Tuple]):
+    # Re-importing the same library refreshes play counts, ratings and BPM instead of adding rows
+    db.executemany(
+        """
+        INSERT INTO tracks (title, artist, album, year, duration_ms, genre, track_number, disc_number,
+                            path_audio, size_bytes, partial_hash, play_count, rating, bpm, itunes_persistent_id, import_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
+        ON CONFLICT(itunes_persistent_id) WHERE itunes_persistent_id IS NOT NULL DO UPDATE SET
+            play_count=excluded.play_count, rating=excluded.rating, bpm=COALESCE(excluded.bpm, bpm)
+        """,
+        rows
+    )
+    db.commit()
+
+
+def _update_stats(db, rows: List[Tuple]) -> int:
+    """Carry iTunes stats over to existing tracks; returns how many rows actually changed."""
+    cur = db.executemany(
+        """
+        UPDATE tracks SET play_count=MAX(COALESCE(play_count, 0), :plays), rating=COALESCE(:rating, rating),
+            bpm=COALESCE(bpm, :bpm)
+        WHERE id=:id AND (COALESCE(play_count, 0) < :plays OR (:rating IS NOT NULL AND rating IS NOT :rating)
+                          OR (bpm IS NULL AND :bpm IS NOT NULL))
+        """,
+        [{"plays": plays, "rating": rating, "bpm": bpm, "id": track_id} for plays, rating, bpm, track_id in rows]
+    )
+    return max(cur.rowcount, 0)
+
+
+def _playlist_id(db, info: Dict[str, Any]) -> int:
+    """Upsert an iTunes playlist. Without a Playlist Persistent ID it is keyed on (name, parent)."""
+    pid = info['Playlist Persistent ID']
+    if pid:
         db.execute(
             """
-            INSERT INTO tracks (title, artist, album, year, duration_ms, path_audio, import_date)
-            VALUES (?, ?, ?, ?, ?, ?, datetime('now'))
+            INSERT INTO playlists (name, source, external_id, parent_external_id, created_at)
+            VALUES (?, 'itunes', ?, ?, datetime('now'))
+            ON CONFLICT(source, external_id) DO UPDATE SET name=excluded.name, parent_external_id=excluded.parent_external_id
             """,
-            (name, artist, album, year, duration_ms, path_audio)
+            (info['Name'], pid, info['Parent Persistent ID'])
         )
-        imported += 1
+        return db.execute("SELECT id FROM playlists WHERE source='itunes' AND external_id=?", (pid,)).fetchone()[0]
+    row = db.execute(
+        "SELECT id FROM playlists WHERE source='itunes' AND external_id IS NULL AND name IS ? AND parent_external_id IS ? "
+        "ORDER BY id LIMIT 1",
+        (info['Name'], info['Parent Persistent ID'])
+    ).fetchone()
+    if row:
+        return row[0]
+    return db.execute(
+        "INSERT INTO playlists (name, source, external_id, parent_external_id, created_at) VALUES (?, 'itunes', NULL, ?, datetime('now'))",
+        (info['Name'], info['Parent Persistent ID'])
+    ).lastrowid
+
+
+def import_itunes_library(
+    library_xml: Path,
+    copy_files: bool,
+    library_audio: Path,
+    db_path: Path = DB_PATH,
+    threads: int = COPY_THREADS,
+    batch_size: int = BATCH_INSERT_SIZE,
+    on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """Import tracks, play counts, ratings, BPM and playlists from an iTunes Library.xml in one pass.
+
+    Referenced files are fingerprinted (and copied, if copy_files) on a bounded
+    thread pool while the XML is still being read; rows go in by executemany.
+    """
+    stats = {"imported": 0, "updated": 0, "unchanged": 0, "duplicates": 0, "missing": 0, "playlists": 0, "playlist_tracks": 0}
+    if not library_xml.exists():
+        return stats
+    started = time.perf_counter()
+    db = get_db(db_path)
+    known: Dict[str, int] = dict(db.execute(
+        "SELECT itunes_persistent_id, id FROM tracks WHERE itunes_persistent_id IS NOT NULL"
+    ).fetchall())
+    # iTunes "Track ID" -> our track id (ints) or the path_audio of its pending row (str);
+    # keyed by row, not Persistent ID, which some entries lack
+    id_map: Dict[int, Any] = {}
+    # (size, partial hash) -> (source path, pending row key) of every file kept so far;
+    # a partial match is only a candidate, the full hash (computed once per file) decides
+    seen: Dict[Tuple[int, str], List[Tuple[str, str]]] = {}
+    full_hashes: Dict[str, str] = {}
+    rows: List[Tuple] = []
+    stat_rows: List[Tuple] = []
+    in_flight: Deque[Tuple[str, Dict[str, Any], Path, Future]] = deque()
+    copies: Deque[Tuple[Dict[str, Any], Path, Tuple[int, str], Future]] = deque()
+    max_in_flight = threads * 8
+    total_bytes = os.path.getsize(library_xml) or 1
+
+    def progress():
+        if on_progress is not None:
+            s = dict(stats)
+            s["progress"] = round(min(1.0, fh.tell() / total_bytes), 3)
+            s["elapsed_s"] = round(time.perf_counter() - started, 3)
+            on_progress(s)
+
+    def flush_rows():
+        nonlocal rows, stat_rows
+        if stat_rows:
+            changed = _update_stats(db, stat_rows)
+            stats["updated"] += changed
+            stats["unchanged"] += len(stat_rows) - changed
+            stat_rows = []
+        if rows:
+            _insert_tracks(db, rows)
+            stats["imported"] += len(rows)
+            rows = []
+        db.commit()
+        progress()
+
+    def add_row(t: Dict[str, Any], path_audio: str, fp: Tuple[int, str]):
+        rows.append(_track_row(t, path_audio, fp))
+        if len(rows) >= batch_size:
+            flush_rows()
+
+    def finish_copy(block: bool):
+        while copies and (block or copies[0][3].done() or len(copies) >= max_in_flight):
+            t, dest, fp, fut = copies.popleft()
+            if fut.result() is not None:
+                stats["missing"] += 1
+                id_map.pop(t.get('Track ID'), None)
+                continue
+            add_row(t, str(dest), fp)
+
+    def full_of(path: str) -> str:
+        if path not in full_hashes:
+            full_hashes[path] = full_hash(Path(path))
+        return full_hashes[path]
+
+    def finish_fingerprint(block: bool):
+        while in_flight and (block or in_flight[0][3].done() or len(in_flight) >= max_in_flight):
+            pid, t, src, fut = in_flight.popleft()
+            fp, error = fut.result()
+            if fp is None:
+                stats["missing"] += 1
+                continue
+            try:
+                dup_of = next((key for other, key in seen.get(fp, ()) if full_of(other) == full_of(str(src))), None)
+                if dup_of is None:
+                    dup_of = find_duplicate(db, src, fp[0], fp[1], full=full_hashes.get(str(src)))
+            except OSError:
+                stats["missing"] += 1
+                continue
+            if dup_of is not None:
+                # Same audio already in the library: keep its row, carry over iTunes stats
+                stats["duplicates"] += 1
+                id_map[t.get('Track ID')] = dup_of
+                if isinstance(dup_of, int):
+                    stat_rows.append((t.get('Play Count') or 0, t.get('Rating'), t.get('BPM'), dup_of))
+                continue
+            dest = reserve_dest(library_audio, src.name) if copy_files else src
+            seen.setdefault(fp, []).append((str(src), str(dest)))
+            id_map[t.get('Track ID')] = str(dest)
+            if copy_files:
+                copies.append((t, dest, fp, pool.submit(_copy, src, dest)))
+            else:
+                add_row(t, str(src), fp)
+        finish_copy(block=False)
+
+    def resolve_playlist_ids():
+        paths = list({v for v in id_map.values() if isinstance(v, str)})
+        inserted: Dict[str, int] = {}
+        for i in range(0, len(paths), 500):
+            chunk = paths[i:i + 500]
+            inserted.update(db.execute(
+                f"SELECT path_audio, MAX(id) FROM tracks WHERE path_audio IN ({','.join('?' * len(chunk))}) GROUP BY path_audio",
+                chunk
+            ).fetchall())
+        for tid, v in list(id_map.items()):
+            id_map[tid] = inserted.get(v) if isinstance(v, str) else v
+
+    library_audio.mkdir(parents=True, exist_ok=True)
+    playlists: List[Tuple[Dict[str, Any], List[int]]] = []
+    with open(library_xml, 'rb') as fh, ThreadPoolExecutor(max_workers=threads) as pool:
+        for kind, item in iter_library(fh):
+            if kind == "playlist":
+                # Kept as bare Track IDs and written once every track has a row
+                if not (item.get('Master') or item.get('Distinguished Kind') or item.get('Folder')):
+                    playlists.append((
+                        {k: item.get(k) for k in ('Name', 'Playlist Persistent ID', 'Parent Persistent ID')},
+                        [entry.get('Track ID') for entry in item.get('Playlist Items', [])],
+                    ))
+                continue
+            pid = item.get('Persistent ID')
+            if pid and pid in known:
+                id_map[item.get('Track ID')] = known[pid]
+                stat_rows.append((item.get('Play Count') or 0, item.get('Rating'), item.get('BPM'), known[pid]))
+                if len(stat_rows) >= batch_size:
+                    flush_rows()
+                continue
+            src = _file_path(item.get('Location'))
+            if src is None:
+                continue
+            in_flight.append((pid, item, src, pool.submit(_fingerprint, src)))
+            finish_fingerprint(block=False)
+        finish_fingerprint(block=True)
+        finish_copy(block=True)
+        flush_rows()
+
+    resolve_playlist_ids()
+    for info, items in playlists:
+        track_ids = [id_map[tid] for tid in items if id_map.get(tid)]
+        playlist_id = _playlist_id(db, info)
+        db.execute("DELETE FROM playlist_tracks WHERE playlist_id=?", (playlist_id,))
+        db.executemany(
+            "INSERT INTO playlist_tracks (playlist_id, position, track_id) VALUES (?, ?, ?)",
+            [(playlist_id, pos, tid) for pos, tid in enumerate(track_ids)]
+        )
+        stats["playlists"] += 1
+        stats["playlist_tracks"] += len(track_ids)
     db.commit()
-    return imported
+    elapsed = time.perf_counter() - started
+    stats["elapsed_s"] = round(elapsed, 3)
+    done = stats["imported"] + stats["updated"] + stats["unchanged"] + stats["duplicates"]
+    stats["tracks_per_second"] = round(done / elapsed, 1) if elapsed > 0 else 0.0
+    return stats
+
+
+def run_itunes_import_job(library_xml: Path, copy_files: bool, library_audio: Path, db_path: Path = DB_PATH):
+    """BackgroundTasks entry point: iTunes import reporting over SSE."""
+    def progress(s: Dict[str, Any]):
+        publish({
+            "type": "import_progress", "progress": s["progress"], "track_id": None,
+            "message": f"iTunes: {s['imported']} imported, {s['updated']} updated, {s['duplicates']} duplicates",
+        })
+    try:
+        result = import_itunes_library(library_xml, copy_files, library_audio, db_path=db_path, on_progress=progress)
+    except ET.ParseError as e:
+        publish({"type": "info", "track_id": None, "message": f"iTunes import failed: {e}"})
+        return None
+    publish({
+        "type": "info", "track_id": None,
+        "message": (
+            f"iTunes import finished: {result['imported']} imported, {result['updated']} updated, "
+            f"{result['duplicates']} duplicates skipped, {result['playlists']} playlists"
+        ),
+    })
+    return result
@@ -1,29 +1,246 @@
 from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+import os
+import time
 from ..utils.db_utils import get_db
+from ..utils.hash_utils import partial_hash
+from .metadata_service import extract_metadata
+from .import_service import AUDIO_EXTENSIONS, BATCH_INSERT_SIZE
+from .dedup_service import find_duplicate, replace_with_copy, reserve_dest
 
-# Index or copy local files from a folder into the library
+DB_PATH = Path('library/db/library.sqlite').resolve()
+SCAN_WALK_THREADS = 8
 
-def scan_local_folder(folder: Path, library_audio: Path, copy: bool = False) -> int:
-    if not folder.exists():
-        return 0
-    db = get_db(Path('library/db/library.sqlite').resolve())
-    count = 0
-    for p in folder.rglob('*'):
-        if p.is_file() and p.suffix.lower() in {'.mp3', '.flac', '.wav', '.m4a', '.aac'}:
-            dest_path = p
-            if copy:
-                dest_path = library_audio / p.name
+# Incrementally index (or copy) local files from a folder into the library.
+# scan_state remembers size/mtime/partial hash per path, so rescans only touch
+# new or changed files, and vanished files are matched to new ones by hash (moves).
+
+
+def list_audio_dir(path: str) -> Tuple[List[Tuple[str, int, int]], List[str]]:
+    files: List[Tuple[str, int, int]] = []
+    subdirs: List[str] = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
                 try:
-                    dest_path.parent.mkdir(parents=True, exist_ok=True)
-                    if not dest_path.exists():
-                        from shutil import copy2
-                        copy2(p, dest_path)
-                except Exception:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in AUDIO_EXTENSIONS:
+                        st = entry.stat()
+                        files.append((entry.path, st.st_size, st.st_mtime_ns))
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return files, subdirs
+
+
+def walk_audio_files(root: Path, threads: int = SCAN_WALK_THREADS) -> Dict[str, Tuple[int, int]]:
+    """Parallel os.scandir traversal; returns {path: (size, mtime_ns)}."""
+    found: Dict[str, Tuple[int, int]] = {}
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        pending = {pool.submit(list_audio_dir, str(root))}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                files, subdirs = fut.result()
+                for path, size, mtime_ns in files:
+                    found[path] = (size, mtime_ns)
+                for d in subdirs:
+                    pending.add(pool.submit(list_audio_dir, d))
+    return found
+
+
+def _fingerprint(path: str) -> Tuple[str, Optional[str], Optional[Dict[str, Any]]]:
+    """Process-pool worker: partial hash and tags for one file."""
+    try:
+        return path, partial_hash(Path(path)), extract_metadata(Path(path))
+    except Exception:
+        # One unreadable or malformed file must not abort the whole pool.map
+        return path, None, None
+
+
+def _refresh_copy(db, track_id: int, src: Path, library_audio: Path) -> bool:
+    """Replace the library copy of a changed source file; the track keeps its path_audio."""
+    row = db.execute("SELECT path_audio FROM tracks WHERE id=?", (track_id,)).fetchone()
+    dest = Path(row[0]) if row and row[0] else reserve_dest(library_audio, src.name)
+    if dest == src:
+        return True
+    try:
+        replace_with_copy(src, dest)
+    except OSError:
+        return False
+    db.execute("UPDATE tracks SET path_audio=? WHERE id=?", (str(dest), track_id))
+    return True
+
+
+def _load_state(db, root: str) -> Dict[str, Tuple[int, int, Optional[str], Optional[int], int]]:
+    prefix = root.rstrip(os.sep) + os.sep
+    # Prefix range scan on the primary key: [prefix, prefix with last char bumped)
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    rows = db.execute(
+        "SELECT path, size_bytes, mtime_ns, partial_hash, track_id, missing FROM scan_state WHERE path >= ? AND path < ?",
+        (prefix, upper)
+    ).fetchall()
+    return {r[0]: (r[1], r[2], r[3], r[4], r[5]) for r in rows}
+
+
+def scan_local_folder(folder: Path, library_audio: Path, copy: bool = False, workers: Optional[int] = None) -> Dict[str, Any]:
+    if not folder.exists():
+        return {"indexed": 0, "updated": 0, "moved": 0, "missing": 0, "duplicates": 0, "unchanged": 0}
+    started = time.perf_counter()
+    root = str(folder.resolve())
+    db = get_db(DB_PATH)
+    state = _load_state(db, root)
+    found = walk_audio_files(Path(root))
+    result = _sync(db, found, state, library_audio, copy, workers)
+    result["elapsed_s"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def sync_paths(
+    paths: List[str],
+    library_audio: Path,
+    copy: bool = False,
+    workers: Optional[int] = None,
+    dirs: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """Incrementally sync an explicit set of created/modified/deleted paths (watcher batches).
+    dirs are whole subtrees that were created, moved or deleted: their files on disk and
+    their known scan_state rows are all reconciled."""
+    db = get_db(DB_PATH)
+    found: Dict[str, Tuple[int, int]] = {}
+    for p in set(paths):
+        if os.path.splitext(p)[1].lower() not in AUDIO_EXTENSIONS:
+            continue
+        try:
+            st = os.stat(p)
+            found[p] = (st.st_size, st.st_mtime_ns)
+        except OSError:
+            pass
+    state: Dict[str, Tuple[int, int, Optional[str], Optional[int], int]] = {}
+    wanted = list(set(paths))
+    for i in range(0, len(wanted), 500):
+        chunk = wanted[i:i + 500]
+        rows = db.execute(
+            f"SELECT path, size_bytes, mtime_ns, partial_hash, track_id, missing FROM scan_state WHERE path IN ({','.join('?' * len(chunk))})",
+            chunk
+        ).fetchall()
+        state.update({r[0]: (r[1], r[2], r[3], r[4], r[5]) for r in rows})
+    for d in set(dirs or ()):
+        found.update(walk_audio_files(Path(d)))
+        state.update(_load_state(db, d))
+    # Previously vanished files stay move candidates
+    for r in db.execute("SELECT path, size_bytes, mtime_ns, partial_hash, track_id, missing FROM scan_state WHERE missing=1").fetchall():
+        state.setdefault(r[0], (r[1], r[2], r[3], r[4], r[5]))
+    return _sync(db, found, state, library_audio, copy, workers)
+
+
+def _sync(
+    db,
+    found: Dict[str, Tuple[int, int]],
+    state: Dict[str, Tuple[int, int, Optional[str], Optional[int], int]],
+    library_audio: Path,
+    copy: bool,
+    workers: Optional[int],
+) -> Dict[str, Any]:
+    new_paths: List[str] = []
+    changed_paths: List[str] = []
+    unchanged = 0
+    for path, (size, mtime_ns) in found.items():
+        prev = state.get(path)
+        if prev is None:
+            new_paths.append(path)
+        elif prev[0] != size or prev[1] != mtime_ns or prev[3] is None:
+            changed_paths.append(path)
+        elif prev[4]:
+            # Same file came back at the same path
+            db.execute("UPDATE scan_state SET missing=0 WHERE path=?", (path,))
+            unchanged += 1
+        else:
+            unchanged += 1
+    gone = {p: s for p, s in state.items() if p not in found and not s[4]}
+    # Vanished files (this scan or earlier ones) are move candidates, keyed by hash
+    move_sources = {s[2]: (p, s[3]) for p, s in state.items() if p not in found and s[2]}
+
+    indexed = updated = moved = duplicates = 0
+    pending_rows = 0
+    todo = new_paths + changed_paths
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunksize = max(1, min(64, len(todo) // ((workers or os.cpu_count() or 1) * 4) or 1))
+            for path, phash, meta in pool.map(_fingerprint, todo, chunksize=chunksize):
+                if phash is None:
                     continue
-            db.execute(
-                "INSERT INTO tracks (title, artist, album, path_audio, import_date) VALUES (?, ?, ?, ?, datetime('now'))",
-                (p.stem, None, None, str(dest_path))
-            )
-            count += 1
+                size, mtime_ns = found[path]
+                meta = meta or {}
+                prev = state.get(path)
+                track_id = prev[3] if prev else None
+                if prev is None and phash in move_sources:
+                    old_path, track_id = move_sources.pop(phash)
+                    gone.pop(old_path, None)
+                    db.execute("DELETE FROM scan_state WHERE path=?", (old_path,))
+                    if track_id and not copy:
+                        db.execute("UPDATE tracks SET path_audio=? WHERE id=?", (path, track_id))
+                    moved += 1
+                elif track_id:
+                    if copy and not _refresh_copy(db, track_id, Path(path), library_audio):
+                        continue
+                    # New bytes: the cached full hash is stale and is recomputed on demand
+                    db.execute(
+                        "UPDATE tracks SET title=COALESCE(?, title), artist=COALESCE(?, artist), album=COALESCE(?, album), "
+                        "year=COALESCE(?, year), duration_ms=COALESCE(?, duration_ms), genre=COALESCE(?, genre), "
+                        "size_bytes=?, partial_hash=?, content_hash=NULL WHERE id=?",
+                        (meta.get("title"), meta.get("artist"), meta.get("album"), meta.get("year"),
+                         meta.get("duration_ms"), meta.get("genre"), size, phash, track_id)
+                    )
+                    updated += 1
+                else:
+                    # Rows from the previous non-incremental scanner are adopted, not duplicated
+                    legacy_path = str(library_audio / Path(path).name) if copy else path
+                    existing = db.execute("SELECT id FROM tracks WHERE path_audio=? LIMIT 1", (legacy_path,)).fetchone()
+                    if existing:
+                        track_id = existing[0]
+                    elif find_duplicate(db, Path(path), size, phash) is not None:
+                        # Same bytes already in the library under another path
+                        duplicates += 1
+                    else:
+                        dest_path = path
+                        if copy:
+                            dest = reserve_dest(library_audio, Path(path).name)
+                            try:
+                                replace_with_copy(Path(path), dest)
+                            except OSError:
+                                dest.unlink(missing_ok=True)
+                                continue
+                            dest_path = str(dest)
+                        cur = db.execute(
+                            """
+                            INSERT INTO tracks (title, artist, album, year, duration_ms, path_audio, genre,
+                                                size_bytes, partial_hash, import_date)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
+                            """,
+                            (meta.get("title") or Path(path).stem, meta.get("artist"), meta.get("album"),
+                             meta.get("year"), meta.get("duration_ms"), dest_path, meta.get("genre"),
+                             size, phash)
+                        )
+                        track_id = cur.lastrowid
+                        indexed += 1
+                db.execute(
+                    "INSERT OR REPLACE INTO scan_state (path, size_bytes, mtime_ns, partial_hash, track_id, missing, scanned_at) "
+                    "VALUES (?, ?, ?, ?, ?, 0, datetime('now'))",
+                    (path, size, mtime_ns, phash, track_id)
+                )
+                pending_rows += 1
+                if pending_rows >= BATCH_INSERT_SIZE:
+                    db.commit()
+                    pending_rows = 0
+    # Not deleted from tracks: cues, loops and provenance stay attached until the user decides
+    if gone:
+        db.executemany("UPDATE scan_state SET missing=1 WHERE path=?", ((p,) for p in gone))
     db.commit()
-    return count
+    return {
+        "indexed": indexed, "updated": updated, "moved": moved, "missing": len(gone),
+        "duplicates": duplicates, "unchanged": unchanged,
+    }
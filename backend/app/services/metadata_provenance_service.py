@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterable, List, Tuple
 from ..utils.db_utils import get_db
 
 DB_PATH = Path('library/db/library.sqlite').resolve()
@@ -7,15 +7,20 @@ DB_PATH = Path('library/db/library.sqlite').resolve()
 PROVENANCE_FIELDS = ["title", "artist", "album", "year", "duration_ms", "path_cover"]
 
 
-def record_field_attribution(track_id: int, field_name: str, value: Any, source: str, candidate_id: int, confidence: float):
-    if field_name not in PROVENANCE_FIELDS:
-        return
-    db = get_db(DB_PATH)
-    db.execute(
+def attribution_rows(track_id: int, values: Dict[str, Any], source: str, candidate_id: int, confidence: float) -> List[Tuple]:
+    """Rows for insert_attributions(), one per provenance-tracked field in values."""
+    return [
+        (track_id, field, str(value) if value is not None else None, source, candidate_id, confidence)
+        for field, value in values.items() if field in PROVENANCE_FIELDS
+    ]
+
+
+def insert_attributions(db, rows: Iterable[Tuple]):
+    """Batch insert (track_id, field, value, source, candidate_id, confidence); the caller commits."""
+    db.executemany(
         "INSERT INTO metadata_attribution (track_id, field_name, value, source, candidate_id, confidence, applied_at) VALUES (?, ?, ?, ?, ?, ?, datetime('now'))",
-        (track_id, field_name, str(value) if value is not None else None, source, candidate_id, confidence)
+        rows
     )
-    db.commit()
 
 
 def get_attribution(track_id: int) -> List[Dict[str, Any]]:
@@ -1,10 +1,13 @@
-from typing import List, Dict, Any, Optional
+from typing import Awaitable, Callable, List, Dict, Any, Optional, Set, Tuple
 from pathlib import Path
+import asyncio
+import os
+import re
 from .musicbrainz_service import search_musicbrainz_release
 from .discogs_service import search_discogs_release
 from ..utils.db_utils import get_db
-from .cover_service import download_cover_if_needed
-from .metadata_provenance_service import record_field_attribution
+from .cover_service import queue_cover_download
+from .metadata_provenance_service import attribution_rows, insert_attributions
 import hashlib
 
 # Simple normalization helpers
@@ -31,15 +34,10 @@ def _score(candidate: Dict[str, Any]) -> float:
     return score
 
 
-def aggregate_metadata(artist: Optional[str], album: Optional[str], title: Optional[str], discogs_token: Optional[str] = None) -> List[Dict[str, Any]]:
-    mb = search_musicbrainz_release(artist=artist, album=album, title=title)
-    discogs_query = " ".join(x for x in [artist, album, title] if x) or (title or artist or album or "")
-    dg = search_discogs_release(query=discogs_query, token=discogs_token)
-
-    candidates: List[Dict[str, Any]] = []
-
-    for r in mb.get('recordings', []):
-        cand = {
+async def _musicbrainz_candidates(artist: Optional[str], album: Optional[str], title: Optional[str], options: Dict[str, Any]) -> List[Dict[str, Any]]:
+    mb = await search_musicbrainz_release(artist=artist, album=album, title=title)
+    return [
+        {
             'source': 'musicbrainz',
             'title': _norm(r.get('title')),
             'artist': _norm(r.get('artist')),
@@ -48,24 +46,108 @@ def aggregate_metadata(artist: Optional[str], album: Optional[str], title: Optio
             'length_ms': r.get('length'),
             'cover_url': None,
         }
-        cand['score'] = _score(cand)
-        candidates.append(cand)
+        for r in mb.get('recordings', [])
+    ]
 
+
+def _split_discogs_title(text: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """Discogs search titles read "Artist - Title"; artists may carry a "(2)" or "*" disambiguator."""
+    if not text or " - " not in text:
+        return None, text
+    artist, title = text.split(" - ", 1)
+    return re.sub(r"\s*\(\d+\)$", "", artist.strip().rstrip("*")), title
+
+
+async def _discogs_candidates(artist: Optional[str], album: Optional[str], title: Optional[str], options: Dict[str, Any]) -> List[Dict[str, Any]]:
+    discogs_query = " ".join(x for x in [artist, album, title] if x) or (title or artist or album or "")
+    dg = await search_discogs_release(query=discogs_query, token=options.get('discogs_token'))
+    candidates = []
     for r in dg.get('results', []):
-        cand = {
+        # The artist comes from the result itself, never from the query, so it can disagree
+        dg_artist, dg_title = _split_discogs_title(r.get('title'))
+        candidates.append({
             'source': 'discogs',
-            'title': _norm(r.get('title')),
-            'artist': _norm(artist),
-            'album': _norm(r.get('title')) if r.get('type') == 'release' else _norm(album),
+            'title': _norm(dg_title),
+            'artist': _norm(dg_artist),
+            'album': _norm(dg_title) if r.get('type') == 'release' else _norm(album),
             'year': r.get('year'),
             'length_ms': None,
             'cover_url': r.get('cover'),
-        }
-        cand['score'] = _score(cand)
-        candidates.append(cand)
+        })
+    return candidates
+
+
+# Candidate sources queried concurrently by aggregate_metadata. A source is
+# async fn(artist, album, title, options) -> [candidate, ...] with its own
+# deadline in seconds; register_source() lets other providers (iTunes Search,
+# Deezer, local matches, ...) join the fan-out.
+SourceFn = Callable[[Optional[str], Optional[str], Optional[str], Dict[str, Any]], Awaitable[List[Dict[str, Any]]]]
+SOURCE_DEADLINE_SECONDS = float(os.getenv("UNCHAINED_SOURCE_DEADLINE", "8"))
+METADATA_SOURCES: Dict[str, Tuple[SourceFn, float]] = {}
+# Lookups still running after their deadline finish in the background (warming the cache)
+_stragglers: Set[asyncio.Task] = set()
+
+
+def register_source(name: str, fn: SourceFn, deadline: Optional[float] = None):
+    METADATA_SOURCES[name] = (fn, deadline or SOURCE_DEADLINE_SECONDS)
+
+
+def unregister_source(name: str):
+    METADATA_SOURCES.pop(name, None)
+
+
+register_source('musicbrainz', _musicbrainz_candidates)
+register_source('discogs', _discogs_candidates)
+
+
+def _release_straggler(task: asyncio.Task):
+    _stragglers.discard(task)
+    if not task.cancelled():
+        task.exception()
+
+
+async def _bounded(task: asyncio.Task, deadline: float) -> Tuple[Optional[List[Dict[str, Any]]], str]:
+    done, _ = await asyncio.wait({task}, timeout=deadline)
+    if not done:
+        _stragglers.add(task)
+        task.add_done_callback(_release_straggler)
+        return None, 'timeout'
+    if task.exception() is not None:
+        return None, 'error'
+    return task.result(), 'ok'
+
+
+async def gather_candidates(
+    artist: Optional[str],
+    album: Optional[str],
+    title: Optional[str],
+    discogs_token: Optional[str] = None,
+    sources: Optional[List[str]] = None,
+) -> Tuple[List[Dict[str, Any]], Dict[str, str]]:
+    """Query sources concurrently, each bounded by its deadline; returns (candidates, {source: ok|timeout|error})."""
+    options = {'discogs_token': discogs_token}
+    selected = [name for name in (sources or METADATA_SOURCES) if name in METADATA_SOURCES]
+    tasks = {
+        name: asyncio.ensure_future(METADATA_SOURCES[name][0](artist, album, title, options))
+        for name in selected
+    }
+    results = await asyncio.gather(*(_bounded(tasks[name], METADATA_SOURCES[name][1]) for name in selected))
+
+    candidates: List[Dict[str, Any]] = []
+    status: Dict[str, str] = {}
+    for name, (found, state) in zip(selected, results):
+        status[name] = state
+        for cand in found or []:
+            cand['score'] = _score(cand)
+            candidates.append(cand)
 
     # Sort by score desc
     candidates.sort(key=lambda x: x['score'], reverse=True)
+    return candidates, status
+
+
+async def aggregate_metadata(artist: Optional[str], album: Optional[str], title: Optional[str], discogs_token: Optional[str] = None) -> List[Dict[str, Any]]:
+    candidates, _ = await gather_candidates(artist, album, title, discogs_token=discogs_token)
     return candidates
 
 
@@ -107,51 +189,104 @@ def choose_best(candidates: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
     return candidates[0] if candidates else None
 
 
-def apply_candidate(candidate_id: int, track_id: int):
-    db = get_db(Path('library/db/library.sqlite').resolve())
-    c_row = db.execute("SELECT source, title, artist, album, year, length_ms, cover_url, score FROM metadata_candidates WHERE id=?", (candidate_id,)).fetchone()
-    if not c_row:
-        return None
-    cand = {
-        'source': c_row[0], 'title': c_row[1], 'artist': c_row[2], 'album': c_row[3], 'year': c_row[4], 'length_ms': c_row[5], 'cover_url': c_row[6], 'score': c_row[7]
+# candidate key -> tracks column, for fields a candidate may fill in
+MERGE_FIELDS = {'title': 'title', 'artist': 'artist', 'album': 'album', 'year': 'year', 'length_ms': 'duration_ms'}
+
+
+def merge_missing(track: Dict[str, Any], cand: Dict[str, Any]) -> Dict[str, Any]:
+    """{column: value} for track columns that are empty and that the candidate can fill."""
+    return {
+        column: cand[key]
+        for key, column in MERGE_FIELDS.items()
+        if track.get(column) in (None, '') and cand.get(key) not in (None, '')
     }
-    t_row = db.execute("SELECT id, title, artist, album, year, duration_ms, path_cover FROM tracks WHERE id=?", (track_id,)).fetchone()
-    if not t_row:
+
+
+CANDIDATE_COLUMNS = ['id', 'source', 'title', 'artist', 'album', 'year', 'length_ms', 'cover_url', 'score']
+TRACK_APPLY_COLUMNS = ['id', 'title', 'artist', 'album', 'year', 'duration_ms', 'path_cover']
+APPLY_BATCH_SIZE = 500
+
+
+def _apply_cover(db_path: Path, track_id: int, candidate_id: int, source: str, confidence: float):
+    """on_done for queued covers: set path_cover unless the track got one meanwhile, with its attribution."""
+    def done(path: str):
+        db = get_db(db_path)
+        cur = db.execute(
+            "UPDATE tracks SET path_cover=? WHERE id=? AND (path_cover IS NULL OR path_cover='')", (path, track_id)
+        )
+        if cur.rowcount:
+            insert_attributions(db, attribution_rows(track_id, {'path_cover': path}, source, candidate_id, confidence))
+        db.commit()
+    return done
+
+
+def apply_candidates(items: List[Tuple[int, int]], batch_size: int = APPLY_BATCH_SIZE) -> List[Tuple[int, int]]:
+    """Apply (candidate_id, track_id) pairs, filling only empty track fields.
+
+    Each batch is one transaction: track updates, applied flags and attribution
+    rows all go in via executemany. Covers are handed to the background artwork
+    queue. Returns the pairs that were applied (both ids existed).
+    """
+    db_path = Path('library/db/library.sqlite').resolve()
+    db = get_db(db_path)
+    applied: List[Tuple[int, int]] = []
+    for start in range(0, len(items), batch_size):
+        batch = items[start:start + batch_size]
+        cand_ids = list({c for c, _ in batch})
+        track_ids = list({t for _, t in batch})
+        cands = {
+            r[0]: dict(zip(CANDIDATE_COLUMNS, r)) for r in db.execute(
+                f"SELECT {', '.join(CANDIDATE_COLUMNS)} FROM metadata_candidates WHERE id IN ({','.join('?' * len(cand_ids))})",
+                cand_ids
+            ).fetchall()
+        }
+        tracks = {
+            r[0]: dict(zip(TRACK_APPLY_COLUMNS, r)) for r in db.execute(
+                f"SELECT {', '.join(TRACK_APPLY_COLUMNS)} FROM tracks WHERE id IN ({','.join('?' * len(track_ids))})",
+                track_ids
+            ).fetchall()
+        }
+        track_updates = []
+        attributions = []
+        covers = []
+        done = []
+        for candidate_id, track_id in batch:
+            cand, track = cands.get(candidate_id), tracks.get(track_id)
+            if cand is None or track is None:
+                continue
+            updates = merge_missing(track, cand)
+            # Later items in the same batch see earlier fills
+            track.update(updates)
+            track_updates.append((
+                updates.get('title'), updates.get('artist'), updates.get('album'), updates.get('year'),
+                updates.get('duration_ms'), track_id,
+            ))
+            attributions.extend(attribution_rows(track_id, updates, cand['source'], candidate_id, cand['score'] or 0.0))
+            if not track['path_cover'] and cand['cover_url']:
+                covers.append((track_id, cand))
+            done.append((candidate_id, track_id))
+        db.executemany(
+            """
+            UPDATE tracks SET title=COALESCE(NULLIF(title, ''), ?), artist=COALESCE(NULLIF(artist, ''), ?),
+                album=COALESCE(NULLIF(album, ''), ?), year=COALESCE(NULLIF(year, ''), ?), duration_ms=COALESCE(NULLIF(duration_ms, ''), ?)
+            WHERE id=?
+            """,
+            track_updates
+        )
+        db.executemany("UPDATE metadata_candidates SET applied=1 WHERE id=?", [(c,) for c, _ in done])
+        insert_attributions(db, attributions)
+        db.commit()
+        for track_id, cand in covers:
+            queue_cover_download(
+                track_id, cand['cover_url'],
+                _apply_cover(db_path, track_id, cand['id'], cand['source'], cand['score'] or 0.0)
+            )
+        applied.extend(done)
+    return applied
+
+
+def apply_candidate(candidate_id: int, track_id: int):
+    if not apply_candidates([(candidate_id, track_id)]):
         return None
-    # Merge only missing fields
-    new_title = t_row[1] or cand.get('title')
-    new_artist = t_row[2] or cand.get('artist')
-    new_album = t_row[3] or cand.get('album')
-    new_year = t_row[4] or cand.get('year')
-    new_duration = t_row[5] or cand.get('length_ms')
-    path_cover = t_row[6]
-    if not path_cover and cand.get('cover_url'):
-        path_cover = download_cover_if_needed(track_id, cand.get('cover_url'))
-    db.execute(
-        "UPDATE tracks SET title=?, artist=?, album=?, year=?, duration_ms=?, path_cover=? WHERE id=?",
-        (new_title, new_artist, new_album, new_year, new_duration, path_cover, track_id)
-    )
-    db.execute("UPDATE metadata_candidates SET applied=1 WHERE id=?", (candidate_id,))
-    db.commit()
-    # Record attribution only for fields changed from None to new value
-    # Retrieve updated track row
-    updated = {
-        'title': new_title,
-        'artist': new_artist,
-        'album': new_album,
-        'year': new_year,
-        'duration_ms': new_duration,
-        'path_cover': path_cover
-    }
-    original = {
-        'title': t_row[1],
-        'artist': t_row[2],
-        'album': t_row[3],
-        'year': t_row[4],
-        'duration_ms': t_row[5],
-        'path_cover': t_row[6]
-    }
-    for field, value in updated.items():
-        if original.get(field) in (None, '') and value:
-            record_field_attribution(track_id, field, value, cand.get('source'), candidate_id, cand.get('score') or 0.0)
+    db = get_db(Path('library/db/library.sqlite').resolve())
     return db.execute("SELECT id, title, artist, album, year, duration_ms, path_cover FROM tracks WHERE id=?", (track_id,)).fetchone()
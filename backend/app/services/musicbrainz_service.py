@@ -1,12 +1,18 @@
-import requests
+import os
 from typing import Optional
 from .cache_service import get_cached, set_cached
+from ..utils.http_utils import get_json, single_flight
 
-BASE = "https://musicbrainz.org/ws/2"
-HEADERS = {"User-Agent": "UNCHAINED/0.1 ( https://github.com/PtiCalin/UNCHAINED )"}
+BASE = os.getenv("UNCHAINED_MUSICBRAINZ_URL", "https://musicbrainz.org/ws/2")
 
 
-def search_musicbrainz_release(artist: Optional[str], album: Optional[str], title: Optional[str]):
+async def _fetch_recordings(query: str, cache_key: str) -> dict:
+    data = await get_json(f"{BASE}/recording", params={"query": query, "fmt": "json"}, source="musicbrainz")
+    set_cached(cache_key, "musicbrainz", data)
+    return data
+
+
+async def search_musicbrainz_release(artist: Optional[str], album: Optional[str], title: Optional[str]):
     query_parts = []
     if artist:
         query_parts.append(f"artist:{artist}")
@@ -20,10 +26,8 @@ def search_musicbrainz_release(artist: Optional[str], album: Optional[str], titl
     if cached:
         data = cached
     else:
-        resp = requests.get(f"{BASE}/recording", params={"query": query, "fmt": "json"}, headers=HEADERS, timeout=20)
-        resp.raise_for_status()
-        data = resp.json()
-        set_cached(cache_key, "musicbrainz", data)
+        # Concurrent misses for the same query share one upstream call
+        data = await single_flight(cache_key, lambda: _fetch_recordings(query, cache_key))
     # Trim large payload
     recordings = []
     for r in data.get("recordings", [])[:20]:
@@ -0,0 +1,78 @@
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+import html
+import re
+import sys
+from ..utils.db_utils import get_db, init_db
+
+DB_PATH = Path('library/db/library.sqlite').resolve()
+
+# Column weights for bm25(): title, artist, album, genre
+BM25_WEIGHTS = (10.0, 6.0, 3.0, 1.0)
+HIGHLIGHT_OPEN = "<mark>"
+HIGHLIGHT_CLOSE = "</mark>"
+# highlight() wraps matches in these private-use sentinels; the text is HTML-escaped
+# first and only then are the sentinels turned into the marker tags
+_OPEN_SENTINEL = "\ue000"
+_CLOSE_SENTINEL = "\ue001"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def build_match_query(term: str) -> str:
+    """Turn free text into an FTS5 query: every token must match as a prefix."""
+    tokens = _TOKEN_RE.findall(term)
+    return " ".join(f'"{t}"*' for t in tokens)
+
+
+def render_highlight(text: Optional[str]) -> Optional[str]:
+    """HTML-safe highlight: escaped field text with only the match markers as markup."""
+    if text is None:
+        return None
+    return html.escape(text).replace(_OPEN_SENTINEL, HIGHLIGHT_OPEN).replace(_CLOSE_SENTINEL, HIGHLIGHT_CLOSE)
+
+
+def search_tracks(db_path: Path, term: str, limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
+    match = build_match_query(term)
+    if not match:
+        return []
+    db = get_db(db_path)
+    weights = ", ".join(str(w) for w in BM25_WEIGHTS)
+    rows = db.execute(
+        f"""
+        SELECT t.id, t.title, t.artist, t.album, t.duration_ms, t.path_audio,
+               highlight(tracks_fts, 0, ?, ?), highlight(tracks_fts, 1, ?, ?), highlight(tracks_fts, 2, ?, ?),
+               highlight(tracks_fts, 3, ?, ?)
+        FROM tracks_fts
+        JOIN tracks t ON t.id = tracks_fts.rowid
+        WHERE tracks_fts MATCH ?
+        ORDER BY bm25(tracks_fts, {weights})
+        LIMIT ? OFFSET ?
+        """,
+        (*(_OPEN_SENTINEL, _CLOSE_SENTINEL) * 4, match, limit, offset)
+    ).fetchall()
+    return [
+        {
+            "id": r[0], "title": r[1], "artist": r[2], "album": r[3], "duration_ms": r[4], "path_audio": r[5],
+            "highlight": {
+                "title": render_highlight(r[6]), "artist": render_highlight(r[7]),
+                "album": render_highlight(r[8]), "genre": render_highlight(r[9]),
+            },
+        } for r in rows
+    ]
+
+
+def rebuild_search_index(db_path: Path) -> int:
+    """Rebuild tracks_fts from the tracks table (backfill / repair)."""
+    init_db(db_path)
+    db = get_db(db_path)
+    db.execute("INSERT INTO tracks_fts (tracks_fts) VALUES ('rebuild')")
+    db.execute("INSERT INTO tracks_fts (tracks_fts) VALUES ('optimize')")
+    db.commit()
+    return db.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+
+
+if __name__ == '__main__':
+    # python -m backend.app.services.search_service [db_path]
+    target = Path(sys.argv[1]).resolve() if len(sys.argv) > 1 else DB_PATH
+    print(f"Indexed {rebuild_search_index(target)} tracks")
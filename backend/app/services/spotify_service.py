@@ -1,7 +1,11 @@
 from typing import List, Dict, Any
+import os
 import re
-import requests
 import base64
+from ..utils.http_utils import request
+
+API_BASE = os.getenv("UNCHAINED_SPOTIFY_API_URL", "https://api.spotify.com/v1")
+AUTH_URL = os.getenv("UNCHAINED_SPOTIFY_AUTH_URL", "https://accounts.spotify.com/api/token")
 
 # Note: Spotify provides metadata only. Audio download is not supported and violates ToS.
 # This function indexes playlist tracks for metadata and later matching.
@@ -14,26 +18,25 @@ def _extract_playlist_id(url: str) -> str:
     return url
 
 
-def _get_spotify_token(client_id: str, client_secret: str) -> str:
+async def _get_spotify_token(client_id: str, client_secret: str) -> str:
     b64 = base64.b64encode(f"{client_id}:{client_secret}".encode()).decode()
-    r = requests.post(
-        "https://accounts.spotify.com/api/token",
+    r = await request(
+        "POST", AUTH_URL,
         headers={"Authorization": f"Basic {b64}"},
         data={"grant_type": "client_credentials"},
-        timeout=15,
     )
     r.raise_for_status()
     return r.json()["access_token"]
 
 
-def fetch_spotify_playlist_tracks(playlist_url: str, client_id: str, client_secret: str) -> List[Dict[str, Any]]:
+async def fetch_spotify_playlist_tracks(playlist_url: str, client_id: str, client_secret: str) -> List[Dict[str, Any]]:
     pid = _extract_playlist_id(playlist_url)
-    token = _get_spotify_token(client_id, client_secret)
+    token = await _get_spotify_token(client_id, client_secret)
     out: List[Dict[str, Any]] = []
-    url = f"https://api.spotify.com/v1/playlists/{pid}/tracks"
+    url = f"{API_BASE}/playlists/{pid}/tracks"
     headers = {"Authorization": f"Bearer {token}"}
     while url:
-        resp = requests.get(url, headers=headers, timeout=20)
+        resp = await request("GET", url, headers=headers, source="spotify")
         if resp.status_code == 401:
             return []
         resp.raise_for_status()
@@ -0,0 +1,94 @@
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+import base64
+import json
+from ..utils.db_utils import get_db
+
+# Sort key -> SQL expression; each has a matching (expr, id) index in 004_tracks_listing.sql
+SORT_KEYS = {
+    "import_date": "COALESCE(import_date, '')",
+    "title": "COALESCE(title, '')",
+    "artist": "COALESCE(artist, '')",
+    "album": "COALESCE(album, '')",
+    "year": "COALESCE(year, 0)",
+    "duration_ms": "COALESCE(duration_ms, 0)",
+    "id": "id",
+}
+
+TRACK_FIELDS = [
+    "id", "title", "artist", "album", "year", "duration_ms", "path_audio", "path_cover",
+    "genre", "subgenre", "isrc", "track_number", "disc_number", "import_date",
+]
+DEFAULT_FIELDS = ["id", "title", "artist", "album", "duration_ms", "path_audio"]
+
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(sort_value: Any, track_id: int) -> str:
+    raw = json.dumps([sort_value, track_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, track_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return sort_value, int(track_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    if not fields:
+        return list(DEFAULT_FIELDS)
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in TRACK_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    # id is always returned so rows stay addressable
+    return ["id"] + [f for f in requested if f != "id"]
+
+
+def list_tracks_page(
+    db_path: Path,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    sort: str = "import_date",
+    order: str = "desc",
+    fields: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """Keyset-paginated track listing ordered by (sort key, id)."""
+    if sort not in SORT_KEYS:
+        raise ValueError(f"Unknown sort key: {sort}")
+    if order not in ("asc", "desc"):
+        raise ValueError("order must be 'asc' or 'desc'")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    fields = fields or list(DEFAULT_FIELDS)
+    expr = SORT_KEYS[sort]
+    direction = "DESC" if order == "desc" else "ASC"
+    where = ""
+    params: List[Any] = []
+    if cursor:
+        sort_value, last_id = decode_cursor(cursor)
+        op = "<" if order == "desc" else ">"
+        # Spelled out rather than as a row value so SQLite seeks the expression index
+        where = f"WHERE {expr} {op}= ? AND ({expr} {op} ? OR id {op} ?)"
+        params.extend([sort_value, sort_value, last_id])
+    db = get_db(db_path)
+    rows = db.execute(
+        f"SELECT {', '.join(fields)}, {expr} FROM tracks {where} ORDER BY {expr} {direction}, id {direction} LIMIT ?",
+        (*params, limit + 1)
+    ).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    items = [dict(zip(fields, r[:-1])) for r in rows]
+    next_cursor = encode_cursor(rows[-1][-1], rows[-1][0]) if has_more else None
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def count_tracks(db_path: Path) -> int:
+    db = get_db(db_path)
+    row = db.execute("SELECT value FROM library_counters WHERE name='tracks'").fetchone()
+    if row is None:
+        return db.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+    return row[0]
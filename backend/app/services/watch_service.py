@@ -0,0 +1,229 @@
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+import os
+import threading
+import time
+from .local_scan_service import sync_paths, list_audio_dir
+from .event_service import publish
+
+# Optional inotify/FSEvents/ReadDirectoryChangesW backend
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    # Fall back to polling directory mtimes
+    Observer = None
+    FileSystemEventHandler = object
+
+DEBOUNCE_SECONDS = 2.0
+POLL_INTERVAL_SECONDS = 5.0
+MAX_BATCH_DELAY_SECONDS = 30.0
+
+
+class _EventHandler(FileSystemEventHandler):
+    def __init__(self, watcher: "LibraryWatcher"):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            # A renamed, removed or copied-in folder reports only itself, not its files;
+            # its modified events are just entries changing, which arrive as file events
+            if event.event_type not in ("created", "deleted", "moved"):
+                return
+            self.watcher.notify(event.src_path, directory=True)
+            dest = getattr(event, "dest_path", None)
+            if dest:
+                self.watcher.notify(dest, directory=True)
+            return
+        self.watcher.notify(event.src_path)
+        dest = getattr(event, "dest_path", None)
+        if dest:
+            self.watcher.notify(dest)
+
+
+class _DirectoryPoller:
+    """Pure-Python fallback: re-list the watched directories every poll and compare each
+    file's (size, mtime). A new or changed file is reported once it looks the same on two
+    polls in a row, so files still being written are not synced half-copied, and files
+    modified in place (which leave the directory mtime alone) are still picked up."""
+
+    def __init__(self, roots: List[Path]):
+        self.roots = roots
+        self.dirs: Set[str] = set()
+        self.listings: Dict[str, Dict[str, Tuple[int, int]]] = {}
+        self.unsettled: Set[str] = set()  # changed on the last poll, waiting to look stable
+        for root in roots:
+            self._index(str(root), initial=True)
+
+    def _index(self, path: str, initial: bool = False) -> Set[str]:
+        """(Re)list path and any new subdirectories; returns settled changed/removed file paths."""
+        changed: Set[str] = set()
+        stack = [path]
+        while stack:
+            d = stack.pop()
+            if not os.path.isdir(d):
+                continue
+            self.dirs.add(d)
+            files, subdirs = list_audio_dir(d)
+            listing = {p: (size, mtime_ns) for p, size, mtime_ns in files}
+            previous = self.listings.get(d)
+            if previous is None and initial:
+                previous = listing  # already on disk at startup: the initial scan covers them
+            for p, stat in listing.items():
+                if (previous or {}).get(p) != stat:
+                    self.unsettled.add(p)
+                elif p in self.unsettled:
+                    self.unsettled.discard(p)
+                    changed.add(p)
+            for p in (previous or {}):
+                if p not in listing:
+                    self.unsettled.discard(p)
+                    changed.add(p)
+            self.listings[d] = listing
+            stack.extend(s for s in subdirs if s not in self.dirs)
+        return changed
+
+    def poll(self) -> Set[str]:
+        changed: Set[str] = set()
+        for d in list(self.dirs):
+            if not os.path.isdir(d):
+                # Directory removed: everything it held is gone
+                for p in self.listings.pop(d, {}):
+                    self.unsettled.discard(p)
+                    changed.add(p)
+                self.dirs.discard(d)
+                continue
+            changed |= self._index(d)
+        return changed
+
+
+class LibraryWatcher:
+    """Watch folders and feed debounced batches of changed files to the incremental scanner."""
+
+    def __init__(
+        self,
+        folders: List[Path],
+        library_audio: Path,
+        copy: bool = False,
+        debounce_seconds: float = DEBOUNCE_SECONDS,
+        poll_interval: float = POLL_INTERVAL_SECONDS,
+    ):
+        self.folders = [f.resolve() for f in folders]
+        self.library_audio = library_audio
+        self.copy = copy
+        self.debounce_seconds = debounce_seconds
+        self.poll_interval = poll_interval
+        self.backend = "watchdog" if Observer is not None else "polling"
+        self._pending: Set[str] = set()
+        self._pending_dirs: Set[str] = set()
+        self._first_event = 0.0
+        self._last_event = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._observer = None
+        self.stats: Dict[str, Any] = {"batches": 0, "indexed": 0, "moved": 0, "missing": 0, "updated": 0}
+
+    def notify(self, path: str, directory: bool = False):
+        now = time.monotonic()
+        with self._lock:
+            if not self._pending and not self._pending_dirs:
+                self._first_event = now
+            (self._pending_dirs if directory else self._pending).add(path)
+            self._last_event = now
+
+    def start(self):
+        if self.backend == "watchdog":
+            self._observer = Observer()
+            handler = _EventHandler(self)
+            for folder in self.folders:
+                self._observer.schedule(handler, str(folder), recursive=True)
+            self._observer.start()
+        else:
+            self._threads.append(threading.Thread(target=self._poll_loop, name="library-watch-poll", daemon=True))
+        self._threads.append(threading.Thread(target=self._flush_loop, name="library-watch-flush", daemon=True))
+        for t in self._threads:
+            t.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+        for t in self._threads:
+            t.join()
+        self._flush()
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = len(self._pending) + len(self._pending_dirs)
+        return {
+            "running": not self._stop.is_set(), "backend": self.backend,
+            "folders": [str(f) for f in self.folders], "pending": pending, **self.stats,
+        }
+
+    def _poll_loop(self):
+        poller = _DirectoryPoller(self.folders)
+        while not self._stop.wait(self.poll_interval):
+            for path in poller.poll():
+                self.notify(path)
+
+    def _flush_loop(self):
+        while not self._stop.wait(min(0.5, self.debounce_seconds)):
+            now = time.monotonic()
+            with self._lock:
+                ready = (self._pending or self._pending_dirs) and (
+                    now - self._last_event >= self.debounce_seconds
+                    or now - self._first_event >= MAX_BATCH_DELAY_SECONDS
+                )
+            if ready:
+                self._flush()
+
+    def _flush(self):
+        with self._lock:
+            batch, self._pending = list(self._pending), set()
+            dirs, self._pending_dirs = list(self._pending_dirs), set()
+        if not batch and not dirs:
+            return
+        try:
+            result = sync_paths(batch, self.library_audio, copy=self.copy, dirs=dirs)
+        except Exception as e:
+            publish({"type": "info", "message": f"Watch folder sync failed: {e}", "track_id": None})
+            return
+        self.stats["batches"] += 1
+        for key in ("indexed", "moved", "missing", "updated"):
+            self.stats[key] += result.get(key, 0)
+        if result["indexed"]:
+            publish({
+                "type": "upload_complete", "track_id": None,
+                "message": f"{result['indexed']} new track(s) from watched folders",
+            })
+
+
+_watcher: Optional[LibraryWatcher] = None
+_watcher_lock = threading.Lock()
+
+
+def start_watching(folders: List[Path], library_audio: Path, copy: bool = False) -> Dict[str, Any]:
+    global _watcher
+    with _watcher_lock:
+        if _watcher is not None:
+            _watcher.stop()
+        _watcher = LibraryWatcher([f for f in folders if f.is_dir()], library_audio, copy=copy)
+        _watcher.start()
+        return _watcher.status()
+
+
+def stop_watching() -> bool:
+    global _watcher
+    with _watcher_lock:
+        if _watcher is None:
+            return False
+        _watcher.stop()
+        _watcher = None
+        return True
+
+
+def watch_status() -> Optional[Dict[str, Any]]:
+    return _watcher.status() if _watcher is not None else None
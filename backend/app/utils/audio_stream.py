@@ -0,0 +1,105 @@
+"""
+Block-streaming audio decode and STFT with bounded memory, for analysing arbitrarily long files.
+"""
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+import numpy as np
+
+BLOCK_SECONDS = 20.0
+N_FFT = 2048
+HOP_LENGTH = 512
+
+# Decoding goes through soundfile (libsndfile: WAV/FLAC/OGG, MP3 since 1.1) and falls
+# back to audioread (ffmpeg/GStreamer/Core Audio) for everything else. Either way
+# blocks are downmixed and resampled with a stateful soxr stream, so block edges
+# leave no artifacts and memory stays at a few blocks whatever the file length.
+
+
+class AudioStream:
+    """Iterate a file as mono float32 blocks at sample rate sr."""
+
+    def __init__(self, path: Path, sr: int = 22050, block_seconds: float = BLOCK_SECONDS,
+                 max_seconds: Optional[float] = None):
+        self.path = str(path)
+        self.sr = sr
+        self.block_seconds = block_seconds
+        self.max_seconds = max_seconds
+        self.native_sr: Optional[int] = None
+        self.samples = 0  # output samples yielded so far
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        import soxr
+        self.samples = 0
+        limit = int(self.max_seconds * self.sr) if self.max_seconds else None
+        resampler = None
+        for block in self._native_blocks():
+            if resampler is None and self.native_sr != self.sr:
+                resampler = soxr.ResampleStream(self.native_sr, self.sr, 1, dtype="float32", quality="HQ")
+            out = resampler.resample_chunk(block) if resampler is not None else block
+            if limit is not None and self.samples + len(out) >= limit:
+                yield out[:limit - self.samples]
+                self.samples = limit
+                return
+            if len(out):
+                self.samples += len(out)
+                yield out
+        if resampler is not None:
+            tail = resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+            if limit is not None:
+                tail = tail[:limit - self.samples]
+            if len(tail):
+                self.samples += len(tail)
+                yield tail
+
+    def _native_blocks(self) -> Iterator[np.ndarray]:
+        import soundfile as sf
+        try:
+            f = sf.SoundFile(self.path)
+        except RuntimeError:  # LibsndfileError: format libsndfile cannot read
+            yield from self._audioread_blocks()
+            return
+        with f:
+            self.native_sr = f.samplerate
+            for block in f.blocks(blocksize=int(self.block_seconds * f.samplerate), dtype="float32", always_2d=True):
+                yield block.mean(axis=1) if block.shape[1] > 1 else block[:, 0]
+
+    def _audioread_blocks(self) -> Iterator[np.ndarray]:
+        import audioread
+        with audioread.audio_open(self.path) as f:
+            self.native_sr, channels = f.samplerate, f.channels
+            block_bytes = int(self.block_seconds * f.samplerate) * channels * 2
+            # The backends hand out small int16 buffers; coalesce them into blocks
+            pending, size = [], 0
+            for buf in f:
+                pending.append(buf)
+                size += len(buf)
+                if size >= block_bytes:
+                    yield self._pcm16_mono(b"".join(pending), channels)
+                    pending, size = [], 0
+            if pending:
+                yield self._pcm16_mono(b"".join(pending), channels)
+
+    @staticmethod
+    def _pcm16_mono(data: bytes, channels: int) -> np.ndarray:
+        pcm = np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+        return pcm.reshape(-1, channels).mean(axis=1) if channels > 1 else pcm
+
+
+def stft_blocks(blocks: Iterable[np.ndarray], n_fft: int = N_FFT, hop_length: int = HOP_LENGTH) -> Iterator[np.ndarray]:
+    """Magnitude STFT, (1 + n_fft // 2) x frames per yielded chunk, computed block by block.
+    Concatenating the chunks gives exactly np.abs(librosa.stft(y, n_fft, hop_length)) of the whole
+    signal (centered frames, zero padding): each block only carries the n_fft - hop_length
+    samples of overlap the next frame needs."""
+    import librosa
+    pad = np.zeros(n_fft // 2, dtype=np.float32)
+    buf = pad
+    for block in blocks:
+        buf = np.concatenate([buf, np.asarray(block, dtype=np.float32)])
+        if len(buf) >= n_fft:
+            frames = 1 + (len(buf) - n_fft) // hop_length
+            yield np.abs(librosa.stft(buf[:(frames - 1) * hop_length + n_fft], n_fft=n_fft,
+                                      hop_length=hop_length, center=False))
+            buf = buf[frames * hop_length:]
+    buf = np.concatenate([buf, pad])
+    if len(buf) >= n_fft:
+        yield np.abs(librosa.stft(buf, n_fft=n_fft, hop_length=hop_length, center=False))
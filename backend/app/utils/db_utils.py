@@ -1,338 +1,280 @@
+import itertools
+import re
 import sqlite3
+import threading
+import weakref
 from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
 
-def init_db(db_path: Path):
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS tracks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT,
-            artist TEXT,
-            album TEXT,
-            year INTEGER,
-            duration_ms INTEGER,
-            path_audio TEXT,
-            path_cover TEXT,
-            path_metadata TEXT,
-            isrc TEXT,
-            genre TEXT,
-            subgenre TEXT,
-            track_number INTEGER,
-            disc_number INTEGER,
-            import_date TEXT
-        )
-        """
-    )
-    # External tracks indexed from sources like Spotify/Bandcamp (metadata only)
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS external_tracks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            source TEXT,
-            external_id TEXT,
-            isrc TEXT,
-            title TEXT,
-            artist TEXT,
-            album TEXT,
-            url_audio TEXT,
-            url_cover TEXT,
-            status TEXT,
-            mapped_track_id INTEGER,
-            confidence REAL
-        )
-        """
-    )
-    # Simple download jobs queue for authorized URLs
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS download_jobs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            url TEXT,
-            dest_path TEXT,
-            status TEXT,
-            error TEXT,
-            created_at TEXT,
-            started_at TEXT,
-            finished_at TEXT
-        )
-        """
-    )
-    # Metadata candidates aggregated from multi-source queries before finalizing import
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS metadata_candidates (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            temp_track_ref TEXT, -- arbitrary key (e.g., local filename hash) to group candidates
-            source TEXT,
-            title TEXT,
-            artist TEXT,
-            album TEXT,
-            year TEXT,
-            length_ms INTEGER,
-            cover_url TEXT,
-            score REAL,
-            created_at TEXT
-        )
-        """
-    )
-    # External metadata cache with TTL (epoch seconds)
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS external_cache (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            cache_key TEXT UNIQUE,
-            source TEXT,
-            payload TEXT,
-            created_at INTEGER
+# Numbered SQL migrations (NNN_name.sql), applied in order and recorded in schema_version
+MIGRATIONS_DIR = Path(__file__).resolve().parents[3] / "scripts" / "migrations"
+_MIGRATION_RE = re.compile(r"^(\d+)_(\w+)\.sql$")
+_migrated: Dict[str, int] = {}
+_migrate_lock = threading.Lock()
+
+# Pragmas applied once when a pooled connection is opened
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",  # 256 MiB
+    "PRAGMA cache_size=-65536",  # 64 MiB (negative = KiB)
+)
+
+
+def _discover_migrations(migrations_dir: Path) -> List[Tuple[int, str, Path]]:
+    found = []
+    for p in migrations_dir.glob("*.sql"):
+        m = _MIGRATION_RE.match(p.name)
+        if m:
+            found.append((int(m.group(1)), m.group(2), p))
+    found.sort()
+    return found
+
+
+def _split_statements(sql: str) -> List[str]:
+    statements: List[str] = []
+    buf = ""
+    for line in sql.splitlines(keepends=True):
+        buf += line
+        if sqlite3.complete_statement(buf):
+            if buf.strip():
+                statements.append(buf.strip())
+            buf = ""
+    # Trailing text without a terminating semicolon is kept unless it is only comments
+    if any(l.strip() and not l.strip().startswith("--") for l in buf.splitlines()):
+        statements.append(buf.strip())
+    return statements
+
+
+def _current_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT COALESCE(MAX(version), -1) FROM schema_version").fetchone()[0]
+
+
+def migrate(db_path: Path, migrations_dir: Path = MIGRATIONS_DIR) -> int:
+    """Apply pending numbered migrations from migrations_dir exactly once.
+
+    All pending migrations run in a single BEGIN IMMEDIATE transaction, so
+    concurrent workers serialize on the write lock and the loser finds the
+    schema already current. Returns the schema version after migrating.
+    """
+    key = str(db_path)
+    if key in _migrated:
+        return _migrated[key]
+    with _migrate_lock:
+        if key in _migrated:
+            return _migrated[key]
+        conn = get_db(db_path)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, name TEXT, applied_at TEXT)"
         )
-        """
-    )
-    # Attempt to add applied column if missing (best-effort)
+        conn.commit()
+        migrations = _discover_migrations(migrations_dir)
+        latest = migrations[-1][0] if migrations else -1
+        version = _current_version(conn)
+        if version < latest:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Re-read under the write lock; another process may have migrated meanwhile
+                version = _current_version(conn)
+                for number, name, path in migrations:
+                    if number <= version:
+                        continue
+                    for statement in _split_statements(path.read_text(encoding="utf-8")):
+                        conn.execute(statement)
+                    conn.execute(
+                        "INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, datetime('now'))",
+                        (number, name)
+                    )
+                    version = number
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        _migrated[key] = version
+        return version
+
+
+def init_db(db_path: Path):
+    """Bring the library schema up to date (kept as the routers' entry point)."""
+    migrate(db_path)
+
+
+class PooledConnection(sqlite3.Connection):
+    """Connection owned by the pool; callers reach it through BorrowedConnection handles."""
+
+    def _close(self):
+        super().close()
+
+
+class BorrowedConnection:
+    """One get_db() caller's handle on its thread's pooled connection.
+
+    Every caller on a thread shares one connection, so a helper called in the middle of
+    its caller's transaction must not commit or roll back the caller's work. A handle
+    taken while another live handle has a transaction open is nested and runs inside a
+    SAVEPOINT: its commit() releases the savepoint into the outer transaction (which the
+    outer caller commits), and its close() rolls back to the savepoint. Otherwise commit()
+    commits and close() rolls back anything left uncommitted. A handle that is dropped
+    without commit() loses its uncommitted writes, as a dropped connection did, so the
+    next borrower on the thread starts clean.
+    """
+
+    def __init__(self, conn: PooledConnection, savepoint: Optional[str], handles: weakref.WeakSet):
+        self._conn = conn
+        self._savepoint = savepoint
+        self._handles = handles
+        self._finalizer = weakref.finalize(self, _discard_savepoint, conn, savepoint) if savepoint else None
+        handles.add(self)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def execute(self, sql: str, parameters=()) -> sqlite3.Cursor:
+        return self._conn.execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters) -> sqlite3.Cursor:
+        return self._conn.executemany(sql, seq_of_parameters)
+
+    def cursor(self) -> sqlite3.Cursor:
+        return self._conn.cursor()
+
+    def _nested(self) -> bool:
+        """Still inside a live caller's transaction (the savepoint may be gone once it ended)."""
+        if self._savepoint is None:
+            return False
+        if any(h is not self for h in self._handles) and self._conn.in_transaction:
+            return True
+        self._detach()  # every outer caller is gone: this handle is outermost now
+        return False
+
+    def commit(self):
+        if not self._nested() or not _release_savepoint(self._conn, self._savepoint):
+            self._detach()
+            self._conn.commit()
+            return
+        self._conn.execute(f"SAVEPOINT {self._savepoint}")  # keep later writes scoped too
+
+    def rollback(self):
+        if not self._nested() or not _rollback_to_savepoint(self._conn, self._savepoint):
+            # The outer caller already ended the transaction the savepoint lived in
+            self._detach()
+            self._conn.rollback()
+
+    def close(self):
+        if self._nested() and _rollback_to_savepoint(self._conn, self._savepoint):
+            _release_savepoint(self._conn, self._savepoint)
+        elif self._conn.in_transaction:
+            self._conn.rollback()
+        self._detach()
+        self._handles.discard(self)
+
+    def _detach(self):
+        if self._finalizer is not None:
+            self._finalizer.detach()
+        self._savepoint = self._finalizer = None
+
+
+def _release_savepoint(conn: PooledConnection, name: str) -> bool:
     try:
-        c.execute("ALTER TABLE metadata_candidates ADD COLUMN applied INTEGER DEFAULT 0")
-    except Exception:
-        pass
-    # Field-level provenance for applied metadata
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS metadata_attribution (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            track_id INTEGER,
-            field_name TEXT,
-            value TEXT,
-            source TEXT,
-            candidate_id INTEGER,
-            confidence REAL,
-            applied_at TEXT,
-            reverted INTEGER DEFAULT 0
-        )
-        """
-    )
-    # Multiple artworks per track
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS track_artworks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            track_id INTEGER,
-            path_cover TEXT,
-            source TEXT,
-            is_primary INTEGER DEFAULT 0,
-            created_at TEXT
-        )
-        """
-    )
-    # Relations between tracks (remix/edit/version/sample/release grouping)
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS track_relations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            track_id INTEGER,
-            related_track_id INTEGER,
-            relation_type TEXT,
-            created_at TEXT
-        )
-        """
-    )
-    # Samples table (audio slices derived from a track) if not exists
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS samples (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            track_id INTEGER,
-            start_ms INTEGER,
-            end_ms INTEGER,
-            path_audio TEXT,
-            pad_index INTEGER,
-            created_at TEXT
-        )
-        """
-    )
-    # DJ analysis results per track (computed features)
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS analysis_results (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            track_id INTEGER,
-            bpm REAL,
-            key TEXT,
-            waveform_path TEXT,
-            beatgrid_json TEXT,
-            energy REAL,
-            analyzer TEXT,
-            analyzed_at TEXT
-        )
-        """
-    )
-    # Cue points per track
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS cue_points (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            track_id INTEGER,
-            label TEXT,
-            position_ms INTEGER,
-            color TEXT,
-            hot_index INTEGER,
-            created_at TEXT,
-            updated_at TEXT
-        )
-        """
-    )
-    # Loops per track
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS loops (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            track_id INTEGER,
-            start_ms INTEGER,
-            end_ms INTEGER,
-            length_beats REAL,
-            quantized INTEGER,
-            active INTEGER,
-            created_at TEXT,
-            updated_at TEXT
-        )
-        """
-    )
-    # Deck runtime states (ephemeral saves)
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS deck_states (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            deck_id TEXT,
-            track_id INTEGER,
-            position_ms INTEGER,
-            tempo REAL,
-            pitch REAL,
-            key_shift INTEGER,
-            slip_mode INTEGER,
-            created_at TEXT
-        )
-        """
-    )
-    # Recordings registry
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS recordings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            path_audio TEXT,
-            started_at TEXT,
-            finished_at TEXT,
-            duration_ms INTEGER,
-            notes TEXT
-        )
-        """
-    )
-    # Effect definitions (library of available effects)
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS effects (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE,
-            category TEXT,
-            description TEXT,
-            default_params_json TEXT,
-            created_at TEXT
-        )
-        """
-    )
-    # FX presets (saved effect chains with custom parameters)
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS fx_presets (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT,
-            description TEXT,
-            category TEXT,
-            effects_json TEXT,
-            is_factory INTEGER DEFAULT 0,
-            created_at TEXT
-        )
-        """
-    )
-    # Effect chains (active effects per deck)
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS effect_chains (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            deck_id TEXT,
-            slot INTEGER,
-            effect_id INTEGER,
-            params_json TEXT,
-            enabled INTEGER DEFAULT 1,
-            wet_dry REAL DEFAULT 0.5,
-            created_at TEXT
-        )
-        """
-    )
-    # FX usage history (deck applications)
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS fx_usage (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            deck_id TEXT,
-            preset_id INTEGER,
-            track_id INTEGER,
-            applied_at TEXT
-        )
-        """
-    )
-    # Track embeddings (audio feature vectors for similarity and clustering)
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS track_embeddings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            track_id INTEGER UNIQUE,
-            embedding_vector TEXT,
-            model_version TEXT,
-            dimensionality INTEGER,
-            computed_at TEXT
-        )
-        """
-    )
-    # Track clusters (grouping tracks by similarity)
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS track_clusters (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            track_id INTEGER,
-            cluster_id INTEGER,
-            algorithm TEXT,
-            distance_to_centroid REAL,
-            computed_at TEXT
-        )
-        """
-    )
-    # Library statistics (aggregate metrics over time)
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS library_stats (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            metric_name TEXT,
-            metric_value TEXT,
-            computed_at TEXT
-        )
-        """
-    )
-    # Track similarities (precomputed pairwise similarity scores)
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS track_similarities (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            track_id_a INTEGER,
-            track_id_b INTEGER,
-            similarity_score REAL,
-            algorithm TEXT,
-            computed_at TEXT,
-            UNIQUE(track_id_a, track_id_b, algorithm)
-        )
-        """
-    )
-    conn.commit()
-    conn.close()
+        conn.execute(f"RELEASE {name}")
+        return True
+    except sqlite3.Error:
+        return False
+
+
+def _rollback_to_savepoint(conn: PooledConnection, name: str) -> bool:
+    try:
+        conn.execute(f"ROLLBACK TO {name}")
+        return True
+    except sqlite3.Error:
+        return False
+
+
+def _discard_savepoint(conn: PooledConnection, name: str):
+    """Finalizer of a dropped nested handle: undo its uncommitted writes."""
+    if _rollback_to_savepoint(conn, name):
+        _release_savepoint(conn, name)
+
+
+class ConnectionPool:
+    """Process-wide pool handing out one connection per (thread, database).
+
+    Connections of threads that have exited (threadpool churn, BackgroundTasks) are
+    closed the next time a connection is opened.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._open: List[Tuple[PooledConnection, threading.Thread]] = []
+        self._savepoints = itertools.count(1)
+
+    def acquire(self, db_path: Path) -> BorrowedConnection:
+        conns: Optional[Dict[str, Tuple[PooledConnection, weakref.WeakSet]]] = getattr(self._local, "conns", None)
+        if conns is None:
+            conns = self._local.conns = {}
+        key = str(Path(db_path).resolve())
+        entry = conns.get(key)
+        if entry is None:
+            self._prune()
+            conn = sqlite3.connect(key, factory=PooledConnection, check_same_thread=False)
+            for pragma in CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+            entry = conns[key] = (conn, weakref.WeakSet())
+            with self._lock:
+                self._open.append((conn, threading.current_thread()))
+        conn, handles = entry
+        if conn.in_transaction and not len(handles):
+            # Left open by a borrower that is gone without committing: discard, don't adopt
+            conn.rollback()
+        # Nested only if a live caller owns the open transaction
+        savepoint = f"pool_{next(self._savepoints)}" if conn.in_transaction else None
+        if savepoint:
+            conn.execute(f"SAVEPOINT {savepoint}")
+        return BorrowedConnection(conn, savepoint, handles)
+
+    def _prune(self):
+        with self._lock:
+            dead = [conn for conn, thread in self._open if not thread.is_alive()]
+            self._open = [(conn, thread) for conn, thread in self._open if thread.is_alive()]
+        for conn in dead:
+            try:
+                conn._close()
+            except sqlite3.Error:
+                pass
+
+    def close_all(self):
+        with self._lock:
+            conns, self._open = self._open, []
+        for conn, _ in conns:
+            try:
+                conn._close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+
+_POOL = ConnectionPool()
+
+
+def get_db(db_path: Path) -> BorrowedConnection:
+    """Borrow the calling thread's pooled connection for db_path."""
+    return _POOL.acquire(db_path)
+
+
+def close_all_connections():
+    _POOL.close_all()
+
+
+def dict_rows(cursor: sqlite3.Cursor) -> List[Dict[str, Any]]:
+    cols = [d[0] for d in cursor.description]
+    return [dict(zip(cols, r)) for r in cursor.fetchall()]
 
 
-def get_db(db_path: Path) -> sqlite3.Connection:
-    return sqlite3.connect(db_path)
+def dict_row(cursor: sqlite3.Cursor) -> Optional[Dict[str, Any]]:
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return dict(zip((d[0] for d in cursor.description), row))
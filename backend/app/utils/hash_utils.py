@@ -0,0 +1,27 @@
+import hashlib
+import os
+from pathlib import Path
+
+PARTIAL_HASH_BLOCK = 64 * 1024
+
+
+def partial_hash(path: Path, block: int = PARTIAL_HASH_BLOCK) -> str:
+    """Cheap content fingerprint: BLAKE2b over size + first and last block."""
+    size = os.path.getsize(path)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(size.to_bytes(8, "little"))
+    with open(path, "rb") as f:
+        h.update(f.read(block))
+        if size > block:
+            f.seek(max(block, size - block))
+            h.update(f.read(block))
+    return h.hexdigest()
+
+
+def full_hash(path: Path, chunk_size: int = 1 << 20) -> str:
+    """BLAKE2b over the whole file."""
+    h = hashlib.blake2b(digest_size=32)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
@@ -0,0 +1,233 @@
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+import httpx
+
+# HTTP/2 needs the optional h2 package (pip install httpx[http2])
+try:
+    import h2  # noqa: F401
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+USER_AGENT = "UNCHAINED/0.1 ( https://github.com/PtiCalin/UNCHAINED )"
+DEFAULT_TIMEOUT = httpx.Timeout(20.0, connect=5.0)
+LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=16, keepalive_expiry=30.0)
+# Concurrent requests per upstream host; anything not listed gets HOST_CONCURRENCY_DEFAULT
+HOST_CONCURRENCY_DEFAULT = int(os.getenv("UNCHAINED_HTTP_HOST_CONCURRENCY", "4"))
+HOST_CONCURRENCY: Dict[str, int] = {"musicbrainz.org": 2, "api.discogs.com": 4, "api.spotify.com": 8}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 3
+BACKOFF_SECONDS = 0.5
+# Per-source (requests per second, burst). MusicBrainz allows 1 req/s, Discogs 60/min.
+SOURCE_RATE_LIMITS: Dict[str, Tuple[float, int]] = {
+    "musicbrainz": (1.0, 1),
+    "discogs": (1.0, 5),
+    "spotify": (10.0, 10),
+}
+
+# Shared AsyncClient, one per event loop (the app loop, plus the sync bridge loop below).
+# Tests can swap the network out with configure(transport=httpx.MockTransport(...)) or
+# point a service at a local stub server through its UNCHAINED_*_URL variable.
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+_host_limits: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = weakref.WeakKeyDictionary()
+_client_options: Dict[str, Any] = {}
+
+
+def configure(**client_kwargs):
+    """Override AsyncClient options (e.g. transport=httpx.MockTransport(handler)) for new clients."""
+    _client_options.clear()
+    _client_options.update(client_kwargs)
+    _clients.clear()
+    _host_limits.clear()
+
+
+def get_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        options = {
+            "http2": HTTP2, "limits": LIMITS, "timeout": DEFAULT_TIMEOUT,
+            "follow_redirects": True, "headers": {"User-Agent": USER_AGENT},
+        }
+        options.update(_client_options)
+        client = httpx.AsyncClient(**options)
+        _clients[loop] = client
+    return client
+
+
+def _host_semaphore(url: str) -> asyncio.Semaphore:
+    host = urlsplit(url).hostname or ""
+    limits = _host_limits.setdefault(asyncio.get_running_loop(), {})
+    sem = limits.get(host)
+    if sem is None:
+        sem = limits[host] = asyncio.Semaphore(HOST_CONCURRENCY.get(host, HOST_CONCURRENCY_DEFAULT))
+    return sem
+
+
+class TokenBucket:
+    """Token bucket shared by every loop/thread. Callers over budget reserve a future
+    slot and sleep until it, so waiters are served in arrival order."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take one token; returns how long the caller must wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def refund(self):
+        """Give back a reserved token that will not be used."""
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + 1)
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                # A cancelled waiter must not keep its slot and delay everyone behind it
+                self.refund()
+                raise
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def rate_limiter(source: str) -> Optional[TokenBucket]:
+    limit = SOURCE_RATE_LIMITS.get(source)
+    if limit is None:
+        return None
+    with _buckets_lock:
+        bucket = _buckets.get(source)
+        if bucket is None:
+            bucket = _buckets[source] = TokenBucket(*limit)
+        return bucket
+
+
+def set_rate_limit(source: str, rate: float, burst: int = 1):
+    with _buckets_lock:
+        SOURCE_RATE_LIMITS[source] = (rate, burst)
+        _buckets.pop(source, None)
+
+
+def _retry_after(resp: httpx.Response) -> Optional[float]:
+    value = resp.headers.get("Retry-After")
+    if value and value.isdigit():
+        return float(value)
+    return None
+
+
+async def request(method: str, url: str, retries: int = MAX_RETRIES, source: Optional[str] = None, **kwargs) -> httpx.Response:
+    """Send a request on the shared client with per-host concurrency limits and retry/backoff.
+
+    Connection errors, timeouts and 429/5xx responses are retried with jittered
+    exponential backoff (Retry-After is honoured). With source set, every attempt
+    first waits for that source's rate limiter. The last response is returned
+    as-is; callers decide whether to raise_for_status().
+    """
+    client = get_client()
+    limiter = rate_limiter(source) if source else None
+    attempt = 0
+    while True:
+        if limiter is not None:
+            await limiter.acquire()
+        async with _host_semaphore(url):
+            try:
+                resp = await client.request(method, url, **kwargs)
+            except httpx.TransportError:
+                if attempt >= retries:
+                    raise
+                resp = None
+        if resp is not None and (resp.status_code not in RETRY_STATUSES or attempt >= retries):
+            return resp
+        delay = BACKOFF_SECONDS * (2 ** attempt) * (0.5 + random.random())
+        if resp is not None:
+            delay = max(delay, _retry_after(resp) or 0.0)
+            await resp.aclose()
+        attempt += 1
+        await asyncio.sleep(delay)
+
+
+async def get_json(url: str, **kwargs) -> Any:
+    resp = await request("GET", url, **kwargs)
+    resp.raise_for_status()
+    return resp.json()
+
+
+_inflight: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Future]]" = weakref.WeakKeyDictionary()
+
+
+async def single_flight(key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+    """Run factory() once per key at a time; concurrent callers with the same key share its result.
+    If the leading caller is cancelled, a waiting caller takes over and runs factory() itself."""
+    loop = asyncio.get_running_loop()
+    inflight = _inflight.setdefault(loop, {})
+    while True:
+        fut = inflight.get(key)
+        if fut is None:
+            break
+        try:
+            return await asyncio.shield(fut)
+        except asyncio.CancelledError:
+            task = asyncio.current_task()
+            if not fut.cancelled() or (task is not None and getattr(task, "cancelling", lambda: 0)()):
+                raise  # this caller itself was cancelled
+    fut = inflight[key] = loop.create_future()
+    try:
+        result = await factory()
+    except asyncio.CancelledError:
+        fut.cancel()
+        raise
+    except BaseException as e:
+        fut.set_exception(e)
+        fut.exception()  # retrieved here so a leader-only failure does not log "never retrieved"
+        raise
+    else:
+        fut.set_result(result)
+        return result
+    finally:
+        inflight.pop(key, None)
+
+
+async def close_client():
+    """Close the current loop's client (app shutdown)."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+# Sync callers (threadpool endpoints, background jobs, CLIs) share one long-lived
+# loop so they also get pooled keep-alive connections instead of a loop per call.
+_bridge_loop: Optional[asyncio.AbstractEventLoop] = None
+_bridge_lock = threading.Lock()
+
+
+def bridge_loop() -> asyncio.AbstractEventLoop:
+    global _bridge_loop
+    with _bridge_lock:
+        if _bridge_loop is None:
+            _bridge_loop = asyncio.new_event_loop()
+            threading.Thread(target=_bridge_loop.run_forever, name="http-bridge", daemon=True).start()
+        return _bridge_loop
+
+
+def run_sync(coro):
+    """Run an HTTP coroutine from synchronous code. Must not be called on an event loop thread."""
+    return asyncio.run_coroutine_threadsafe(coro, bridge_loop()).result()
@@ -1,15 +1,21 @@
 from pathlib import Path
-import time
-from ..services.download_service import run_download_worker
+import argparse
+import asyncio
+from ..services.download_service import run_download_pool, DOWNLOAD_CONCURRENCY, POLL_INTERVAL
+from ..utils.db_utils import init_db
 
 DB_PATH = Path('library/db/library.sqlite').resolve()
 
 
-def run_forever(interval_seconds: int = 2):
-    while True:
-        did = run_download_worker(DB_PATH)
-        if not did:
-            time.sleep(interval_seconds)
+def run_forever(concurrency: int = DOWNLOAD_CONCURRENCY, interval_seconds: float = POLL_INTERVAL):
+    # Claims are atomic, so several of these processes (and the API's own pool) can share the queue
+    init_db(DB_PATH)
+    asyncio.run(run_download_pool(DB_PATH, concurrency, interval_seconds))
 
 if __name__ == '__main__':
-    run_forever()
+    # python -m backend.app.workers.background_tasks [--concurrency 4]
+    parser = argparse.ArgumentParser(description="Download worker pool for queued download_jobs")
+    parser.add_argument("--concurrency", type=int, default=DOWNLOAD_CONCURRENCY)
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL, help="idle poll interval (seconds)")
+    args = parser.parse_args()
+    run_forever(args.concurrency, args.interval)
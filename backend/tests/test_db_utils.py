@@ -0,0 +1,59 @@
+from pathlib import Path
+
+import pytest
+
+from backend.app.utils.db_utils import close_all_connections, get_db
+
+
+@pytest.fixture
+def db_path(tmp_path: Path) -> Path:
+    path = tmp_path / "pool.sqlite"
+    db = get_db(path)
+    db.execute("CREATE TABLE t (v INTEGER)")
+    db.commit()
+    del db
+    yield path
+    close_all_connections()
+
+
+def values(path: Path):
+    return [r[0] for r in get_db(path).execute("SELECT v FROM t ORDER BY v").fetchall()]
+
+
+def test_nested_commit_joins_outer_transaction(db_path):
+    outer = get_db(db_path)
+    outer.execute("INSERT INTO t VALUES (1)")
+    inner = get_db(db_path)
+    inner.execute("INSERT INTO t VALUES (2)")
+    inner.commit()
+    outer.rollback()
+    assert values(db_path) == []
+
+
+@pytest.mark.parametrize("end", ["rollback", "close"])
+def test_nested_end_after_outer_commit(db_path, end):
+    outer = get_db(db_path)
+    outer.execute("INSERT INTO t VALUES (1)")
+    inner = get_db(db_path)
+    outer.commit()
+    outer.execute("INSERT INTO t VALUES (2)")
+    # The savepoint ended with the outer commit; this must not raise "no such savepoint"
+    getattr(inner, end)()
+    assert values(db_path) == [1]
+
+
+def test_dropped_handle_writes_are_discarded(db_path):
+    db = get_db(db_path)
+    db.execute("INSERT INTO t VALUES (1)")
+    del db
+    assert values(db_path) == []
+
+
+def test_dropped_nested_handle_writes_are_discarded(db_path):
+    outer = get_db(db_path)
+    outer.execute("INSERT INTO t VALUES (1)")
+    inner = get_db(db_path)
+    inner.execute("INSERT INTO t VALUES (2)")
+    del inner
+    outer.commit()
+    assert values(db_path) == [1]
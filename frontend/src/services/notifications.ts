@@ -8,6 +8,8 @@ export function startNotifications(baseUrl: string) {
       es.onmessage = (evt) => {
         try {
           const payload = JSON.parse(evt.data);
+          // Progress ticks are for in-app UI, not desktop notifications
+          if (payload.type === 'import_progress') return;
           let title = 'UNCHAINED';
           let body = payload.message || '';
           if (payload.type === 'upload_complete') {
@@ -0,0 +1,101 @@
+"""
+/analytics/similarity latency and recall@k of the ANN index against the exact scan,
+on a synthetic library of clustered embeddings.
+
+The timed cases run queries back to back, so the embedding store's periodic change
+check never comes due. The "after idle" line pauses longer than SYNC_INTERVAL_SECONDS
+before each query, which is how the "next track" panel actually calls it.
+
+Usage: python scripts/benchmarks/bench_ann_recall.py [--tracks 200000] [--dim 32] [--queries 200] [--top-n 10]
+                                                     [--idle-queries 5] [--backend hnsw|faiss|ivf]
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+
+from backend.app.utils.db_utils import get_db, migrate  # noqa: E402
+from backend.app.services.analytics_service import AnalyticsService  # noqa: E402
+from backend.app.services.ann_index_service import AnnIndex  # noqa: E402
+from backend.app.services.embedding_store import SYNC_INTERVAL_SECONDS, encode_vector  # noqa: E402
+
+
+def populate(db_path: Path, n_tracks: int, dim: int):
+    migrate(db_path)
+    db = get_db(db_path)
+    rng = np.random.default_rng(7)
+    # Gaussian blobs stand in for genre/mood structure; uniform noise would make every index look bad
+    centers = rng.standard_normal((max(1, n_tracks // 500), dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), n_tracks)] + 0.35 * rng.standard_normal((n_tracks, dim)).astype(np.float32)
+    genres = ["house", "techno", "disco", "ambient", "dnb"]
+    db.executemany(
+        "INSERT INTO tracks (id, title, genre) VALUES (?, ?, ?)",
+        ((i + 1, f"Title {i}", genres[i % len(genres)]) for i in range(n_tracks))
+    )
+    db.executemany(
+        "INSERT INTO analysis_results (track_id, bpm, key) VALUES (?, ?, '8A')",
+        ((i + 1, float(90 + i % 70)) for i in range(n_tracks))
+    )
+    db.executemany(
+        "INSERT INTO track_embeddings (track_id, embedding_blob, model_version, dimensionality) VALUES (?, ?, 'v1', ?)",
+        ((i + 1, encode_vector(vectors[i]), dim) for i in range(n_tracks))
+    )
+    db.commit()
+
+
+def run(service: AnalyticsService, queries, top_n: int, idle: float = 0.0, **kwargs):
+    results, times = [], []
+    for track_id in queries:
+        if idle:
+            time.sleep(idle)
+        t0 = time.perf_counter()
+        similar = service.compute_similarity(track_id, top_n, **kwargs)
+        times.append((time.perf_counter() - t0) * 1000)
+        results.append([s["track_id"] for s in similar])
+    return results, np.array(times)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tracks", type=int, default=200000)
+    ap.add_argument("--dim", type=int, default=32)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--top-n", type=int, default=10)
+    ap.add_argument("--idle-queries", type=int, default=5, help="queries timed after an idle gap (0 to skip)")
+    ap.add_argument("--backend", default=None)
+    args = ap.parse_args()
+
+    db_path = Path(tempfile.mkdtemp()) / "bench.sqlite"
+    print(f"Populating {args.tracks} x {args.dim} embeddings in {db_path} ...")
+    populate(db_path, args.tracks, args.dim)
+    service = AnalyticsService(db_path)
+    index = service._indexes["v1"] = AnnIndex(service.embedding_matrix("v1"), args.backend)
+    built = index.build()
+    print(f"Built {built['backend']} index over {built['indexed']} rows in {built['elapsed_s']}s")
+
+    rnd = random.Random(11)
+    queries = [rnd.randint(1, args.tracks) for _ in range(args.queries)]
+    filters = {"bpm_min": 118, "bpm_max": 130, "genre": "house"}
+    print(f"{'case':34} {'p50 (ms)':>9} {'p99 (ms)':>9} {'recall@' + str(args.top_n):>10}")
+    for label, kwargs in (("unfiltered", {}), ("bpm 118-130, genre=house", filters)):
+        exact, exact_ms = run(service, queries, args.top_n, exact=True, **kwargs)
+        approx, approx_ms = run(service, queries, args.top_n, **kwargs)
+        recall = np.mean([len(set(a) & set(e)) / max(1, len(e)) for a, e in zip(approx, exact)])
+        print(f"{'exact, ' + label:34} {np.percentile(exact_ms, 50):9.2f} {np.percentile(exact_ms, 99):9.2f} {1.0:10.3f}")
+        print(f"{index.backend_name + ', ' + label:34} {np.percentile(approx_ms, 50):9.2f} {np.percentile(approx_ms, 99):9.2f} {recall:10.3f}")
+    if args.idle_queries:
+        idle = SYNC_INTERVAL_SECONDS + 0.1
+        _, idle_ms = run(service, queries[:args.idle_queries], args.top_n, idle=idle)
+        print(f"{index.backend_name + f', after {idle:.1f}s idle':34} {np.percentile(idle_ms, 50):9.2f} {np.max(idle_ms):9.2f} {'':>10}"
+              "  (max, not p99; includes the store's change check)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Per-endpoint query latency on a synthetic library, with and without the
+secondary indexes from scripts/migrations/002_hot_indexes.sql.
+
+Usage: python scripts/benchmarks/bench_db_indexes.py [--tracks 100000] [--repeat 200]
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+
+from backend.app.utils.db_utils import get_db, migrate  # noqa: E402
+
+# (endpoint, query) pairs mirroring the service-layer SQL; '?' is a random track/deck key
+QUERIES = [
+    ("GET /dj/tracks/{id}/cues", "SELECT id, label, position_ms, color, hot_index FROM cue_points WHERE track_id=? ORDER BY position_ms"),
+    ("GET /dj/tracks/{id}/loops", "SELECT id, start_ms, end_ms, length_beats, quantized, active FROM loops WHERE track_id=? ORDER BY start_ms"),
+    ("GET /dj/tracks/{id}/analysis", "SELECT id, bpm, key, waveform_path, beatgrid_json, energy, analyzer, analyzed_at FROM analysis_results WHERE track_id=?"),
+    ("GET /sources/tracks/{id}/samples", "SELECT id, start_ms, end_ms, path_audio, pad_index, created_at FROM samples WHERE track_id=? ORDER BY pad_index ASC"),
+    ("GET /sources/tracks/{id}/artworks", "SELECT id, path_cover, source, is_primary, created_at FROM track_artworks WHERE track_id=? ORDER BY created_at DESC"),
+    ("GET /sources/tracks/{id}/relations", "SELECT id, related_track_id, relation_type, created_at FROM track_relations WHERE track_id=? ORDER BY created_at DESC"),
+    ("GET /sources/metadata/attribution/{id}", "SELECT field_name, value, source, candidate_id, confidence, applied_at, reverted FROM metadata_attribution WHERE track_id=? ORDER BY applied_at DESC"),
+    ("GET /dj/decks/{deck}/effects", "SELECT id, slot, effect_id FROM effect_chains WHERE deck_id=? ORDER BY slot"),
+    ("GET /analytics/clusters?algorithm=", "SELECT track_id, cluster_id FROM track_clusters WHERE algorithm=? ORDER BY cluster_id LIMIT 50"),
+    ("download worker claim", "SELECT id, url, dest_path FROM download_jobs WHERE status=? ORDER BY created_at LIMIT 1"),
+]
+
+
+def populate(db_path: Path, n_tracks: int):
+    migrate(db_path)
+    db = get_db(db_path)
+    rnd = random.Random(7)
+    ids = range(1, n_tracks + 1)
+    db.executemany(
+        "INSERT INTO tracks (id, title, artist, album, import_date) VALUES (?, ?, ?, ?, datetime('now'))",
+        ((i, f"Title {i}", f"Artist {i % 5000}", f"Album {i % 20000}") for i in ids)
+    )
+    db.executemany(
+        "INSERT INTO cue_points (track_id, label, position_ms, hot_index) VALUES (?, 'cue', ?, ?)",
+        ((i, rnd.randint(0, 300000), h) for i in ids for h in range(4))
+    )
+    db.executemany(
+        "INSERT INTO loops (track_id, start_ms, end_ms) VALUES (?, ?, ?)",
+        ((i, s, s + 4000) for i in ids for s in (1000, 60000))
+    )
+    db.executemany("INSERT INTO analysis_results (track_id, bpm, key) VALUES (?, ?, '8A')", ((i, 120.0) for i in ids))
+    db.executemany("INSERT INTO samples (track_id, start_ms, end_ms, pad_index) VALUES (?, 0, 500, ?)", ((i, p) for i in ids for p in range(2)))
+    db.executemany("INSERT INTO track_artworks (track_id, path_cover, source) VALUES (?, '', 'bench')", ((i,) for i in ids))
+    db.executemany("INSERT INTO track_relations (track_id, related_track_id, relation_type) VALUES (?, ?, 'remix')", ((i, i + 1) for i in ids))
+    db.executemany(
+        "INSERT INTO metadata_attribution (track_id, field_name, value, source) VALUES (?, ?, 'x', 'bench')",
+        ((i, f) for i in ids for f in ("title", "artist", "album"))
+    )
+    db.executemany("INSERT INTO effect_chains (deck_id, slot, effect_id) VALUES (?, ?, 1)", ((f"deck{d}", s) for d in range(2000) for s in range(4)))
+    db.executemany(
+        "INSERT INTO track_clusters (track_id, cluster_id, algorithm) VALUES (?, ?, ?)",
+        ((i, i % 8, algo) for i in ids for algo in ("kmeans", "dbscan"))
+    )
+    db.executemany(
+        "INSERT INTO download_jobs (url, status, created_at) VALUES ('http://x', ?, datetime('now', ?))",
+        (("done", f"-{i} seconds") for i in ids)
+    )
+    db.commit()
+
+
+def param_for(query: str, n_tracks: int, rnd: random.Random):
+    if "deck_id" in query:
+        return f"deck{rnd.randrange(2000)}"
+    if "algorithm" in query:
+        return "kmeans"
+    if "status" in query:
+        return "queued"
+    return rnd.randint(1, n_tracks)
+
+
+def measure(db_path: Path, n_tracks: int, repeat: int):
+    db = get_db(db_path)
+    rnd = random.Random(11)
+    out = {}
+    for name, query in QUERIES:
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            db.execute(query, (param_for(query, n_tracks, rnd),)).fetchall()
+        out[name] = (time.perf_counter() - t0) / repeat * 1000
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tracks", type=int, default=100000)
+    ap.add_argument("--repeat", type=int, default=200)
+    args = ap.parse_args()
+
+    db_path = Path(tempfile.mkdtemp()) / "bench.sqlite"
+    print(f"Populating {args.tracks} tracks in {db_path} ...")
+    populate(db_path, args.tracks)
+    db = get_db(db_path)
+
+    indexes = db.execute("SELECT name, sql FROM sqlite_master WHERE type='index' AND name LIKE 'idx_%' AND sql IS NOT NULL").fetchall()
+    for name, _ in indexes:
+        db.execute(f"DROP INDEX {name}")
+    db.commit()
+    db.execute("ANALYZE")
+    before = measure(db_path, args.tracks, max(1, args.repeat // 20))
+
+    for _, sql in indexes:
+        db.execute(sql)
+    db.commit()
+    db.execute("ANALYZE")
+    after = measure(db_path, args.tracks, args.repeat)
+
+    print(f"{'endpoint':42} {'no index (ms)':>14} {'indexed (ms)':>13} {'speedup':>9}")
+    for name, _ in QUERIES:
+        print(f"{name:42} {before[name]:14.3f} {after[name]:13.3f} {before[name] / max(after[name], 1e-9):8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,2 @@
--- Migration: Add fx_presets table
-CREATE TABLE IF NOT EXISTS fx_presets (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    name TEXT,
-    params_json TEXT,
-    created_at TEXT
-);
+-- Migration: Legacy fx_presets column used by the simple /dj/fx-presets endpoints
+ALTER TABLE fx_presets ADD COLUMN params_json TEXT;
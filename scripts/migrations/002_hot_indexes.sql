@@ -0,0 +1,17 @@
+-- Migration: Secondary indexes for per-track and per-deck lookups
+
+-- Keep only the newest analysis row per track before enforcing uniqueness
+DELETE FROM analysis_results
+WHERE id NOT IN (SELECT MAX(id) FROM analysis_results GROUP BY track_id);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_analysis_results_track ON analysis_results(track_id);
+
+CREATE INDEX IF NOT EXISTS idx_cue_points_track ON cue_points(track_id, position_ms);
+CREATE INDEX IF NOT EXISTS idx_loops_track ON loops(track_id, start_ms);
+CREATE INDEX IF NOT EXISTS idx_samples_track ON samples(track_id, pad_index);
+CREATE INDEX IF NOT EXISTS idx_track_artworks_track ON track_artworks(track_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_track_relations_track ON track_relations(track_id, related_track_id, relation_type);
+CREATE INDEX IF NOT EXISTS idx_metadata_attribution_track ON metadata_attribution(track_id, field_name, applied_at);
+CREATE INDEX IF NOT EXISTS idx_metadata_candidates_ref ON metadata_candidates(temp_track_ref, score);
+CREATE INDEX IF NOT EXISTS idx_effect_chains_deck ON effect_chains(deck_id, slot);
+CREATE INDEX IF NOT EXISTS idx_track_clusters_algorithm ON track_clusters(algorithm, cluster_id);
+CREATE INDEX IF NOT EXISTS idx_download_jobs_status ON download_jobs(status, created_at);
@@ -0,0 +1,23 @@
+-- Migration: Sort-key indexes for keyset pagination and a cached track counter
+
+CREATE INDEX IF NOT EXISTS idx_tracks_import_date ON tracks(COALESCE(import_date, ''), id);
+CREATE INDEX IF NOT EXISTS idx_tracks_title ON tracks(COALESCE(title, ''), id);
+CREATE INDEX IF NOT EXISTS idx_tracks_artist ON tracks(COALESCE(artist, ''), id);
+CREATE INDEX IF NOT EXISTS idx_tracks_album ON tracks(COALESCE(album, ''), id);
+CREATE INDEX IF NOT EXISTS idx_tracks_year ON tracks(COALESCE(year, 0), id);
+CREATE INDEX IF NOT EXISTS idx_tracks_duration ON tracks(COALESCE(duration_ms, 0), id);
+
+-- Named counters maintained by triggers (avoids COUNT(*) scans)
+CREATE TABLE IF NOT EXISTS library_counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR REPLACE INTO library_counters (name, value) SELECT 'tracks', COUNT(*) FROM tracks;
+
+CREATE TRIGGER IF NOT EXISTS tracks_count_ai AFTER INSERT ON tracks BEGIN
+    UPDATE library_counters SET value = value + 1 WHERE name = 'tracks';
+END;
+
+CREATE TRIGGER IF NOT EXISTS tracks_count_ad AFTER DELETE ON tracks BEGIN
+    UPDATE library_counters SET value = value - 1 WHERE name = 'tracks';
+END;
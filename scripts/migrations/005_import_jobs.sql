@@ -0,0 +1,16 @@
+-- Migration: Background import jobs (upload streamed to disk, metadata extracted later)
+CREATE TABLE IF NOT EXISTS import_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path_audio TEXT,
+    original_name TEXT,
+    content_hash TEXT,
+    size_bytes INTEGER,
+    status TEXT, -- queued | running | done | error
+    progress REAL DEFAULT 0,
+    track_id INTEGER,
+    error TEXT,
+    created_at TEXT,
+    started_at TEXT,
+    finished_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_import_jobs_status ON import_jobs(status, created_at);
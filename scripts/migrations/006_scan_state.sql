@@ -0,0 +1,13 @@
+-- Migration: Incremental local folder scan state (change/move/deletion detection)
+CREATE TABLE IF NOT EXISTS scan_state (
+    path TEXT PRIMARY KEY,
+    size_bytes INTEGER,
+    mtime_ns INTEGER,
+    partial_hash TEXT, -- head + tail + size
+    track_id INTEGER,
+    missing INTEGER DEFAULT 0,
+    scanned_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_scan_state_partial_hash ON scan_state(partial_hash);
+CREATE INDEX IF NOT EXISTS idx_scan_state_track ON scan_state(track_id);
+CREATE INDEX IF NOT EXISTS idx_tracks_path_audio ON tracks(path_audio);
@@ -0,0 +1,7 @@
+-- Migration: Content-addressed dedup index on tracks
+-- partial_hash = BLAKE2b(size + head + tail), content_hash = full BLAKE2b (filled on demand)
+ALTER TABLE tracks ADD COLUMN size_bytes INTEGER;
+ALTER TABLE tracks ADD COLUMN partial_hash TEXT;
+ALTER TABLE tracks ADD COLUMN content_hash TEXT;
+CREATE INDEX IF NOT EXISTS idx_tracks_partial_hash ON tracks(partial_hash, size_bytes);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_tracks_content_hash ON tracks(content_hash) WHERE content_hash IS NOT NULL;
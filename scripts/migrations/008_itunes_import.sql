@@ -0,0 +1,24 @@
+-- Migration: iTunes library stats and playlists
+ALTER TABLE tracks ADD COLUMN play_count INTEGER;
+ALTER TABLE tracks ADD COLUMN rating INTEGER; -- 0-100, iTunes scale (20 per star)
+ALTER TABLE tracks ADD COLUMN bpm REAL;
+ALTER TABLE tracks ADD COLUMN itunes_persistent_id TEXT;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_tracks_itunes_pid ON tracks(itunes_persistent_id) WHERE itunes_persistent_id IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS playlists (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT,
+    source TEXT,
+    external_id TEXT,
+    parent_external_id TEXT,
+    created_at TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_playlists_source_ext ON playlists(source, external_id);
+
+CREATE TABLE IF NOT EXISTS playlist_tracks (
+    playlist_id INTEGER,
+    position INTEGER,
+    track_id INTEGER,
+    PRIMARY KEY (playlist_id, position)
+);
+CREATE INDEX IF NOT EXISTS idx_playlist_tracks_track ON playlist_tracks(track_id);
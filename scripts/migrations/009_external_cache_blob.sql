@@ -0,0 +1,7 @@
+-- Migration: Compressed external_cache payloads with per-row expiry
+ALTER TABLE external_cache ADD COLUMN payload_blob BLOB;
+ALTER TABLE external_cache ADD COLUMN encoding TEXT; -- zstd | zlib (payload_blob); NULL = legacy JSON in payload
+ALTER TABLE external_cache ADD COLUMN expires_at INTEGER;
+CREATE INDEX IF NOT EXISTS idx_external_cache_expires ON external_cache(expires_at) WHERE expires_at IS NOT NULL;
+-- Legacy rows keep their created_at-based TTL; this index lets the sweeper find them without a table scan
+CREATE INDEX IF NOT EXISTS idx_external_cache_legacy ON external_cache(created_at) WHERE expires_at IS NULL;
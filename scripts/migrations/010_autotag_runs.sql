@@ -0,0 +1,20 @@
+-- Migration: Library-wide auto-tag runs (checkpointed by track id so they can resume)
+CREATE TABLE IF NOT EXISTS autotag_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    status TEXT, -- queued | running | done | cancelled | error
+    min_score REAL,
+    sources TEXT, -- JSON list, NULL = all registered sources
+    track_limit INTEGER,
+    last_track_id INTEGER DEFAULT 0,
+    processed INTEGER DEFAULT 0,
+    applied INTEGER DEFAULT 0,
+    skipped INTEGER DEFAULT 0,
+    failed INTEGER DEFAULT 0,
+    error TEXT,
+    created_at TEXT,
+    updated_at TEXT,
+    finished_at TEXT,
+    lease_owner TEXT, -- token of the process executing the run
+    lease_expires_at REAL -- epoch seconds; running rows past it can be resumed
+);
+CREATE INDEX IF NOT EXISTS idx_autotag_runs_status ON autotag_runs(status);
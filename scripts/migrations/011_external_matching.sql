@@ -0,0 +1,4 @@
+-- Migration: Indexes for matching external_tracks to the local library
+CREATE INDEX IF NOT EXISTS idx_tracks_isrc ON tracks(isrc) WHERE isrc IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_external_tracks_unmapped ON external_tracks(id) WHERE mapped_track_id IS NULL;
+CREATE INDEX IF NOT EXISTS idx_external_tracks_mapped ON external_tracks(mapped_track_id) WHERE mapped_track_id IS NOT NULL;
@@ -0,0 +1,7 @@
+-- Migration: Download worker pool bookkeeping (atomic claims with leases, retry backoff, progress)
+ALTER TABLE download_jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE download_jobs ADD COLUMN next_attempt_at REAL;   -- epoch seconds; queued rows wait until then
+ALTER TABLE download_jobs ADD COLUMN lease_expires_at REAL;  -- epoch seconds; running rows past it are reclaimable
+ALTER TABLE download_jobs ADD COLUMN lease_owner TEXT;       -- per-claim token; progress and completion updates must match it
+ALTER TABLE download_jobs ADD COLUMN bytes_done INTEGER;
+ALTER TABLE download_jobs ADD COLUMN bytes_total INTEGER;
@@ -0,0 +1,21 @@
+-- Migration: float32 embedding BLOBs (little-endian) replacing JSON text vectors
+-- Existing JSON rows are converted by the embedding store, once per process.
+ALTER TABLE track_embeddings ADD COLUMN embedding_blob BLOB;
+-- Per-model scans and the store's COUNT/MAX(id) over converted rows
+CREATE INDEX IF NOT EXISTS idx_track_embeddings_model ON track_embeddings(model_version, id) WHERE embedding_blob IS NOT NULL;
+
+-- Change counter for the embedding store: bumped on any write, so an unchanged table
+-- is detected with one primary-key lookup instead of a COUNT over the model's rows
+INSERT OR IGNORE INTO library_counters (name, value) VALUES ('track_embeddings', 0);
+
+CREATE TRIGGER IF NOT EXISTS track_embeddings_changes_ai AFTER INSERT ON track_embeddings BEGIN
+    UPDATE library_counters SET value = value + 1 WHERE name = 'track_embeddings';
+END;
+
+CREATE TRIGGER IF NOT EXISTS track_embeddings_changes_au AFTER UPDATE ON track_embeddings BEGIN
+    UPDATE library_counters SET value = value + 1 WHERE name = 'track_embeddings';
+END;
+
+CREATE TRIGGER IF NOT EXISTS track_embeddings_changes_ad AFTER DELETE ON track_embeddings BEGIN
+    UPDATE library_counters SET value = value + 1 WHERE name = 'track_embeddings';
+END;
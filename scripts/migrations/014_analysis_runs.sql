@@ -0,0 +1,31 @@
+-- Migration: Checkpointed acoustic analysis runs and per-file analysis errors
+CREATE TABLE IF NOT EXISTS analysis_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    status TEXT, -- queued | running | done | cancelled | error
+    model_version TEXT,
+    track_ids TEXT, -- JSON list, NULL = whole library
+    force_recompute INTEGER DEFAULT 0,
+    workers INTEGER,
+    last_track_id INTEGER DEFAULT 0,
+    processed INTEGER DEFAULT 0,
+    succeeded INTEGER DEFAULT 0,
+    failed INTEGER DEFAULT 0,
+    error TEXT,
+    created_at TEXT,
+    updated_at TEXT,
+    finished_at TEXT,
+    lease_owner TEXT, -- token of the process executing the run
+    lease_expires_at REAL -- epoch seconds; running rows past it can be resumed
+);
+CREATE INDEX IF NOT EXISTS idx_analysis_runs_status ON analysis_runs(status);
+
+CREATE TABLE IF NOT EXISTS analysis_errors (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id INTEGER,
+    track_id INTEGER,
+    path_audio TEXT,
+    error TEXT,
+    created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_analysis_errors_track ON analysis_errors(track_id);
+CREATE INDEX IF NOT EXISTS idx_analysis_errors_run ON analysis_errors(run_id);